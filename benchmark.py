@@ -0,0 +1,1090 @@
+"""
+Benchmarks for the hardware library and HDLGraph tooling.
+
+Run every benchmark with "make bench", or pick some by name:
+
+    python3 benchmark.py flatten
+
+Each benchmark registers its own synthetic modules in the hardware library, so the
+numbers do not depend on what is defined in /hardware_modules/non_basic_blocks.
+"""
+
+import contextlib
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import networkx as nx
+from jinja2 import FileSystemLoader, ModuleLoader
+
+# file_output_loader has to be imported before hdl_graph to resolve their circular import
+import file_output_loader
+import template_environment
+from config import config
+from verilog_parser import parse_verilog_modules
+from hardware_library import HardwareLibrary
+from hdl_graph import HDLGraph, IncrementalExpansion
+from module_index import ModuleIndex
+from library_context import default_context
+from module_definitions import load_module_definitions
+
+hardware_library = HardwareLibrary()
+
+
+def define_bench_cell(module_name):
+    """
+    Defines a small two level non-basic module (an adder feeding a multiplier) used as the
+    repeated unit of the synthetic designs.
+    """
+    if hardware_library.verify_module_exists(module_name):
+        return
+    g = HDLGraph()
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+    g.add_hardware_node(module_name="multiplier", instance_name="multiplier_instance")
+    g.add_edge("adder_instance", "multiplier_instance", port_connections={"d": "ac"})
+    hardware_library.add_module(
+        module_name=module_name,
+        input_ports={"x": 8},
+        output_ports={"y": 8},
+        input_connections={"x": [("adder_instance", "a")]},
+        output_connections={"y": ("multiplier_instance", "product")},
+        internal_graph=g,
+    )
+
+
+def define_bench_chain(
+    module_name, cell_module_name, instance_count, last_module_name=None
+):
+    """
+    Defines a module made of instance_count chained instances of cell_module_name, the last
+    one being an instance of last_module_name if given.
+    """
+    if hardware_library.verify_module_exists(module_name):
+        return
+    g = HDLGraph()
+    for index in range(instance_count):
+        g.add_hardware_node(
+            module_name=(
+                last_module_name
+                if last_module_name and index == instance_count - 1
+                else cell_module_name
+            ),
+            instance_name="cell_" + str(index),
+        )
+        if index > 0:
+            g.add_edge(
+                "cell_" + str(index - 1),
+                "cell_" + str(index),
+                port_connections={"y": "x"},
+            )
+    hardware_library.add_module(
+        module_name=module_name,
+        input_ports={"x": 8},
+        output_ports={"y": 8},
+        input_connections={"x": [("cell_0", "x")]},
+        output_connections={"y": ("cell_" + str(instance_count - 1), "y")},
+        internal_graph=g,
+    )
+
+
+def redefine_bench_probe(module_name, multiplier_count):
+    """
+    Defines, or replaces, a module made of an adder feeding multiplier_count chained multipliers.
+    """
+    if hardware_library.verify_module_exists(module_name):
+        hardware_library.delete_module(module_name)
+    g = HDLGraph()
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+    previous_instance, previous_port = "adder_instance", "d"
+    for index in range(multiplier_count):
+        instance_name = "multiplier_instance_" + str(index)
+        g.add_hardware_node(module_name="multiplier", instance_name=instance_name)
+        g.add_edge(
+            previous_instance, instance_name, port_connections={previous_port: "ac"}
+        )
+        previous_instance, previous_port = instance_name, "product"
+    hardware_library.add_module(
+        module_name=module_name,
+        input_ports={"x": 8},
+        output_ports={"y": 8},
+        input_connections={"x": [("adder_instance", "a")]},
+        output_connections={"y": (previous_instance, previous_port)},
+        internal_graph=g,
+    )
+
+
+@contextlib.contextmanager
+def temporary_output_folder():
+    """
+    Runs the enclosed code in a temporary working directory with a cache folder of its own, so
+    that display_hardware_library writes its generated files and build manifest there and leaves
+    those of the repository untouched.
+    """
+    working_directory = os.getcwd()
+    cache_path = config["cache_path"]
+    with tempfile.TemporaryDirectory() as folder_path:
+        os.chdir(folder_path)
+        config["cache_path"] = os.path.join(folder_path, "generated_files", "cache")
+        try:
+            yield folder_path
+        finally:
+            config["cache_path"] = cache_path
+            os.chdir(working_directory)
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    """
+    Returns the best wall clock time in seconds of repeat calls to function.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_flatten():
+    """
+    Times HDLGraph.return_expanded_graph on chains of growing length, without the cache of
+    expanded modules. The time per instance should stay flat if flattening is linear in the
+    instance count.
+    """
+    print("flatten: HDLGraph.return_expanded_graph on a chain of bench_cell instances")
+    print(f"{'instances':>10} {'flat nodes':>11} {'seconds':>9} {'us/instance':>12}")
+    define_bench_cell("bench_cell")
+    for instance_count in (250, 500, 1000, 2000, 4000):
+        module_name = "bench_chain_" + str(instance_count)
+        define_bench_chain(module_name, "bench_cell", instance_count)
+
+        def expand_cold():
+            hardware_library.clear_expanded_graphs()
+            return HDLGraph.return_expanded_graph(top_module_name=module_name)
+
+        flat_graph = expand_cold()
+        seconds = timed(expand_cold)
+        print(
+            f"{instance_count:>10} {flat_graph.number_of_nodes():>11} {seconds:>9.4f}"
+            f" {1e6 * seconds / instance_count:>12.2f}"
+        )
+
+
+def bench_flatten_cached():
+    """
+    Times HDLGraph.return_expanded_graph on chains of tiles, each tile being a chain of 32
+    bench_cell instances, with the cache of expanded modules cleared (cold) or kept (warm).
+    """
+    print("flatten_cached: cold and warm expansion of chains of 32 bench_cell tiles")
+    print(f"{'tiles':>6} {'flat nodes':>11} {'cold s':>8} {'warm s':>8} {'speedup':>8}")
+    define_bench_cell("bench_cell")
+    define_bench_chain("bench_tile", "bench_cell", 32)
+    for tile_count in (25, 50, 100, 200):
+        module_name = "bench_tiles_" + str(tile_count)
+        define_bench_chain(module_name, "bench_tile", tile_count)
+
+        def expand_cold():
+            hardware_library.clear_expanded_graphs()
+            return HDLGraph.return_expanded_graph(top_module_name=module_name)
+
+        flat_graph = expand_cold()
+        cold_seconds = timed(expand_cold)
+        warm_seconds = timed(HDLGraph.return_expanded_graph, module_name)
+        print(
+            f"{tile_count:>6} {flat_graph.number_of_nodes():>11} {cold_seconds:>8.4f}"
+            f" {warm_seconds:>8.4f} {cold_seconds / warm_seconds:>7.1f}x"
+        )
+
+
+def bench_flatten_incremental():
+    """
+    Times re-expanding a deep hierarchy after the definition of a single module at its bottom
+    changes, from scratch with HDLGraph.return_expanded_graph and by patching the previous
+    expansion with IncrementalExpansion.refresh.
+
+    Every level of the hierarchy chains 3 tiles of 32 bench_cell instances with the level below
+    it, and the bottom level ends with an instance of a module that is redefined between runs.
+    """
+    print(
+        "flatten_incremental: re-expansion after redefining the bottom of a deep hierarchy"
+    )
+    print(
+        f"{'depth':>6} {'flat nodes':>11} {'full s':>8} {'refresh s':>10} {'speedup':>8}"
+    )
+    define_bench_cell("bench_cell")
+    define_bench_chain("bench_tile", "bench_cell", 32)
+    redefine_bench_probe("bench_probe", 1)
+    for depth in (2, 4, 8, 16):
+        for level in range(depth):
+            define_bench_chain(
+                "bench_spine_" + str(level),
+                "bench_tile",
+                4,
+                last_module_name=(
+                    "bench_spine_" + str(level - 1) if level > 0 else "bench_probe"
+                ),
+            )
+        module_name = "bench_spine_" + str(depth - 1)
+        incremental_expansion = IncrementalExpansion(module_name)
+        full_seconds = None
+        refresh_seconds = None
+        for multiplier_count in (2, 3, 4, 1):
+            redefine_bench_probe("bench_probe", multiplier_count)
+            start = time.perf_counter()
+            patched_graph = incremental_expansion.refresh()
+            elapsed = time.perf_counter() - start
+            refresh_seconds = (
+                elapsed if refresh_seconds is None else min(refresh_seconds, elapsed)
+            )
+
+            start = time.perf_counter()
+            flat_graph = HDLGraph.return_expanded_graph(top_module_name=module_name)
+            elapsed = time.perf_counter() - start
+            full_seconds = (
+                elapsed if full_seconds is None else min(full_seconds, elapsed)
+            )
+
+            if dict(patched_graph.nodes(data=True)) != dict(
+                flat_graph.nodes(data=True)
+            ) or {
+                (source, destination): data
+                for source, destination, data in patched_graph.edges(data=True)
+            } != {
+                (source, destination): data
+                for source, destination, data in flat_graph.edges(data=True)
+            }:
+                raise AssertionError(
+                    "IncrementalExpansion.refresh does not match a full expansion"
+                )
+        print(
+            f"{depth:>6} {flat_graph.number_of_nodes():>11} {full_seconds:>8.4f}"
+            f" {refresh_seconds:>10.5f} {full_seconds / refresh_seconds:>7.1f}x"
+        )
+        for level in range(depth):
+            hardware_library.delete_module("bench_spine_" + str(level))
+
+
+def bench_construction():
+    """
+    Times building a graph with HDLGraph.add_input_output in which port_count adders each drive
+    their own port of a single output block, the high fan-in case of the check against driving an
+    input port twice. The time per port should stay flat if construction is linear in the port count.
+    """
+    print("construction: HDLGraph built around one output block with port_count ports")
+    print(f"{'ports':>6} {'seconds':>9} {'us/port':>8}")
+    for port_count in (250, 500, 1000, 2000, 4000):
+
+        def build():
+            g = HDLGraph()
+            for index in range(port_count):
+                g.add_hardware_node(
+                    module_name="adder", instance_name="adder_" + str(index)
+                )
+            g.add_input_output(
+                input_ports={"x": 8},
+                output_ports={"y_" + str(index): 8 for index in range(port_count)},
+                input_connections={
+                    "x": [("adder_" + str(index), "a") for index in range(port_count)]
+                },
+                output_connections={
+                    "y_" + str(index): ("adder_" + str(index), "d")
+                    for index in range(port_count)
+                },
+            )
+            return g
+
+        seconds = timed(build)
+        print(f"{port_count:>6} {seconds:>9.4f} {1e6 * seconds / port_count:>8.2f}")
+
+
+def bench_bulk_construction():
+    """
+    Times building a chain of multipliers, each driving the next one on 3 ports, one call at a time
+    with add_hardware_node/add_edge and in one batch with add_hardware_nodes_from/add_connections_from.
+    """
+    print(
+        "bulk_construction: incremental and batched construction of a multiplier chain"
+    )
+    print(f"{'connections':>12} {'incremental s':>14} {'batched s':>10} {'speedup':>8}")
+    for instance_count in (1000, 4000, 16000):
+        nodes = [
+            ("multiplier_" + str(index), "multiplier")
+            for index in range(instance_count)
+        ]
+        connections = [
+            (
+                "multiplier_" + str(index - 1),
+                "multiplier_" + str(index),
+                {"run": "a", "product": "b", "test": "ac"},
+            )
+            for index in range(1, instance_count)
+        ]
+
+        def build_incremental():
+            g = HDLGraph()
+            for instance_name, module_name in nodes:
+                g.add_hardware_node(
+                    instance_name=instance_name, module_name=module_name
+                )
+            for source, destination, port_connections in connections:
+                g.add_edge(source, destination, port_connections=port_connections)
+            return g
+
+        def build_batched():
+            g = HDLGraph()
+            g.add_hardware_nodes_from(nodes)
+            g.add_connections_from(connections)
+            return g
+
+        if nx.utils.graphs_equal(build_incremental(), build_batched()) is False:
+            raise AssertionError("Batched construction does not match add_edge")
+        incremental_seconds = timed(build_incremental)
+        batched_seconds = timed(build_batched)
+        print(
+            f"{3 * len(connections):>12} {incremental_seconds:>14.4f}"
+            f" {batched_seconds:>10.4f} {incremental_seconds / batched_seconds:>7.1f}x"
+        )
+
+
+def allocated(function, *args, **kwargs):
+    """
+    Returns the result of function and the bytes it allocated that are still held by the result.
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = function(*args, **kwargs)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_compact_memory():
+    """
+    Measures the memory per connection of expanded chains of bench_cell instances held as an
+    HDLGraph and as a CompactNetlist, both built from the cached expansion of the module.
+    """
+    print("compact_memory: expanded graph memory per connection")
+    print(f"{'connections':>12} {'HDLGraph B':>11} {'Compact B':>10} {'ratio':>6}")
+    define_bench_cell("bench_cell")
+    for instance_count in (1000, 4000, 16000):
+        module_name = "bench_chain_" + str(instance_count)
+        define_bench_chain(module_name, "bench_cell", instance_count)
+        HDLGraph.return_expanded_graph(top_module_name=module_name)
+
+        flat_graph, graph_bytes = allocated(HDLGraph.return_expanded_graph, module_name)
+        compact_netlist, compact_bytes = allocated(
+            HDLGraph.return_expanded_graph, module_name, compact=True
+        )
+        connections = compact_netlist.number_of_connections()
+        print(
+            f"{connections:>12} {graph_bytes / connections:>11.1f}"
+            f" {compact_bytes / connections:>10.1f}"
+            f" {graph_bytes / compact_bytes:>5.1f}x"
+        )
+        del flat_graph, compact_netlist
+
+
+def bench_define_modules():
+    """
+    Times defining thousands of small non-basic modules, each an adder feeding a multiplier with
+    its input/output blocks, as the module scripts in /hardware_modules/non_basic_blocks do.
+    """
+    print("define_modules: hardware_library.add_module with an internal graph")
+    print(f"{'modules':>8} {'seconds':>9} {'us/module':>10}")
+    for module_count in (1000, 4000):
+        module_names = ["bench_defined_" + str(index) for index in range(module_count)]
+
+        def define_modules():
+            for module_name in module_names:
+                g = HDLGraph()
+                g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+                g.add_hardware_node(
+                    module_name="multiplier", instance_name="multiplier_instance"
+                )
+                g.add_edge(
+                    "adder_instance",
+                    "multiplier_instance",
+                    port_connections={"d": "ac"},
+                )
+                hardware_library.add_module(
+                    module_name=module_name,
+                    input_ports={"x": 8, "y": 8},
+                    output_ports={"z": 8},
+                    input_connections={
+                        "x": [("adder_instance", "a")],
+                        "y": [("adder_instance", "b"), ("multiplier_instance", "a")],
+                    },
+                    output_connections={"z": ("multiplier_instance", "product")},
+                    internal_graph=g,
+                )
+
+        def delete_modules():
+            for module_name in module_names:
+                hardware_library.delete_module(module_name)
+
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            define_modules()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            delete_modules()
+        print(f"{module_count:>8} {best:>9.4f} {1e6 * best / module_count:>10.2f}")
+
+
+def bench_library_lookups():
+    """
+    Counts and times the hardware_library.get_module_nx_graph lookups made by a full
+    file_output_loader.display_hardware_library run over top_module, its submodules and a chain of
+    64 bench_cell instances, against rebuilding the graph from node-link data on every lookup.
+    The run writes to a temporary folder, see temporary_output_folder.
+    """
+    print("library_lookups: get_module_nx_graph during display_hardware_library")
+    for module_name in list(hardware_library.get_hardware_library()):
+        if module_name.startswith("bench_"):
+            hardware_library.delete_module(module_name)
+    define_bench_cell("bench_cell")
+    define_bench_chain("bench_tile", "bench_cell", 64)
+    HDLGraph().add_hardware_node(instance_name="top", module_name="top_module")
+
+    lookups = []
+    get_module_nx_graph = hardware_library.get_module_nx_graph
+
+    def timed_lookup(module_name, *args, **kwargs):
+        start = time.perf_counter()
+        graph = get_module_nx_graph(module_name, *args, **kwargs)
+        lookups.append((module_name, time.perf_counter() - start))
+        return graph
+
+    hardware_library.get_module_nx_graph = timed_lookup
+    try:
+        with temporary_output_folder():
+            start = time.perf_counter()
+            file_output_loader.display_hardware_library(rebuild=True)
+            run_seconds = time.perf_counter() - start
+    finally:
+        del hardware_library.get_module_nx_graph
+
+    lookup_seconds = sum(seconds for _, seconds in lookups)
+    node_link_data = {
+        module_name: nx.node_link_data(get_module_nx_graph(module_name))
+        for module_name, _ in lookups
+    }
+    start = time.perf_counter()
+    for module_name, _ in lookups:
+        nx.node_link_graph(node_link_data[module_name])
+    rebuild_seconds = time.perf_counter() - start
+    print(f"{'lookups':>8} {'run s':>8} {'lookup s':>9} {'rebuild s':>10}")
+    print(
+        f"{len(lookups):>8} {run_seconds:>8.3f} {lookup_seconds:>9.5f}"
+        f" {rebuild_seconds:>10.5f}"
+    )
+
+
+def synthetic_basic_block(module_name, port_count):
+    """
+    Returns the SystemVerilog source of a basic block with port_count input and port_count output
+    ports, mixing packed widths, unsized ports and custom types.
+    """
+    lines = ["module " + module_name + " ("]
+    for index in range(port_count):
+        lines.append("  input logic [7:0] in_" + str(index) + ",")
+        lines.append("  input logic enable_" + str(index) + ",")
+    for index in range(port_count):
+        lines.append("  output intermediate out_" + str(index) + ",")
+    lines.append("  output logic [15:0] last")
+    lines.append(");")
+    for index in range(port_count):
+        lines.append("  assign out_" + str(index) + " = in_" + str(index) + ";")
+    lines.append("endmodule")
+    return "\n".join(lines)
+
+
+def bench_verilog_ports():
+    """
+    Times parsing the ports of synthetic basic blocks with thousands of ports. The time per port
+    should stay flat if parsing is linear in the port count.
+    """
+    print("verilog_ports: parse_verilog_modules on synthetic basic blocks")
+    print(f"{'ports':>6} {'seconds':>9} {'us/port':>8}")
+    for port_count in (500, 1000, 2000, 4000):
+        source = synthetic_basic_block("bench_block", port_count)
+        modules = parse_verilog_modules(source)
+        total_ports = len(modules[0][1]) + len(modules[0][2])
+        if total_ports != 3 * port_count + 1:
+            raise AssertionError("parse_verilog_modules missed some ports")
+        seconds = timed(parse_verilog_modules, source)
+        print(f"{total_ports:>6} {seconds:>9.4f} {1e6 * seconds / total_ports:>8.2f}")
+
+
+def bench_basic_block_startup():
+    """
+    Times loading folders of synthetic basic blocks (64 ports each) into the hardware library with
+    an empty cache (cold), an up to date cache (warm), and one file changed since the cache was
+    written.
+    """
+    print("basic_block_startup: HardwareLibrary._parse_basic_verilog_files")
+    print(f"{'files':>6} {'cold s':>8} {'warm s':>8} {'1 changed s':>12}")
+    for file_count in (250, 1000, 4000):
+        with tempfile.TemporaryDirectory() as folder_path:
+            module_names = ["bench_block_" + str(index) for index in range(file_count)]
+            for module_name in module_names:
+                with open(os.path.join(folder_path, module_name + ".sv"), "w") as file:
+                    file.write(synthetic_basic_block(module_name, 21))
+            cache_file = os.path.join(folder_path, "cache", "basic_blocks.json")
+
+            start = time.perf_counter()
+            hardware_library._parse_basic_verilog_files(folder_path, cache_file)
+            cold_seconds = time.perf_counter() - start
+            warm_seconds = timed(
+                hardware_library._parse_basic_verilog_files, folder_path, cache_file
+            )
+            with open(os.path.join(folder_path, module_names[0] + ".sv"), "a") as file:
+                file.write("\n")
+            start = time.perf_counter()
+            hardware_library._parse_basic_verilog_files(folder_path, cache_file)
+            changed_seconds = time.perf_counter() - start
+
+            for module_name in module_names:
+                hardware_library.delete_module(module_name)
+        print(
+            f"{file_count:>6} {cold_seconds:>8.3f} {warm_seconds:>8.3f}"
+            f" {changed_seconds:>12.3f}"
+        )
+
+
+def bench_library_snapshot():
+    """
+    Times restoring a hardware library of small non-basic modules with
+    HardwareLibrary.load_snapshot, against defining the modules again as the module scripts do and
+    against HardwareLibrary.from_json followed by a lookup of every module.
+    """
+    print("library_snapshot: HardwareLibrary.load_snapshot")
+    print(
+        f"{'modules':>8} {'define s':>9} {'from_json s':>12} {'save s':>8}"
+        f" {'load s':>8} {'MB':>6}"
+    )
+    for module_count in (500, 2000):
+        module_names = ["bench_saved_" + str(index) for index in range(module_count)]
+        start = time.perf_counter()
+        for module_name in module_names:
+            define_bench_cell(module_name)
+        define_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as folder_path:
+            snapshot_file = os.path.join(folder_path, "hardware_library.snapshot")
+            start = time.perf_counter()
+            hardware_library.save_snapshot(snapshot_file)
+            save_seconds = time.perf_counter() - start
+            hardware_library.to_json("bench_library")
+            try:
+
+                def load_json():
+                    library = HardwareLibrary.from_json(
+                        "generated_files/bench_library.json"
+                    )
+                    for module_name in module_names:
+                        library.get_module_nx_graph(module_name)
+
+                json_seconds = timed(load_json)
+            finally:
+                os.remove("generated_files/bench_library.json")
+            load_seconds = timed(hardware_library.load_snapshot, snapshot_file)
+            snapshot_bytes = os.path.getsize(snapshot_file)
+
+        for module_name in module_names:
+            hardware_library.delete_module(module_name)
+        print(
+            f"{module_count:>8} {define_seconds:>9.3f} {json_seconds:>12.3f}"
+            f" {save_seconds:>8.3f} {load_seconds:>8.3f} {snapshot_bytes / 1e6:>6.2f}"
+        )
+
+
+def bench_module_discovery():
+    """
+    Times indexing folders of synthetic module scripts with ModuleIndex, then loading one module
+    on first use and again after it was deleted from the library, against reading and running its
+    script as text every time.
+    """
+    print("module_discovery: ModuleIndex scan and load")
+    print(
+        f"{'scripts':>8} {'scan s':>8} {'first load ms':>14} {'reload ms':>10}"
+        f" {'exec text ms':>13}"
+    )
+    for script_count in (250, 1000, 4000):
+        with tempfile.TemporaryDirectory() as folder_path:
+            module_names = [
+                "bench_script_" + str(index) for index in range(script_count)
+            ]
+            for module_name in module_names:
+                # File names do not match module names, which the index resolves
+                with open(
+                    os.path.join(folder_path, "script_" + module_name[13:] + ".py"), "w"
+                ) as file:
+                    file.write(
+                        "g = HDLGraph()\n"
+                        'g.add_hardware_node(module_name="adder", instance_name="a")\n'
+                        'g.add_hardware_node(module_name="multiplier", instance_name="m")\n'
+                        'g.add_edge("a", "m", port_connections={"d": "ac"})\n'
+                        "hardware_library.add_module(\n"
+                        '    module_name="' + module_name + '",\n'
+                        '    input_ports={"x": 8},\n'
+                        '    output_ports={"y": 8},\n'
+                        '    input_connections={"x": [("a", "a")]},\n'
+                        '    output_connections={"y": ("m", "product")},\n'
+                        "    internal_graph=g,\n"
+                        ")\n"
+                    )
+            index = ModuleIndex(folder_path)
+            module_name = module_names[-1]
+            namespace = {"HDLGraph": HDLGraph, "hardware_library": hardware_library}
+
+            start = time.perf_counter()
+            index.rescan()
+            scan_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            index.load(module_name, namespace)
+            first_seconds = time.perf_counter() - start
+
+            def reload():
+                hardware_library.delete_module(module_name)
+                index.load(module_name, namespace)
+
+            def exec_text():
+                hardware_library.delete_module(module_name)
+                with open(index.source_file(module_name), "r") as file:
+                    exec(file.read(), namespace, {})
+
+            reload_seconds = timed(reload)
+            exec_seconds = timed(exec_text)
+            hardware_library.delete_module(module_name)
+        print(
+            f"{script_count:>8} {scan_seconds:>8.4f} {1e3 * first_seconds:>14.3f}"
+            f" {1e3 * reload_seconds:>10.3f} {1e3 * exec_seconds:>13.3f}"
+        )
+
+
+def bench_module_definitions():
+    """
+    Times adding folders of synthetic declarative module definitions with
+    module_definitions.load_module_definitions. Half of the modules instantiate two of the
+    others, so they are added in two topological batches.
+    """
+    print("module_definitions: load_module_definitions")
+    print(f"{'files':>6} {'seconds':>9} {'us/module':>10}")
+    for file_count in (250, 1000, 4000):
+        with tempfile.TemporaryDirectory() as folder_path:
+            module_names = [
+                "bench_declared_" + str(index) for index in range(file_count)
+            ]
+            for index, module_name in enumerate(module_names):
+                if index % 2:
+                    instances = {
+                        "left": module_names[index - 1],
+                        "right": module_names[index - 1],
+                    }
+                    edges = [
+                        {
+                            "source": "left",
+                            "destination": "right",
+                            "port_connections": {"y": "x"},
+                        }
+                    ]
+                    input_connections = {"x": [["left", "x"]]}
+                    output_connections = {"y": ["right", "y"]}
+                else:
+                    instances = {
+                        "adder_instance": "adder",
+                        "multiplier_instance": "multiplier",
+                    }
+                    edges = [
+                        {
+                            "source": "adder_instance",
+                            "destination": "multiplier_instance",
+                            "port_connections": {"d": "ac"},
+                        }
+                    ]
+                    input_connections = {"x": [["adder_instance", "a"]]}
+                    output_connections = {"y": ["multiplier_instance", "product"]}
+                with open(
+                    os.path.join(folder_path, module_name + ".module.json"), "w"
+                ) as file:
+                    json.dump(
+                        {
+                            "module_name": module_name,
+                            "input_ports": {"x": 8},
+                            "output_ports": {"y": 8},
+                            "instances": instances,
+                            "edges": edges,
+                            "input_connections": input_connections,
+                            "output_connections": output_connections,
+                        },
+                        file,
+                    )
+
+            start = time.perf_counter()
+            load_module_definitions(folder_path)
+            elapsed = time.perf_counter() - start
+            for module_name in module_names:
+                hardware_library.delete_module(module_name)
+        print(f"{file_count:>6} {elapsed:>9.3f} {1e6 * elapsed / file_count:>10.2f}")
+
+
+def bench_dependency_queries():
+    """
+    Times finding every module that instantiates multiplier, directly or not, with the
+    instantiation index of the hardware library, against walking the internal graph of every
+    module until no new dependent is found. The library holds cells, and chains of 8 cells.
+    """
+    print("dependency_queries: HardwareLibrary.get_dependent_modules(transitive=True)")
+    print(f"{'modules':>8} {'index ms':>9} {'graph walk ms':>14} {'dependents':>11}")
+    for chain_count in (100, 400, 1600):
+        module_names = []
+        for index in range(chain_count):
+            cell_module_name = "bench_dependency_cell_" + str(index)
+            chain_module_name = "bench_dependency_chain_" + str(index)
+            define_bench_cell(cell_module_name)
+            define_bench_chain(chain_module_name, cell_module_name, 8)
+            module_names.extend((cell_module_name, chain_module_name))
+
+        def walk_graphs():
+            dependents = set()
+            found = {"multiplier"}
+            while found:
+                dependents |= found
+                found = {
+                    module_name
+                    for module_name, module in hardware_library.get_hardware_library().items()
+                    if not module["basic_block"]
+                    and module_name not in dependents
+                    and any(
+                        submodule_name in dependents
+                        for _, submodule_name in hardware_library.get_module_nx_graph(
+                            module_name
+                        ).nodes(data="module_name")
+                    )
+                }
+            return dependents - {"multiplier"}
+
+        index_seconds = timed(
+            hardware_library.get_dependent_modules, "multiplier", transitive=True
+        )
+        walk_seconds = timed(walk_graphs)
+        dependent_count = len(
+            hardware_library.get_dependent_modules("multiplier", transitive=True)
+        )
+        assert dependent_count == len(walk_graphs())
+        for module_name in module_names:
+            hardware_library.delete_module(module_name)
+        print(
+            f"{2 * chain_count:>8} {1e3 * index_seconds:>9.3f}"
+            f" {1e3 * walk_seconds:>14.3f} {dependent_count:>11}"
+        )
+
+
+def bench_library_contexts():
+    """
+    Times cloning the library context holding module_count small non-basic modules, and the first
+    change to the clone that copies its module table, against deep copying the library.
+    """
+    print("library_contexts: LibraryContext.clone")
+    print(f"{'modules':>8} {'clone ms':>9} {'first change ms':>16} {'deepcopy ms':>12}")
+    context = default_context()
+    for module_count in (500, 2000, 8000):
+        module_names = ["bench_context_" + str(index) for index in range(module_count)]
+        for module_name in module_names:
+            define_bench_cell(module_name)
+
+        clone_seconds = timed(context.clone)
+        clones = [context.clone() for _ in range(3)]
+        start = time.perf_counter()
+        for clone in clones:
+            clone.hardware_library.delete_module(module_names[0])
+        change_seconds = (time.perf_counter() - start) / len(clones)
+        start = time.perf_counter()
+        copy.deepcopy(context.hardware_library.hardware_library)
+        deepcopy_seconds = time.perf_counter() - start
+
+        for module_name in module_names:
+            hardware_library.delete_module(module_name)
+        print(
+            f"{module_count:>8} {1e3 * clone_seconds:>9.3f}"
+            f" {1e3 * change_seconds:>16.3f} {1e3 * deepcopy_seconds:>12.1f}"
+        )
+
+
+def peak_allocated(function, *args, **kwargs):
+    """
+    Returns the peak number of bytes allocated while function runs, on top of what was allocated
+    before.
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1] - start
+    tracemalloc.stop()
+    return peak
+
+
+def bench_graph_streams():
+    """
+    Times dumping and loading expanded chains of bench_cell instances with HDLGraph.dump_stream
+    and HDLGraph.load_stream in each format, against HDLGraph.to_json and json.load of its dump,
+    with the peak memory allocated while dumping.
+    """
+    print("graph_streams: HDLGraph.dump_stream and load_stream")
+    print(
+        f"{'records':>8} {'format':>10} {'dump s':>8} {'load s':>8} {'MB':>7}"
+        f" {'dump peak MB':>13}"
+    )
+    define_bench_cell("bench_cell")
+    for instance_count in (4000, 16000, 64000):
+        module_name = "bench_chain_" + str(instance_count)
+        define_bench_chain(module_name, "bench_cell", instance_count)
+        flat_graph = HDLGraph.return_expanded_graph(module_name)
+        record_count = 1 + flat_graph.number_of_nodes() + flat_graph.number_of_edges()
+        with tempfile.TemporaryDirectory() as folder_path:
+            for format_name in ("to_json", ".jsonl", ".jsonl.gz", ".bin"):
+                if format_name == "to_json":
+                    file_path = os.path.join("generated_files", module_name + ".json")
+
+                    def dump():
+                        flat_graph.to_json(module_name)
+
+                    def load():
+                        with open(file_path) as infile:
+                            nx.node_link_graph(json.load(infile))
+
+                else:
+                    file_path = os.path.join(folder_path, "graph" + format_name)
+
+                    def dump():
+                        flat_graph.dump_stream(file_path)
+
+                    def load():
+                        HDLGraph.load_stream(file_path)
+
+                start = time.perf_counter()
+                dump()
+                dump_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                load()
+                load_seconds = time.perf_counter() - start
+                file_bytes = os.path.getsize(file_path)
+                dump_peak = peak_allocated(dump)
+                if format_name == "to_json":
+                    os.remove(file_path)
+                print(
+                    f"{record_count:>8} {format_name:>10} {dump_seconds:>8.3f}"
+                    f" {load_seconds:>8.3f} {file_bytes / 1e6:>7.2f}"
+                    f" {dump_peak / 1e6:>13.2f}"
+                )
+        del flat_graph
+
+
+def bench_template_environment():
+    """
+    Times generate_verilog over thousands of small non-basic modules with the shared template
+    environment, against creating an environment for every call as generate_verilog used to,
+    either parsing the template files or importing the precompiled templates.
+    """
+    print("template_environment: generate_verilog per module")
+    print(f"{'modules':>8} {'environment':>12} {'seconds':>8} {'us/module':>10}")
+    compiled_folders = template_environment.precompile_templates()
+    environment_factories = {
+        "per call": lambda environment_name: template_environment._new_environment(
+            environment_name, FileSystemLoader(config["path"])
+        ),
+        "precompiled": lambda environment_name: template_environment._new_environment(
+            environment_name, ModuleLoader(compiled_folders[environment_name])
+        ),
+        "shared": template_environment.get_environment,
+    }
+    for module_count in (500, 2000):
+        module_names = ["bench_template_" + str(index) for index in range(module_count)]
+        for module_name in module_names:
+            define_bench_cell(module_name)
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as folder_path:
+            os.makedirs(os.path.join(folder_path, "generated_files", "verilog"))
+            os.chdir(folder_path)
+            try:
+                for environment_name, factory in environment_factories.items():
+                    file_output_loader.get_environment = factory
+                    start = time.perf_counter()
+                    for module_name in module_names:
+                        file_output_loader.generate_verilog(module_name)
+                    seconds = time.perf_counter() - start
+                    print(
+                        f"{module_count:>8} {environment_name:>12} {seconds:>8.3f}"
+                        f" {1e6 * seconds / module_count:>10.1f}"
+                    )
+            finally:
+                file_output_loader.get_environment = (
+                    template_environment.get_environment
+                )
+                os.chdir(working_directory)
+        for module_name in module_names:
+            hardware_library.delete_module(module_name)
+
+
+def bench_verilog_rendering():
+    """
+    Times generate_verilog on expanded chains of bench_cell instances, from the expanded HDLGraph
+    and from the CompactNetlist of the chain.
+    """
+    print("verilog_rendering: generate_verilog of expanded chains")
+    print(
+        f"{'instances':>10} {'graph':>8} {'seconds':>8} {'instances/s':>12} {'MB':>6}"
+    )
+    define_bench_cell("bench_cell")
+    working_directory = os.getcwd()
+    for instance_count in (4000, 16000, 64000):
+        module_name = "bench_chain_" + str(instance_count)
+        define_bench_chain(module_name, "bench_cell", instance_count)
+        with tempfile.TemporaryDirectory() as folder_path:
+            os.makedirs(os.path.join(folder_path, "generated_files", "verilog"))
+            os.chdir(folder_path)
+            try:
+                for graph_name in ("HDLGraph", "compact"):
+                    flat_graph = HDLGraph.return_expanded_graph(
+                        module_name, compact=graph_name == "compact"
+                    )
+                    flat_instances = 2 * instance_count
+                    seconds = timed(
+                        file_output_loader.generate_verilog,
+                        module_name,
+                        flat_graph,
+                        repeat=2,
+                    )
+                    file_bytes = os.path.getsize(
+                        os.path.join("generated_files", "verilog", module_name + ".sv")
+                    )
+                    print(
+                        f"{flat_instances:>10} {graph_name:>8} {seconds:>8.3f}"
+                        f" {flat_instances / seconds:>12.0f} {file_bytes / 1e6:>6.2f}"
+                    )
+                    del flat_graph
+            finally:
+                os.chdir(working_directory)
+
+
+def bench_parallel_generation():
+    """
+    Times file_output_loader.display_hardware_library over 200 small modules and 16 chains of 50
+    to 450 bench_cell instances, serially and with pools of worker processes. The runs write to a
+    temporary folder, see temporary_output_folder.
+    """
+    print("parallel_generation: display_hardware_library")
+    print(f"{'workers':>8} {'modules':>8} {'seconds':>8} {'largest s':>10}")
+    define_bench_cell("bench_cell")
+    module_names = ["bench_generation_" + str(index) for index in range(200)]
+    for module_name in module_names:
+        define_bench_cell(module_name)
+    for index in range(16):
+        module_name = "bench_generation_chain_" + str(index)
+        define_bench_chain(module_name, "bench_cell", 50 + 400 * index // 15)
+        module_names.append(module_name)
+    with temporary_output_folder():
+        for workers in (1, 2, 4):
+            start = time.perf_counter()
+            timings = file_output_loader.display_hardware_library(
+                workers=workers, rebuild=True
+            )
+            seconds = time.perf_counter() - start
+            print(
+                f"{workers:>8} {len(timings):>8} {seconds:>8.3f}"
+                f" {max(timings.values()):>10.3f}"
+            )
+    for module_name in module_names:
+        hardware_library.delete_module(module_name)
+    print(f"({os.cpu_count()} CPUs)")
+
+
+def bench_incremental_generation():
+    """
+    Times file_output_loader.display_hardware_library over module_count small modules: a full
+    build, a build with nothing to do (with the module hashes cached, and computed again as in a
+    new process), and a build after one module changed. The runs write to a temporary folder, see
+    temporary_output_folder.
+    """
+    print("incremental_generation: display_hardware_library with a build manifest")
+    print(
+        f"{'modules':>8} {'full s':>8} {'no-op s':>8} {'no-op cold s':>13}"
+        f" {'1 changed s':>12}"
+    )
+    define_bench_cell("bench_cell")
+    for module_count in (250, 1000):
+        module_names = [
+            "bench_increment_" + str(index) for index in range(module_count)
+        ]
+        for module_name in module_names:
+            define_bench_cell(module_name)
+
+        with temporary_output_folder():
+            start = time.perf_counter()
+            file_output_loader.display_hardware_library(rebuild=True)
+            full_seconds = time.perf_counter() - start
+            noop_seconds = timed(file_output_loader.display_hardware_library)
+            hardware_library._module_hashes.clear()
+            start = time.perf_counter()
+            file_output_loader.display_hardware_library()
+            cold_seconds = time.perf_counter() - start
+            hardware_library.delete_module(module_names[0])
+            define_bench_chain(module_names[0], "bench_cell", 2)
+            start = time.perf_counter()
+            generated = file_output_loader.display_hardware_library()
+            changed_seconds = time.perf_counter() - start
+            if list(generated) != [module_names[0]]:
+                raise AssertionError(
+                    "display_hardware_library regenerated " + str(list(generated))
+                )
+
+        for module_name in module_names:
+            hardware_library.delete_module(module_name)
+        print(
+            f"{module_count:>8} {full_seconds:>8.2f} {noop_seconds:>8.3f}"
+            f" {cold_seconds:>13.3f} {changed_seconds:>12.3f}"
+        )
+
+
+BENCHMARKS = {
+    "flatten": bench_flatten,
+    "flatten_cached": bench_flatten_cached,
+    "flatten_incremental": bench_flatten_incremental,
+    "construction": bench_construction,
+    "bulk_construction": bench_bulk_construction,
+    "compact_memory": bench_compact_memory,
+    "define_modules": bench_define_modules,
+    "library_lookups": bench_library_lookups,
+    "verilog_ports": bench_verilog_ports,
+    "basic_block_startup": bench_basic_block_startup,
+    "library_snapshot": bench_library_snapshot,
+    "module_discovery": bench_module_discovery,
+    "module_definitions": bench_module_definitions,
+    "dependency_queries": bench_dependency_queries,
+    "library_contexts": bench_library_contexts,
+    "graph_streams": bench_graph_streams,
+    "template_environment": bench_template_environment,
+    "verilog_rendering": bench_verilog_rendering,
+    "parallel_generation": bench_parallel_generation,
+    "incremental_generation": bench_incremental_generation,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(
+                "Unknown benchmark "
+                + name
+                + ", expected one of "
+                + str(list(BENCHMARKS))
+            )
+        BENCHMARKS[name]()
+        print()
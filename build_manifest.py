@@ -0,0 +1,138 @@
+"""
+The build manifest of file_output_loader.display_hardware_library, recording which generated files
+are up to date with the modules they were generated from
+"""
+
+import json
+import os
+
+# Format of the manifest, bumped whenever its entries change
+MANIFEST_VERSION = 1
+
+
+class BuildManifest:
+    """
+    Records, for every module generated by display_hardware_library, the content hash it was
+    generated from and the modification time and size of each of its generated files. A module is
+    up to date while its hash is unchanged and none of its files was changed or removed since.
+    """
+
+    def __init__(self, file_path):
+        """
+        Initializes an empty manifest stored in file_path. Call load to read the stored one.
+
+        Attributes:
+            file_path (str): The path of the manifest.
+            _entries (dict): Maps every module to its "hash" and "files", which map the path of
+                every generated file to its [modification time in ns, size].
+            _changed (bool): Whether the entries changed since they were loaded or saved.
+        """
+        self.file_path = file_path
+        self._entries = {}
+        self._changed = True
+
+    def load(self):
+        """
+        Reads the manifest stored in file_path.
+
+        Returns:
+            bool: True if it was read, False if it is missing or was written by another version,
+                in which case the manifest is left empty.
+        """
+        self._entries = {}
+        self._changed = True
+        try:
+            with open(self.file_path, "r") as infile:
+                manifest = json.load(infile)
+        except (OSError, ValueError):
+            return False
+        if (
+            not isinstance(manifest, dict)
+            or manifest.get("version") != MANIFEST_VERSION
+        ):
+            return False
+        self._entries = manifest["modules"]
+        self._changed = False
+        return True
+
+    def save(self):
+        """
+        Writes the manifest to file_path, through a temporary file renamed once complete. A
+        manifest that did not change since it was loaded or saved is not written again.
+        """
+        if not self._changed:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        temporary_file = self.file_path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_file, "w") as outfile:
+            json.dump(
+                {"version": MANIFEST_VERSION, "modules": self._entries},
+                outfile,
+                separators=(",", ":"),
+            )
+        os.replace(temporary_file, self.file_path)
+        self._changed = False
+
+    def is_up_to_date(self, module_name, module_hash):
+        """
+        Checks whether the generated files of a module are up to date.
+
+        Args:
+            module_name (str): The name of the module.
+            module_hash (str): The current content hash of the module.
+
+        Returns:
+            bool: True if the module was generated from module_hash and none of its files changed
+                since, False otherwise.
+        """
+        entry = self._entries.get(module_name)
+        if entry is None or entry["hash"] != module_hash:
+            return False
+        for file_path, file_stat in entry["files"].items():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return False
+            if [stat.st_mtime_ns, stat.st_size] != file_stat:
+                return False
+        return True
+
+    def record(self, module_name, module_hash, file_paths):
+        """
+        Records that the files of a module were generated from module_hash.
+
+        Args:
+            module_name (str): The name of the module.
+            module_hash (str): The content hash the files were generated from.
+            file_paths (list): The paths of the generated files, which must exist.
+        """
+        files = {}
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            files[file_path] = [stat.st_mtime_ns, stat.st_size]
+        self._entries[module_name] = {"hash": module_hash, "files": files}
+        self._changed = True
+
+    def remove_orphans(self, module_names):
+        """
+        Deletes the generated files of every recorded module that is not in module_names, and
+        forgets those modules.
+
+        Args:
+            module_names (iterable): The modules that are still generated.
+
+        Returns:
+            list: The names of the modules whose files were deleted.
+        """
+        module_names = set(module_names)
+        orphans = [
+            module_name
+            for module_name in self._entries
+            if module_name not in module_names
+        ]
+        for module_name in orphans:
+            for file_path in self._entries.pop(module_name)["files"]:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            self._changed = True
+        return orphans
@@ -0,0 +1,232 @@
+"""
+Compact, array-backed representation of large flattened graphs
+"""
+
+import numpy as np
+from netlist import port_connection_pairs, add_port_connection
+
+
+class InstanceRecord:
+    """
+    An instance of a CompactNetlist.
+
+    Attributes:
+        name (str): The name of the instance.
+        module_name (str): The name of the module of the instance.
+        attributes (dict): The other node attributes of the instance, or None if it has none.
+    """
+
+    __slots__ = ("name", "module_name", "attributes")
+
+    def __init__(self, name, module_name, attributes=None):
+        self.name = name
+        self.module_name = module_name
+        self.attributes = attributes
+
+
+class CompactNetlist:
+    """
+    Stores the instances and port connections of a graph in a few NumPy arrays instead of
+    dictionaries per node and per edge, for flattened designs too large to hold as an HDLGraph.
+
+    Instance and port names are interned: connections refer to them by their index in
+    "instances" and "port_names". The connections are sorted by source instance in compressed
+    sparse row (CSR) form: the connections driven by instance i are the entries
+    offsets[i]:offsets[i + 1] of the destinations, source_ports and destination_ports arrays,
+    ordered like the edges of the graph. in_connections lists the same connections sorted by
+    destination instance, with in_offsets as its row offsets.
+
+    Only the "port_connections" of the edges are kept, other edge attributes are dropped.
+
+    It exposes the instances_with_modules(), input_ports() and output_ports() queries of a graph and its
+    Netlist, so file_output_loader.generate_verilog accepts it in place of an HDLGraph.
+    """
+
+    def __init__(self):
+        """Initializes an empty CompactNetlist.
+
+        Attributes:
+            graph (dict): The graph attributes, as in networkx.
+            instances (list): The InstanceRecord of every instance, in node order.
+            port_names (list): The interned port names.
+        """
+        self.graph = {}
+        self.instances = []
+        self.port_names = []
+        self._instance_ids = {}
+        self._port_ids = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.destinations = np.zeros(0, dtype=np.int32)
+        self.source_ports = np.zeros(0, dtype=np.int32)
+        self.destination_ports = np.zeros(0, dtype=np.int32)
+        self.in_offsets = np.zeros(1, dtype=np.int64)
+        self.in_connections = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Creates the CompactNetlist of a graph whose nodes carry "module_name" and whose edges
+        carry "port_connections", such as an expanded HDLGraph.
+
+        Args:
+            graph (networkx.DiGraph): The graph to compact.
+
+        Returns:
+            CompactNetlist: The compacted graph.
+        """
+        netlist = cls()
+        netlist.graph = dict(graph.graph)
+        for node, data in graph.nodes(data=True):
+            attributes = {
+                key: value for key, value in data.items() if key != "module_name"
+            }
+            netlist._instance_ids[node] = len(netlist.instances)
+            netlist.instances.append(
+                InstanceRecord(node, data["module_name"], attributes or None)
+            )
+
+        offsets = [0]
+        destinations = []
+        source_ports = []
+        destination_ports = []
+        for node in graph:
+            for destination, data in graph.succ[node].items():
+                destination_id = netlist._instance_ids[destination]
+                for source_port, destination_port in port_connection_pairs(
+                    data["port_connections"]
+                ):
+                    destinations.append(destination_id)
+                    source_ports.append(netlist._port_id(source_port))
+                    destination_ports.append(netlist._port_id(destination_port))
+            offsets.append(len(destinations))
+
+        netlist.offsets = np.array(offsets, dtype=np.int64)
+        netlist.destinations = np.array(destinations, dtype=np.int32)
+        netlist.source_ports = np.array(source_ports, dtype=np.int32)
+        netlist.destination_ports = np.array(destination_ports, dtype=np.int32)
+        # A stable sort keeps the connections of each destination in edge order
+        netlist.in_connections = np.argsort(netlist.destinations, kind="stable")
+        netlist.in_offsets = np.zeros(len(netlist.instances) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(netlist.destinations, minlength=len(netlist.instances)),
+            out=netlist.in_offsets[1:],
+        )
+        return netlist
+
+    def _port_id(self, port_name):
+        port_id = self._port_ids.get(port_name)
+        if port_id is None:
+            port_id = self._port_ids[port_name] = len(self.port_names)
+            self.port_names.append(port_name)
+        return port_id
+
+    def to_hdl_graph(self):
+        """
+        Converts the CompactNetlist back into an HDLGraph.
+
+        Returns:
+            HDLGraph: A graph equal to a copy (HDLGraph(graph)) of the compacted graph, without
+                edge attributes other than "port_connections".
+        """
+        # hdl_graph imports this module, so HDLGraph is only imported when it is needed
+        from hdl_graph import HDLGraph
+
+        hdl_graph = HDLGraph()
+        hdl_graph.graph.update(self.graph)
+        hdl_graph.add_nodes_from(
+            (
+                record.name,
+                {"module_name": record.module_name, **(record.attributes or {})},
+            )
+            for record in self.instances
+        )
+        edges = []
+        for source_id, record in enumerate(self.instances):
+            edge_port_connections = {}
+            for index in range(self.offsets[source_id], self.offsets[source_id + 1]):
+                add_port_connection(
+                    edge_port_connections.setdefault(int(self.destinations[index]), {}),
+                    self.port_names[self.source_ports[index]],
+                    self.port_names[self.destination_ports[index]],
+                )
+            edges.extend(
+                (
+                    record.name,
+                    self.instances[destination_id].name,
+                    {"port_connections": port_connections},
+                )
+                for destination_id, port_connections in edge_port_connections.items()
+            )
+        hdl_graph.add_edges_from(edges)
+        return hdl_graph
+
+    def number_of_instances(self):
+        return len(self.instances)
+
+    def number_of_connections(self):
+        return len(self.destinations)
+
+    def nbytes(self):
+        """
+        Returns:
+            int: The size in bytes of the connection arrays.
+        """
+        return sum(
+            array.nbytes
+            for array in (
+                self.offsets,
+                self.destinations,
+                self.source_ports,
+                self.destination_ports,
+                self.in_offsets,
+                self.in_connections,
+            )
+        )
+
+    def instances_with_modules(self):
+        """
+        Iterates over the instances like graph.nodes(data="module_name").
+
+        Yields:
+            tuple: The (instance_name, module_name) of every instance.
+        """
+        for record in self.instances:
+            yield record.name, record.module_name
+
+    def output_ports(self, instance_name):
+        """
+        Returns:
+            dict: Maps every connected output port of the instance to the list of
+                (instance_name, port_name) it drives, like Netlist.output_ports.
+        """
+        instance_id = self._instance_ids[instance_name]
+        output_ports = {}
+        for index in range(self.offsets[instance_id], self.offsets[instance_id + 1]):
+            output_ports.setdefault(
+                self.port_names[self.source_ports[index]], []
+            ).append(
+                (
+                    self.instances[self.destinations[index]].name,
+                    self.port_names[self.destination_ports[index]],
+                )
+            )
+        return output_ports
+
+    def input_ports(self, instance_name):
+        """
+        Returns:
+            dict: Maps every connected input port of the instance to the (instance_name, port_name)
+                driving it, like Netlist.input_ports.
+        """
+        instance_id = self._instance_ids[instance_name]
+        connections = self.in_connections[
+            self.in_offsets[instance_id] : self.in_offsets[instance_id + 1]
+        ]
+        sources = np.searchsorted(self.offsets, connections, side="right") - 1
+        return {
+            self.port_names[self.destination_ports[index]]: (
+                self.instances[source_id].name,
+                self.port_names[self.source_ports[index]],
+            )
+            for index, source_id in zip(connections, sources)
+        }
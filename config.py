@@ -1,6 +1,7 @@
 """
 Loads the configuration file
 """
+
 import json
 import os
 
@@ -11,6 +12,8 @@ def load_config():
     if "path" not in config.keys():
         current_directory = os.getcwd()
         config["path"] = current_directory
+    if "cache_path" not in config.keys():
+        config["cache_path"] = os.path.join(config["path"], "generated_files", "cache")
     return config
 
 
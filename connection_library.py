@@ -1,6 +1,7 @@
 from typing import Dict, List, Union
 import json
 from singleton_meta import SingletonMeta
+from record_stream import write_records, read_records
 
 
 class ConnectionLibrary(metaclass=SingletonMeta):
@@ -8,12 +9,11 @@ class ConnectionLibrary(metaclass=SingletonMeta):
     Singleton class for managing a connection library.
     """
 
-    _loaded = False
-
     def __init__(self):
         """Initializes the ConnectionLibrary object.
 
-        Reads the configuration file and loads the connection library if it has not been loaded before.
+        Reads the configuration file and loads the connection library. ConnectionLibrary() only
+        does so once, returning the same singleton afterwards.
 
         Attributes:
             connection_library (dict): A dictionary containing the configuration data of the connection library.
@@ -22,11 +22,20 @@ class ConnectionLibrary(metaclass=SingletonMeta):
             FileNotFoundError: If the configuration file 'hardware_modules/connection_library.json' does not exist.
             JSONDecodeError: If the configuration file is not in valid JSON format.
         """
-        if not ConnectionLibrary._loaded:
-            with open("hardware_modules/connection_library.json") as config_file:
-                config = json.load(config_file)
-                self.connection_library = config
-            ConnectionLibrary._loaded = True
+        with open("hardware_modules/connection_library.json") as config_file:
+            config = json.load(config_file)
+            self.connection_library = config
+
+    def clone(self):
+        """
+        Copies the connection library.
+
+        Returns:
+            ConnectionLibrary: The copy, which is not the singleton.
+        """
+        library = ConnectionLibrary.__new__(ConnectionLibrary)
+        library.connection_library = dict(self.connection_library)
+        return library
 
     def check_port_exists(self, port):
         """
@@ -86,3 +95,43 @@ class ConnectionLibrary(metaclass=SingletonMeta):
         """
         with open("generated_files/" + filename + ".json", "w") as outfile:
             json.dump(self.connection_library, outfile, indent=4)
+
+    def dump_stream(self, file_path):
+        """
+        Writes the connection library one record per connection type. See
+        record_stream.write_records for the formats.
+
+        Args:
+            file_path (str): The path of the .jsonl, .jsonl.gz or .bin file.
+
+        Returns:
+            int: The number of records written.
+        """
+        return write_records(
+            file_path,
+            (
+                {
+                    "record": "connection",
+                    "connection_name": connection_name,
+                    "ports": ports,
+                }
+                for connection_name, ports in self.connection_library.items()
+            ),
+        )
+
+    def load_stream(self, file_path):
+        """
+        Replaces the content of the connection library with a dump written by dump_stream.
+
+        Args:
+            file_path (str): The path of the .jsonl, .jsonl.gz or .bin file.
+
+        Raises:
+            ValueError: If the dump holds records other than connection types.
+        """
+        connection_library = {}
+        for record in read_records(file_path):
+            if record["record"] != "connection":
+                raise ValueError("Unexpected " + str(record["record"]) + " record")
+            connection_library[record["connection_name"]] = record["ports"]
+        self.connection_library = connection_library
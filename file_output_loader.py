@@ -5,50 +5,264 @@ In charge of handling any generation or visualiztion of Verilog
 import networkx as nx
 import os
 import json
+import hashlib
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from config import config
 from hardware_library import HardwareLibrary
+import pyvis
 from pyvis.network import Network
 from hdl_graph import HDLGraph
-from jinja2 import Environment, FileSystemLoader
+from module_netlist import ModuleNetlist, IO_BLOCK, BASIC_BLOCK
+from template_environment import get_environment, templates_digest
+from build_manifest import BuildManifest
+from library_context import active_hardware_library, active_context, in_context
+
+# The hardware library of the active library context, see library_context
+hardware_library = active_hardware_library
+
+# Rendered fragments gathered into every write of generate_verilog
+RENDER_CHUNK_SIZE = 4096
+# Size of the write buffer of the generated Verilog files
+WRITE_BUFFER_SIZE = 1 << 20
+# Version of the generated files, bumped whenever the backends change what they write, so that
+# display_hardware_library generates every module again
+ARTIFACT_VERSION = 1
+# Seed of the layout of the HTML visualizations, so that generating a module twice, serially or in
+# a worker process, gives the same file
+LAYOUT_SEED = 0
+
+# The library context display_hardware_library generates from, read by its worker processes
+_generation_context = None
+
+
+@in_context
+def display_hardware_library(workers=1, progress=None, rebuild=False):
+    """
+    Generates the Verilog file and the HTML visualization of every non-basic module in the hardware library.
+    The netlist of each module is built once, from the frozen internal graph the library keeps for it, and
+    passed to every backend of OUTPUT_BACKENDS.
 
-hardware_library = HardwareLibrary()
+    Generation is incremental: a build manifest in config["cache_path"] records the content hash every module
+    was generated from (see _artifact_hash) and the files it was generated to. Only the modules whose hash
+    changed, or whose files were changed or removed since, are generated again, and only the files of modules
+    no longer in the library are deleted. Without a manifest, the output folders are cleared and every module is
+    generated.
 
+    With more than one worker, the modules are generated in a pool of forked processes, the modules with
+    the most instances first so that the largest ones do not hold up the end of the run. Every file is
+    written to a temporary file and renamed once complete, and the files are the same as those of a
+    serial run.
 
-def display_hardware_library():
-    """
-    As of right now, HDLGraph() must be initialized in order to turn HardwareLibrary modules from JSON into HDLGraphs in order to
-    turn those HDLGraphs into verilog files. This should be fixed.
+    Like display_verilog and generate_verilog, it reads the library of the active library context,
+    or of the context passed as the context keyword argument.
+
+    Args:
+        workers (int, optional): The number of worker processes, or None for one per CPU. Defaults
+            to 1, generating every module in the calling process.
+        progress (callable, optional): Called with the module name, the seconds spent generating
+            it, and the numbers of modules generated so far and in total, as each module is done.
+        rebuild (bool, optional): Clear the output folders and generate every module, whatever the
+            manifest records. Defaults to False.
+
+    Returns:
+        dict: Maps every generated module to the seconds spent generating it, in the order they
+            were done. Modules that were up to date are not listed.
+
+    Raises:
+        ValueError: If workers is not None or a positive integer.
     """
-    clear_folder(config["path"] + "/generated_files/verilog")
-    clear_folder(config["path"] + "/generated_files/html")
+    global _generation_context
+    if workers is None:
+        workers = os.cpu_count()
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError("workers must be None or an integer greater than 0")
+
+    manifest = BuildManifest(os.path.join(config["cache_path"], "build_manifest.json"))
+    clear_output = rebuild or not manifest.load()
+    # The folders the backends write to, relative to the working directory like their files
+    for folder_path in ("generated_files/verilog", "generated_files/html"):
+        if clear_output:
+            clear_folder(folder_path)
+        os.makedirs(folder_path, exist_ok=True)
     lib = hardware_library.get_hardware_library()
+    module_hashes = {}
+    build_digest = _build_digest()
     for module_name in lib.keys():
         if not lib[module_name]["basic_block"]:
-            if hardware_library[module_name]["basic_block"]:
-                hdl_graph = HDLGraph()
-            else:
-                hdl_graph = HDLGraph.from_hardware_library_module(module_name)
-            generate_verilog(module_name)
-            display_verilog(module_name)
+            module_hashes[module_name] = _artifact_hash(module_name, build_digest)
+    manifest.remove_orphans(module_hashes)
+    module_names = [
+        module_name
+        for module_name, module_hash in module_hashes.items()
+        if not manifest.is_up_to_date(module_name, module_hash)
+    ]
+    timings = {}
+
+    def done(module_name, result):
+        seconds, file_paths = result
+        manifest.record(module_name, module_hashes[module_name], file_paths)
+        timings[module_name] = seconds
+        if progress is not None:
+            progress(module_name, seconds, len(timings), len(module_names))
+
+    try:
+        if (
+            workers == 1
+            or len(module_names) < 2
+            or "fork" not in multiprocessing.get_all_start_methods()
+        ):
+            for module_name in module_names:
+                done(module_name, _generate_module(module_name))
+            return timings
+
+        # Sized by their number of instances, read from the instantiation index
+        module_names.sort(
+            key=lambda module_name: sum(
+                hardware_library.get_submodules(module_name).values()
+            ),
+            reverse=True,
+        )
+        _prepare_html_resources()
+        # Forked workers inherit the library, and generate from the context active here
+        _generation_context = active_context()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        _generate_module_in_context, module_name
+                    ): module_name
+                    for module_name in module_names
+                }
+                for future in as_completed(futures):
+                    done(futures[future], future.result())
+        finally:
+            _generation_context = None
+        return timings
+    finally:
+        # Modules generated before a failure are recorded, so they are not generated again
+        manifest.save()
+
+
+def _build_digest():
+    """
+    Hashes what the output of every module depends on besides the modules themselves: the
+    templates, the configuration, the backends and the versions of the libraries rendering them.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(
+        repr(
+            (
+                ARTIFACT_VERSION,
+                templates_digest(),
+                json.dumps(config, sort_keys=True),
+                LAYOUT_SEED,
+                list(OUTPUT_BACKENDS),
+                nx.__version__,
+                pyvis.__version__,
+            )
+        ).encode()
+    )
+    return digest.hexdigest()
+
 
+def _artifact_hash(module_name, build_digest):
+    """
+    Hashes everything the generated files of a module depend on: the build digest, the definition
+    of the module, and the name, kind and output port types of each module it instantiates, which
+    are all its netlist reads from its submodules.
+    """
+    library = hardware_library.get_hardware_library()
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(build_digest.encode())
+    digest.update(hardware_library.get_module_hash(module_name).encode())
+    for submodule_name in sorted(hardware_library.get_submodules(module_name)):
+        submodule = library[submodule_name]
+        digest.update(
+            repr(
+                (submodule_name, submodule["basic_block"], submodule["output_ports"])
+            ).encode()
+        )
+    return digest.hexdigest()
+
+
+def _generate_module(module_name):
+    """
+    Writes the output of every backend of OUTPUT_BACKENDS for a module.
 
+    Returns:
+        tuple: The seconds spent and the list of the files written.
+    """
+    start = time.perf_counter()
+    module_netlist = hardware_library.get_module_netlist(module_name)
+    file_paths = [backend(module_netlist) for backend in OUTPUT_BACKENDS.values()]
+    return time.perf_counter() - start, file_paths
+
+
+def _generate_module_in_context(module_name):
+    """
+    Runs _generate_module in a worker process of display_hardware_library.
+    """
+    with _generation_context.activate():
+        return _generate_module(module_name)
+
+
+def _prepare_html_resources():
+    """
+    Copies the pyvis resources the HTML visualizations link to into the lib folder, as writing the
+    first visualization would, so that worker processes do not all try to copy them at once.
+    """
+    with tempfile.TemporaryDirectory() as folder_path:
+        Network().write_html(os.path.join(folder_path, "resources.html"))
+
+
+@in_context
 def display_verilog(module_name, hdl_graph=None):
-    # Create a Jinja2 environment with the current directory as the template loader
-    env = Environment(loader=FileSystemLoader("."))
+    """
+    Generates the HTML visualization of a module, or of hdl_graph under the name module_name.
+    """
+    write_html(_module_netlist(module_name, hdl_graph))
+
+
+@in_context
+def generate_verilog(module_name, hdl_graph=None):
+    """
+    Generates the Verilog file of a module, or of hdl_graph under the name module_name.
+    """
+    write_verilog(_module_netlist(module_name, hdl_graph))
+
+
+def _module_netlist(module_name, hdl_graph):
+    """
+    Returns the netlist of hdl_graph if given, or the cached netlist of the module otherwise.
+    """
+    if hdl_graph:
+        return ModuleNetlist.from_graph(module_name, hdl_graph, hardware_library)
+    return hardware_library.get_module_netlist(module_name)
 
-    # Define a custom Jinja2 filter to check if a value is an integer
-    env.filters["is_integer"] = lambda value: isinstance(value, int)
+
+def write_html(module_netlist):
+    """
+    The HTML backend: writes the pyvis visualization of a module netlist to
+    generated_files/html/<module_name>.html.
+
+    Args:
+        module_netlist (ModuleNetlist): The netlist of the module.
+
+    Returns:
+        str: The path of the file.
+    """
+    # The shared Jinja2 environment, with its templates compiled once per process
+    env = get_environment("label")
 
     # Load the Jinja2 templates for connection and module generation
     connection_template = env.get_template(
         "jinja_templates/verilog_connection_template.txt"
     )
-    if hdl_graph:
-        hdl_graph = hdl_graph
-    elif hardware_library[module_name]["basic_block"]:
-        hdl_graph = HDLGraph()
-    else:
-        hdl_graph = HDLGraph.from_hardware_library_module(module_name)
     module_template = env.get_template("jinja_templates/verilog_module_template.txt")
     graph = Network(
         directed=True,
@@ -78,55 +292,26 @@ def display_verilog(module_name, hdl_graph=None):
 
     # Set the options using the JSON string
     graph.set_options(options_str)
-    edge_labels = []
-    pos = nx.spring_layout(hdl_graph, scale=700)
+    layout_graph = nx.DiGraph()
+    layout_graph.add_nodes_from(
+        instance_name for instance_name, _, _ in module_netlist.instances
+    )
+    layout_graph.add_edges_from(
+        (source, destination) for source, destination, _ in module_netlist.edges
+    )
+    pos = nx.spring_layout(layout_graph, scale=700, seed=LAYOUT_SEED)
     # Generate module instances for each node in the graph
-    for node in hdl_graph.nodes():
-        instance_name = node
-        module = hdl_graph.nodes[node]["module_name"]
-        port_connections = {}
-
-        # Retrieve outgoing edges from the current node
-        outgoing_edges = hdl_graph.out_edges(node, data=True)
-
-        # Extract port connections for outgoing edges
-        for edges in outgoing_edges:
-            source, destination, data = edges
-            for source_port, destination_port in data["port_connections"].items():
-                if destination == config["output_block_name"]:
-                    connection = {
-                        "internal_port": source_port,
-                        "external_port": destination_port,
-                        "external_module": destination,
-                    }
-                else:
-                    connection = {
-                        "internal_port": source_port,
-                        "external_port": source_port,
-                        "external_module": source,
-                    }
-                port_connections[source_port] = connection
-
-        # Retrieve incoming edges to the current node
-        incoming_edges = hdl_graph.in_edges(node, data=True)
-
-        # Extract port connections for incoming edges
-        for edges in incoming_edges:
-            source, destination, data = edges
-            for source_port, destination_port in data["port_connections"].items():
-                if destination == config["output_block_name"]:
-                    connection = {
-                        "internal_port": destination_port,
-                        "external_port": source_port,
-                        "external_module": destination,
-                    }
-                else:
-                    connection = {
-                        "internal_port": destination_port,
-                        "external_port": source_port,
-                        "external_module": source,
-                    }
-                port_connections[destination_port] = connection
+    for instance_name, module, kind in module_netlist.instances:
+        port_connections = [
+            {
+                "internal_port": internal_port,
+                "external_port": external_port,
+                "external_module": external_module,
+            }
+            for internal_port, external_port, external_module in module_netlist.bindings[
+                instance_name
+            ]
+        ]
 
         # Generate Verilog code for the module instance
         value = {
@@ -134,13 +319,10 @@ def display_verilog(module_name, hdl_graph=None):
             "output_block_name": config["output_block_name"],
             "module_name": module,
             "instance_name": instance_name,
-            "port_connections": port_connections.values(),
+            "port_connections": port_connections,
         }
         output = module_template.render(value)
-        if (
-            instance_name == config["input_block_name"]
-            or instance_name == config["output_block_name"]
-        ):
+        if kind == IO_BLOCK:
             graph.add_node(
                 instance_name,
                 label=output,
@@ -151,7 +333,7 @@ def display_verilog(module_name, hdl_graph=None):
                 color=config["input_output_block_color"],
                 physics=False,
             )
-        elif hardware_library.get_hardware_library()[module]["basic_block"]:
+        elif kind == BASIC_BLOCK:
             graph.add_node(
                 instance_name,
                 label=output,
@@ -178,208 +360,103 @@ def display_verilog(module_name, hdl_graph=None):
                 physics=False,
             )
 
-    for node in hdl_graph.nodes():
-        module = hdl_graph.nodes[node]["module_name"]
-
-        # Retrieve outgoing edges from the current node
-        outgoing_edges = hdl_graph.out_edges(node, data=True)
-
-        # Extract port connections and their corresponding types
-        for edges in outgoing_edges:
-            source, destination, data = edges
-            # Done so that any modules outputting to an output block has an edge that correct interfaces with the output_port
-            if destination == config["output_block_name"]:
-                module_param = destination
-            else:
-                module_param = node
-            edge_label = ""
-            for port in data["port_connections"].keys():
-                type = (
-                    hardware_library.hardware_library[module]["output_ports"][port]
-                    if (
-                        module != config["input_block_name"]
-                        and module != config["output_block_name"]
-                    )
-                    else ""
-                )
-                output = connection_template.render(
-                    module=module_param,
-                    port=port,
-                    type=type,
-                    input_block_name=config["input_block_name"],
-                    output_block_name=config["output_block_name"],
-                )
-                edge_label = edge_label + output
-            if (
-                source == config["input_block_name"]
-                or destination == config["output_block_name"]
-            ):
-                graph.add_edge(
-                    source,
-                    destination,
-                    label=edge_label,
-                    label_angle=45,
-                    length=700,
-                    color=config["input_output_edge_color"],
-                    font={"color": "white", "strokeWidth": "0px"},
-                )
-            else:
-                graph.add_edge(
-                    source,
-                    destination,
-                    label=edge_label,
-                    label_angle=45,
-                    length=700,
-                    font={"color": "white", "strokeWidth": "0px"},
-                )
+    for source, destination, ports in module_netlist.edges:
+        # Done so that any modules outputting to an output block has an edge that correct interfaces with the output_port
+        if destination == config["output_block_name"]:
+            module_param = destination
+        else:
+            module_param = source
+        edge_label = ""
+        for port, type in ports:
+            output = connection_template.render(
+                module=module_param,
+                port=port,
+                type=type,
+                input_block_name=config["input_block_name"],
+                output_block_name=config["output_block_name"],
+            )
+            edge_label = edge_label + output
+        if (
+            source == config["input_block_name"]
+            or destination == config["output_block_name"]
+        ):
+            graph.add_edge(
+                source,
+                destination,
+                label=edge_label,
+                label_angle=45,
+                length=700,
+                color=config["input_output_edge_color"],
+                font={"color": "white", "strokeWidth": "0px"},
+            )
+        else:
+            graph.add_edge(
+                source,
+                destination,
+                label=edge_label,
+                label_angle=45,
+                length=700,
+                font={"color": "white", "strokeWidth": "0px"},
+            )
 
-    graph.write_html("generated_files/html/" + module_name + ".html")
-    del hdl_graph
+    # Write to a temporary file renamed once complete, named .html as pyvis requires
+    file_path = "generated_files/html/" + module_netlist.module_name + ".html"
+    temporary_path = "generated_files/html/" + module_netlist.module_name + ".tmp.html"
+    graph.write_html(temporary_path)
+    os.replace(temporary_path, file_path)
+    return file_path
 
 
-def generate_verilog(module_name, hdl_graph=None):
+def write_verilog(module_netlist):
     """
-    Generate Verilog port connections and module instances based on the provided input dictionary.
-    Write the generated Verilog code to the specified output file.
+    The Verilog backend: writes the SystemVerilog of a module netlist to
+    generated_files/verilog/<module_name>.sv.
+
+    The whole file is rendered in a single pass of jinja_templates/verilog_module_file.txt,
+    streamed to the file in chunks.
 
     Args:
-        output_file (str): The name of the output file to write the generated Verilog code.
+        module_netlist (ModuleNetlist): The netlist of the module.
 
     Returns:
-        None
-
-    Raises:
-        None
+        str: The path of the file.
     """
+    # The shared Jinja2 environment, with its templates compiled once per process
+    env = get_environment("verilog")
+
+    # The template of the whole file, rendered in a single pass
+    file_template = env.get_template("jinja_templates/verilog_module_file.txt")
+
+    # Stream the rendered file in chunks of RENDER_CHUNK_SIZE fragments through a buffered writer,
+    # to a temporary file renamed once complete
+    file_path = "generated_files/verilog/" + module_netlist.module_name + ".sv"
+    with open(file_path + ".tmp", "w", buffering=WRITE_BUFFER_SIZE) as file:
+        stream = file_template.stream(
+            module_name=module_netlist.module_name,
+            port_connections=module_netlist.ports,
+            nets=module_netlist.nets,
+            instances=[
+                (
+                    instance_module_name,
+                    instance_name,
+                    module_netlist.bindings[instance_name],
+                )
+                for instance_name, instance_module_name, kind in module_netlist.instances
+                if kind != IO_BLOCK
+            ],
+            input_block_name=config["input_block_name"],
+            output_block_name=config["output_block_name"],
+        )
+        stream.enable_buffering(RENDER_CHUNK_SIZE)
+        stream.dump(file)
+    os.replace(file_path + ".tmp", file_path)
+    return file_path
 
-    # Create a Jinja2 environment with the current directory as the template loader
-    env = Environment(loader=FileSystemLoader("."))
-    env.trim_blocks = True
-    env.lstrip_blocks = True
-
-    # Define a custom Jinja2 filter to check if a value is an integer
-    env.filters["is_integer"] = lambda value: isinstance(value, int)
 
-    # Load the Jinja2 templates for connection and module generation
-    connection_template = env.get_template(
-        "jinja_templates/verilog_connection_template.txt"
-    )
-    module_template = env.get_template("jinja_templates/verilog_module_template.txt")
-    input_output_template = env.get_template(
-        "jinja_templates/verilog_module_input_output.txt"
-    )
-    if hdl_graph:
-        hdl_graph = hdl_graph
-    elif hardware_library[module_name]["basic_block"]:
-        hdl_graph = HDLGraph()
-    else:
-        hdl_graph = HDLGraph.from_hardware_library_module(module_name)
-    # Open the output file for writing
-    with open("generated_files/verilog/" + module_name + ".sv", "w") as file:
-        library_module = hardware_library.get_hardware_library()[module_name]
-        input_ports = library_module["input_ports"]
-        output_ports = library_module["output_ports"]
-        port_connections = {}
-        for port_name, type in input_ports.items():
-            port_connections[port_name] = {"type": type, "input_output": "input"}
-        for port_name, type in output_ports.items():
-            port_connections[port_name] = {"type": type, "input_output": "output"}
-        value = {"module_name": module_name, "port_connections": port_connections}
-        output = input_output_template.render(
-            module_name=module_name, port_connections=port_connections
-        )
-        file.write(output)
-        # Generate port connections for each node in the graph
-        for node in hdl_graph.nodes():
-            module_name = hdl_graph.nodes[node]["module_name"]
-            if (
-                node == config["input_block_name"]
-                or node == config["output_block_name"]
-            ):
-                continue
-            output_set = {}
-
-            # Retrieve outgoing edges from the current node
-            outgoing_edges = hdl_graph.out_edges(node, data=True)
-            # Extract port connections and their corresponding types
-            for edges in outgoing_edges:
-                source, target, data = edges
-                for port in data["port_connections"].keys():
-                    output_set[port] = (
-                        hardware_library.hardware_library[module_name]["output_ports"][
-                            port
-                        ]
-                        if (
-                            module_name != config["input_block_name"]
-                            and module_name != config["output_block_name"]
-                        )
-                        else ""
-                    )
-
-            # Generate Verilog code for each port connection
-            for port, type in output_set.items():
-                value = {"module": node, "port": port, "type_value": type}
-                output = connection_template.render(module=node, port=port, type=type)
-                file.write(output)
-
-        # Generate module instances for each node in the graph
-        for node in hdl_graph.nodes():
-            module_name = hdl_graph.nodes[node]["module_name"]
-            if (
-                node == config["input_block_name"]
-                or node == config["output_block_name"]
-            ):
-                continue
-            instance_name = node
-            port_connections = {}
-
-            # Retrieve outgoing edges from the current node
-            outgoing_edges = hdl_graph.out_edges(node, data=True)
-
-            # Extract port connections for outgoing edges
-            for edges in outgoing_edges:
-                source, destination, data = edges
-                for source_port, destination_port in data["port_connections"].items():
-                    if destination == config["output_block_name"]:
-                        connection = {
-                            "internal_port": source_port,
-                            "external_port": destination_port,
-                            "external_module": destination,
-                        }
-                    else:
-                        connection = {
-                            "internal_port": source_port,
-                            "external_port": source_port,
-                            "external_module": source,
-                        }
-                    port_connections[source_port] = connection
-
-            # Retrieve incoming edges to the current node
-            incoming_edges = hdl_graph.in_edges(node, data=True)
-
-            # Extract port connections for incoming edges
-            for edges in incoming_edges:
-                source, destination, data = edges
-                for source_port, destination_port in data["port_connections"].items():
-                    connection = {
-                        "internal_port": destination_port,
-                        "external_port": source_port,
-                        "external_module": source,
-                    }
-                    port_connections[destination_port] = connection
-
-            # Generate Verilog code for the module instance
-            value = {
-                "input_block_name": config["input_block_name"],
-                "output_block_name": config["output_block_name"],
-                "module_name": module_name,
-                "instance_name": instance_name,
-                "port_connections": port_connections.values(),
-            }
-            output = module_template.render(value)
-            file.write(output)
-        file.write("endmodule")
-    del hdl_graph
+# The backends display_hardware_library writes every module with. A backend is a function taking
+# the ModuleNetlist of a module, writing its output file and returning its path, so adding one needs
+# no other walk of the module graph.
+OUTPUT_BACKENDS = {"verilog": write_verilog, "html": write_html}
 
 
 def clear_folder(folder_path):
@@ -1,19 +1,71 @@
 from typing import Dict, List, Union
+import functools
+import hashlib
 import json
+import multiprocessing
 import os
-import re
+import pickle
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from config import config
 from singleton_meta import SingletonMeta
 from connection_library import ConnectionLibrary
+from netlist import copy_port_connections
+from module_netlist import ModuleNetlist
+from verilog_parser import parse_verilog_modules, read_verilog_file
+from record_stream import write_records, read_records, graph_records, add_graph_record
 import networkx as nx
 from networkx.readwrite import json_graph
 
-connection_library = ConnectionLibrary()
+# Format of the basic block cache, bumped whenever the cached entries or the parser output change
+BASIC_BLOCK_CACHE_VERSION = 1
+# Format of the library snapshot, bumped whenever the pickled library layout changes
+SNAPSHOT_VERSION = 1
+# Below this many changed files, basic blocks are parsed serially rather than in a process pool
+PARALLEL_PARSE_MIN_FILES = 64
+
+
+def _synchronized(method):
+    """
+    Runs a method that modifies the library while holding the lock of the library, so that
+    threads can modify it safely. Methods that only read the library do not take the lock.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class HardwareLibrary(metaclass=SingletonMeta):
-    def __init__(self):
+    def __init__(self, connection_library=None):
+        """
+        Initializes the hardware library with the basic blocks of /hardware_modules/basic_blocks.
+
+        Args:
+            connection_library (ConnectionLibrary, optional): The connection library the port
+                types refer to. Defaults to the ConnectionLibrary() singleton.
+        """
+        self.connection_library = (
+            connection_library
+            if connection_library is not None
+            else ConnectionLibrary()
+        )
+        self._lock = threading.RLock()
+        # Whether the tables below are shared with a clone, and must be copied before a change
+        self._shared_tables = False
         self.hardware_library = {}
+        self._expanded_graphs = {}
+        self._module_netlists = {}
+        self._module_hashes = {}
+        self._module_versions = {}
+        # Maps every module to the number of instances of each module it directly instantiates,
+        # and every module to the number of instances of it in each module directly instantiating it
+        self._submodules = {}
+        self._dependent_modules = {}
         self._parse_basic_verilog_files(
             config["path"] + "/hardware_modules/basic_blocks"
         )
@@ -21,12 +73,20 @@ class HardwareLibrary(metaclass=SingletonMeta):
     def __getitem__(self, key):
         return self.hardware_library[key]
 
+    @_synchronized
     def __setitem__(self, key, value):
+        self._module_changed(key)
+        self._unindex_module(key)
         self.hardware_library[key] = value
+        self._index_module(key)
 
+    @_synchronized
     def __delitem__(self, key):
+        self._module_changed(key)
+        self._unindex_module(key)
         del self.hardware_library[key]
 
+    @_synchronized
     def add_module(
         self,
         module_name: str,
@@ -90,22 +150,30 @@ class HardwareLibrary(metaclass=SingletonMeta):
             "input_ports": input_ports,
             "output_ports": output_ports,
             "basic_block": False if internal_graph else True,
-            "internal_graph": nx.node_link_data(internal_graph)
-            if internal_graph
-            else None,
+            "internal_graph": (
+                self._frozen_graph(internal_graph) if internal_graph else None
+            ),
         }
 
+        self._module_changed(module_name)
         self.hardware_library[module_name] = module_dict
+        self._index_module(module_name)
 
-    def get_module_nx_graph(self, module_name):
+    def get_module_nx_graph(self, module_name, mutable=False):
         """
         Retrieves the networkx graph object for a specific module in the HDLGraph.
 
+        The library keeps a frozen graph per module and returns it as is, so repeated lookups do
+        not rebuild anything. Callers that need to modify the graph ask for a mutable copy instead.
+
         Parameters:
             module_name (str): The name of the module.
+            mutable (bool): Return a copy of the graph, and of the "port_connections" of its edges,
+                that can be modified freely. Defaults to False.
 
         Returns:
             networkx.Graph: The networkx graph object representing the internal graph of the module.
+                Unless mutable is True, it is frozen and must not be modified, edge data included.
 
         Raises:
             TypeError: If module_name is not a string.
@@ -117,8 +185,37 @@ class HardwareLibrary(metaclass=SingletonMeta):
         if module_name not in self.hardware_library:
             raise ValueError(f"No module with name {module_name} exists")
 
-        return nx.node_link_graph(self.hardware_library[module_name]["internal_graph"])
+        internal_graph = self.hardware_library[module_name]["internal_graph"]
+        if internal_graph is None:
+            raise ValueError(f"Module with name {module_name} has no internal graph")
+        if isinstance(internal_graph, dict):
+            # Modules loaded by from_json are kept as node-link data until first used
+            internal_graph = nx.freeze(nx.node_link_graph(internal_graph))
+            self.hardware_library[module_name]["internal_graph"] = internal_graph
+
+        if mutable:
+            return self._copy_graph(internal_graph)
+        return internal_graph
+
+    @staticmethod
+    def _copy_graph(graph):
+        """
+        Copies a graph along with the "port_connections" of its edges. The copy is not frozen.
+        """
+        graph_copy = graph.copy()
+        for _, _, data in graph_copy.edges(data=True):
+            data["port_connections"] = copy_port_connections(data["port_connections"])
+        return graph_copy
+
+    @staticmethod
+    def _frozen_graph(graph):
+        """
+        Copies the internal graph of a module into the frozen graph kept by the library, so later
+        changes to the caller's graph do not affect the library.
+        """
+        return nx.freeze(HardwareLibrary._copy_graph(graph))
 
+    @_synchronized
     def update_module(
         self,
         module_name: str,
@@ -144,9 +241,15 @@ class HardwareLibrary(metaclass=SingletonMeta):
         self._check_input_ports(input_ports)
         self._check_output_ports(output_ports)
 
-        self.hardware_library[module_name]["input_ports"] = input_ports
-        self.hardware_library[module_name]["output_ports"] = output_ports
+        self._module_changed(module_name)
+        # The module is replaced rather than modified, as clones of the library may share it
+        self.hardware_library[module_name] = {
+            **self.hardware_library[module_name],
+            "input_ports": input_ports,
+            "output_ports": output_ports,
+        }
 
+    @_synchronized
     def delete_module(self, module_name: str) -> None:
         """
         Deletes a module from the hardware library.
@@ -160,84 +263,513 @@ class HardwareLibrary(metaclass=SingletonMeta):
         if module_name not in self.hardware_library:
             raise ValueError(f"No module with name {module_name} exists")
 
+        self._module_changed(module_name)
+        self._unindex_module(module_name)
         del self.hardware_library[module_name]
 
-    def _parse_basic_verilog_files(self, folder_path):
+    def get_expanded_graph(self, module_name):
+        """
+        Retrieves the cached expansion of a module, as stored by set_expanded_graph.
+
+        Parameters:
+            module_name (str): The name of the module.
+
+        Returns:
+            dict: The cache entry of the module, or None if the module has not been expanded since it
+                or one of its submodules last changed.
         """
-        Read the basic block folder, use regular expressions to extract module information to load into the hardware library
+        return self._expanded_graphs.get(module_name)
+
+    @_synchronized
+    def set_expanded_graph(self, module_name, expanded_module):
+        """
+        Caches the expansion of a module down to its basic blocks. The entry is dropped as soon as
+        the module or any module in its submodules is added, updated or deleted.
+
+        Parameters:
+            module_name (str): The name of the module.
+            expanded_module (dict): The expansion of the module, which must not be modified once cached.
+                Its keys are:
+                - graph (networkx.DiGraph): The expanded graph, with instance names that are not
+                  prefixed by any parent instance.
+                - submodules (set): The names of every module instantiated anywhere below module_name.
+                - instances (dict): Maps the hierarchical name of every expanded instance below
+                  module_name to its module name.
+                - input_port_index (dict): Maps each input port to the list of (instance_name, port_name)
+                  it drives inside graph.
+                - output_port_index (dict): Maps each output port to the (instance_name, port_name)
+                  driving it inside graph.
+                - unmatched_ports (list): The (instance_name, port_name) of every boundary port below
+                  module_name that was connected outside its instance but not inside it.
+        """
+        self._expanded_graphs[module_name] = expanded_module
+
+    @_synchronized
+    def clear_expanded_graphs(self):
+        """
+        Drops every cached module expansion.
+        """
+        self._expanded_graphs = {}
+
+    def get_module_netlist(self, module_name):
+        """
+        Retrieves the netlist of a module that the output backends of file_output_loader render,
+        building it on first use. It is cached until the module or any module in its submodules
+        is added, updated or deleted.
+
+        Parameters:
+            module_name (str): The name of the module.
+
+        Returns:
+            ModuleNetlist: The netlist of the module, empty for a basic block. It must not be
+                modified.
+
+        Raises:
+            TypeError: If module_name is not a string.
+            ValueError: If no module with the given name exists.
+        """
+        module_netlist = self._module_netlists.get(module_name)
+        if module_netlist is not None:
+            return module_netlist
+        if not isinstance(module_name, str):
+            raise TypeError("module_name must be a string")
+        if module_name not in self.hardware_library:
+            raise ValueError(f"No module with name {module_name} exists")
+
+        version = self.get_module_version(module_name)
+        graph = (
+            nx.DiGraph()
+            if self.hardware_library[module_name]["basic_block"]
+            else self.get_module_nx_graph(module_name)
+        )
+        module_netlist = ModuleNetlist.from_graph(module_name, graph, self)
+        with self._lock:
+            # The module may have changed while the netlist was built
+            if self.get_module_version(module_name) == version:
+                self._module_netlists[module_name] = module_netlist
+        return module_netlist
+
+    def get_module_hash(self, module_name):
+        """
+        Hashes the definition of a module: its ports, whether it is a basic block, and its internal
+        graph, but not the definitions of its submodules. The hash is cached until the module is
+        added, updated or deleted, and is the same in every process for the same definition.
+
+        Parameters:
+            module_name (str): The name of the module.
+
+        Returns:
+            str: The hex digest of the module.
+
+        Raises:
+            TypeError: If module_name is not a string.
+            ValueError: If no module with the given name exists.
+        """
+        module_hash = self._module_hashes.get(module_name)
+        if module_hash is not None:
+            return module_hash
+        if not isinstance(module_name, str):
+            raise TypeError("module_name must be a string")
+        if module_name not in self.hardware_library:
+            raise ValueError(f"No module with name {module_name} exists")
+
+        version = self.get_module_version(module_name)
+        module = self.hardware_library[module_name]
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(
+            repr(
+                sorted(
+                    (key, value)
+                    for key, value in module.items()
+                    if key != "internal_graph"
+                )
+            ).encode()
+        )
+        if module["internal_graph"] is not None:
+            graph = self.get_module_nx_graph(module_name)
+            digest.update(repr(list(graph.nodes(data=True))).encode())
+            digest.update(repr(list(graph.edges(data=True))).encode())
+        module_hash = digest.hexdigest()
+        with self._lock:
+            # The module may have changed while it was hashed
+            if self.get_module_version(module_name) == version:
+                self._module_hashes[module_name] = module_hash
+        return module_hash
+
+    def get_module_version(self, module_name):
+        """
+        Retrieves the number of times a module has been added, updated or deleted, so that callers
+        holding on to data derived from the module can tell whether it changed since.
+
+        Parameters:
+            module_name (str): The name of the module.
+
+        Returns:
+            int: The version of the module, 0 if it was never added, updated or deleted.
+        """
+        return self._module_versions.get(module_name, 0)
+
+    def _module_changed(self, module_name):
+        """
+        Records that a module was added, updated or deleted. Bumps its version and drops the cached
+        expansions and netlists of module_name and of every module that instantiates it, directly
+        or not.
 
         Args:
-        - folder_path - folder path to the basic block modules
+            module_name (str): The name of the module that was added, updated or deleted.
         """
-        # Go through all the files within the basic block folder with the .sv extension
-        verilog_files = [f for f in os.listdir(folder_path) if f.endswith(".sv")]
+        self._own_tables()
+        self._module_versions[module_name] = self.get_module_version(module_name) + 1
+        self._module_hashes.pop(module_name, None)
+        if not self._expanded_graphs and not self._module_netlists:
+            return
+        self._expanded_graphs.pop(module_name, None)
+        self._module_netlists.pop(module_name, None)
+        for dependent_name in self._dependent_module_names(module_name):
+            self._expanded_graphs.pop(dependent_name, None)
+            self._module_netlists.pop(dependent_name, None)
+
+    @_synchronized
+    def clone(self):
+        """
+        Copies the hardware library, and its connection library. The copy shares the module table
+        and the instantiation indexes with the original until either one changes them, so cloning
+        does not copy any module or internal graph.
+
+        Returns:
+            HardwareLibrary: The copy, which is not the singleton.
+        """
+        library = HardwareLibrary.__new__(HardwareLibrary)
+        library.connection_library = self.connection_library.clone()
+        library._lock = threading.RLock()
+        library.hardware_library = self.hardware_library
+        library._module_versions = self._module_versions
+        library._submodules = self._submodules
+        library._dependent_modules = self._dependent_modules
+        library._expanded_graphs = dict(self._expanded_graphs)
+        library._module_netlists = dict(self._module_netlists)
+        library._module_hashes = dict(self._module_hashes)
+        library._shared_tables = self._shared_tables = True
+        return library
 
-        for file_name in verilog_files:
-            module_name = ""
-            input_ports = {}
-            output_ports = {}
+    def _own_tables(self):
+        """
+        Copies the tables shared with clones of the library before they are changed. Modules,
+        internal graphs and index entries are immutable, so the tables are copied shallowly.
+        """
+        if not self._shared_tables:
+            return
+        self.hardware_library = dict(self.hardware_library)
+        self._module_versions = dict(self._module_versions)
+        self._submodules = dict(self._submodules)
+        self._dependent_modules = dict(self._dependent_modules)
+        self._shared_tables = False
 
-            # Read through each file in the basic block folder
-            with open(os.path.join(folder_path, file_name), "r") as file:
-                file_content = file.read()
+    def get_submodules(self, module_name, transitive=False):
+        """
+        Lists the modules a module instantiates, from the instantiation index kept up to date by
+        add_module, update_module and delete_module, without reading any internal graph.
 
-                # Find the module name
-                module_match = re.search(r"module\s+(\w+)\s*\(", file_content)
+        Parameters:
+            module_name (str): The name of the module.
+            transitive (bool): Also list the modules instantiated below the direct submodules.
+                Defaults to False.
 
-                if module_match:
-                    # isolate the module name
-                    module_name = module_match.group(1)
+        Returns:
+            dict: Maps every submodule to its number of instances in module_name, counting the
+                instances of the whole hierarchy when transitive is True (a module instantiated
+                twice in each of three instances counts 6). Input/output blocks are not listed.
 
-                    # Find all input and output ports using regular expressions
-                    input_matches = re.findall(
-                        r"input\s+(?:logic)?\s*(?:\[(\d+):\d+\])?\s*(?:\w+\s+)?(\w+)",
-                        file_content,
+        Raises:
+            ValueError: If transitive is True and modules instantiate each other in a cycle.
+        """
+        if not transitive:
+            return dict(self._submodules.get(module_name, {}))
+        # Instance counts of the hierarchy below every module met, each computed once
+        counts = {}
+
+        def count(parent_name, visiting):
+            if parent_name in counts:
+                return counts[parent_name]
+            if parent_name in visiting:
+                raise ValueError(
+                    "Modules instantiate each other in a cycle through " + parent_name
+                )
+            visiting.add(parent_name)
+            total = {}
+            for submodule_name, instance_count in self._submodules.get(
+                parent_name, {}
+            ).items():
+                total[submodule_name] = total.get(submodule_name, 0) + instance_count
+                for nested_name, nested_count in count(
+                    submodule_name, visiting
+                ).items():
+                    total[nested_name] = (
+                        total.get(nested_name, 0) + instance_count * nested_count
                     )
-                    output_matches = re.findall(
-                        r"output\s+(?:logic)?\s*(?:\[(\d+):\d+\])?\s*(?:\w+\s+)?(\w+)",
-                        file_content,
+            visiting.discard(parent_name)
+            counts[parent_name] = total
+            return total
+
+        return dict(count(module_name, set()))
+
+    def get_dependent_modules(self, module_name, transitive=False):
+        """
+        Lists the modules instantiating a module, from the instantiation index kept up to date by
+        add_module, update_module and delete_module, without reading any internal graph. These are
+        the modules to rebuild when module_name changes.
+
+        Parameters:
+            module_name (str): The name of the module.
+            transitive (bool): Also list the modules instantiating the direct dependents, and so
+                on. Defaults to False.
+
+        Returns:
+            dict: Maps every dependent module to its number of instances of module_name, counting
+                the instances of its whole hierarchy when transitive is True.
+
+        Raises:
+            ValueError: If transitive is True and modules instantiate each other in a cycle.
+        """
+        if not transitive:
+            return dict(self._dependent_modules.get(module_name, {}))
+        dependent_names = self._dependent_module_names(module_name)
+        # Instances of module_name below every dependent met, each computed once
+        counts = {}
+
+        def count(dependent_name, visiting):
+            if dependent_name in counts:
+                return counts[dependent_name]
+            if dependent_name in visiting:
+                raise ValueError(
+                    "Modules instantiate each other in a cycle through "
+                    + dependent_name
+                )
+            visiting.add(dependent_name)
+            total = 0
+            for submodule_name, instance_count in self._submodules[
+                dependent_name
+            ].items():
+                if submodule_name == module_name:
+                    total += instance_count
+                elif submodule_name in dependent_names:
+                    total += instance_count * count(submodule_name, visiting)
+            visiting.discard(dependent_name)
+            counts[dependent_name] = total
+            return total
+
+        for dependent_name in dependent_names:
+            count(dependent_name, set())
+        return counts
+
+    def _dependent_module_names(self, module_name):
+        """
+        Returns:
+            set: The names of every module instantiating module_name, directly or not.
+        """
+        dependent_names = set()
+        stack = [module_name]
+        while stack:
+            for dependent_name in self._dependent_modules.get(stack.pop(), ()):
+                if dependent_name not in dependent_names:
+                    dependent_names.add(dependent_name)
+                    stack.append(dependent_name)
+        return dependent_names
+
+    def _index_module(self, module_name):
+        """
+        Adds the instances of a module to the instantiation indexes.
+        """
+        internal_graph = self.hardware_library[module_name].get("internal_graph")
+        if internal_graph is None:
+            return
+        if isinstance(internal_graph, dict):
+            # Node-link data of a module loaded by from_json
+            module_names = (node["module_name"] for node in internal_graph["nodes"])
+        else:
+            module_names = (
+                instance_module_name
+                for _, instance_module_name in internal_graph.nodes(data="module_name")
+            )
+        submodules = {}
+        for submodule_name in module_names:
+            if submodule_name not in (
+                config["input_block_name"],
+                config["output_block_name"],
+            ):
+                submodules[submodule_name] = submodules.get(submodule_name, 0) + 1
+        self._submodules[module_name] = submodules
+        # Index entries are replaced rather than modified, as clones of the library may share them
+        for submodule_name, instance_count in submodules.items():
+            self._dependent_modules[submodule_name] = {
+                **self._dependent_modules.get(submodule_name, {}),
+                module_name: instance_count,
+            }
+
+    def _unindex_module(self, module_name):
+        """
+        Removes the instances of a module from the instantiation indexes. Modules instantiating
+        module_name keep their entries, which will point to it again if it is added back.
+        """
+        for submodule_name in self._submodules.pop(module_name, {}):
+            dependent_modules = {
+                dependent_name: instance_count
+                for dependent_name, instance_count in self._dependent_modules[
+                    submodule_name
+                ].items()
+                if dependent_name != module_name
+            }
+            if dependent_modules:
+                self._dependent_modules[submodule_name] = dependent_modules
+            else:
+                del self._dependent_modules[submodule_name]
+
+    def _rebuild_instantiation_index(self):
+        """
+        Rebuilds the instantiation indexes after the whole library was replaced.
+        """
+        self._submodules = {}
+        self._dependent_modules = {}
+        for module_name in self.hardware_library:
+            self._index_module(module_name)
+
+    @_synchronized
+    def _parse_basic_verilog_files(self, folder_path, cache_file=None):
+        """
+        Read the basic block folder and load the ports of every module declared in its .sv files into the hardware library
+
+        The ports found in each file are cached on disk with the file's modification time, size and
+        content hash. A file whose modification time and size are unchanged is not read again. The
+        other files are read and hashed, and only those whose content hash changed are parsed, in a
+        process pool when there are at least PARALLEL_PARSE_MIN_FILES of them.
+
+        Args:
+        - folder_path - folder path to the basic block modules
+        - cache_file - path of the cache file, defaults to basic_blocks.json in config["cache_path"]
+        """
+        if cache_file is None:
+            cache_file = os.path.join(config["cache_path"], "basic_blocks.json")
+        cache = self._read_basic_block_cache(cache_file)
+        cache_changed = False
+
+        # Go through all the files within the basic block folder with the .sv extension
+        verilog_files = [
+            os.path.abspath(os.path.join(folder_path, f))
+            for f in os.listdir(folder_path)
+            if f.endswith(".sv")
+        ]
+        file_stats = {}
+        changed_files = []
+        for file_path in verilog_files:
+            file_stat = os.stat(file_path)
+            file_stats[file_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+            entry = cache.get(file_path)
+            if (
+                entry is None
+                or (entry["mtime_ns"], entry["size"]) != file_stats[file_path]
+            ):
+                changed_files.append(file_path)
+
+        # Files whose content changed, with the hash and source of that content
+        stale_files = []
+        for file_path in changed_files:
+            content_hash, source = read_verilog_file(file_path)
+            entry = cache.get(file_path)
+            if entry is not None and entry["sha256"] == content_hash:
+                entry["mtime_ns"], entry["size"] = file_stats[file_path]
+                cache_changed = True
+            else:
+                stale_files.append((file_path, content_hash, source))
+
+        sources = [source for _, _, source in stale_files]
+        if len(sources) >= PARALLEL_PARSE_MIN_FILES and (
+            "fork" in multiprocessing.get_all_start_methods()
+        ):
+            # Forked workers do not re-import the __main__ script, unlike spawned ones
+            with ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                parsed_modules = list(
+                    executor.map(
+                        parse_verilog_modules,
+                        sources,
+                        chunksize=max(1, len(sources) // (4 * (os.cpu_count() or 1))),
                     )
+                )
+        else:
+            parsed_modules = [parse_verilog_modules(source) for source in sources]
 
-                    # Handle the case whether or not the port has a integer type width or a custom defined type
-                    for bit_width, port_name in input_matches:
-                        port_name = port_name.strip()
-                        if bit_width:
-                            bit_width = int(bit_width) + 1
-                        else:
-                            custom_type_match = re.search(
-                                r"input\s+(?:logic)?\s*\w+\s+(\w+)\s*" + port_name,
-                                file_content,
-                            )
-                            bit_width = (
-                                custom_type_match.group(1) if custom_type_match else 1
-                            )
-                        if isinstance(bit_width, str):
-                            self._check_ports_exist({port_name: bit_width})
-                        input_ports[port_name] = bit_width
-
-                    # Handle the case for output ports
-                    for bit_width, port_name in output_matches:
-                        port_name = port_name.strip()
-                        if bit_width:
-                            bit_width = int(bit_width) + 1
-                        else:
-                            custom_type_match = re.search(
-                                r"output\s+(?:logic)?\s*\w+\s+(\w+)\s*" + port_name,
-                                file_content,
-                            )
-                            bit_width = (
-                                custom_type_match.group(1) if custom_type_match else 1
-                            )
-                        if isinstance(bit_width, str):
-                            self._check_ports_exist({port_name: bit_width})
-                        output_ports[port_name] = bit_width
-            # Add the module to the hardware_library
-            self.hardware_library[module_name] = {
-                "input_ports": input_ports,
-                "output_ports": output_ports,
-                "basic_block": True,
-                "internal_graph": None,
+        for (file_path, content_hash, _), modules in zip(stale_files, parsed_modules):
+            mtime_ns, size = file_stats[file_path]
+            cache[file_path] = {
+                "mtime_ns": mtime_ns,
+                "size": size,
+                "sha256": content_hash,
+                "modules": modules,
             }
+            cache_changed = True
+        for file_path in list(cache):
+            if (
+                os.path.dirname(file_path) == os.path.abspath(folder_path)
+                and file_path not in file_stats
+            ):
+                del cache[file_path]
+                cache_changed = True
+
+        self._own_tables()
+        for file_path in verilog_files:
+            for module_name, input_ports, output_ports in cache[file_path]["modules"]:
+                # Port types that are not integer widths must be defined in the connection library
+                self._check_ports_exist(input_ports)
+                self._check_ports_exist(output_ports)
+
+                # Add the module to the hardware_library
+                self.hardware_library[module_name] = {
+                    "input_ports": input_ports,
+                    "output_ports": output_ports,
+                    "basic_block": True,
+                    "internal_graph": None,
+                }
+
+        if cache_changed:
+            self._write_basic_block_cache(cache_file, cache)
+
+    @staticmethod
+    def _read_basic_block_cache(cache_file):
+        """
+        Reads the basic block cache, returning an empty cache if it is missing, unreadable or
+        written in another format version.
+        """
+        try:
+            with open(cache_file, "r") as infile:
+                cache = json.load(infile)
+        except (OSError, ValueError):
+            return {}
+        if (
+            not isinstance(cache, dict)
+            or cache.get("version") != BASIC_BLOCK_CACHE_VERSION
+        ):
+            return {}
+        return cache["files"]
+
+    @staticmethod
+    def _write_basic_block_cache(cache_file, cache):
+        """
+        Writes the basic block cache atomically, so that concurrent startups never read a partial file.
+        A cache that cannot be written is skipped.
+        """
+        temporary_file = cache_file + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(temporary_file, "w") as outfile:
+                # json.dumps encodes in one C call, unlike json.dump which streams chunks
+                outfile.write(
+                    json.dumps({"version": BASIC_BLOCK_CACHE_VERSION, "files": cache})
+                )
+            os.replace(temporary_file, cache_file)
+        except OSError:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
 
     def _check_input_ports(self, input_ports: Dict[str, Union[str, int]]) -> None:
         """
@@ -275,7 +807,9 @@ class HardwareLibrary(metaclass=SingletonMeta):
 
         """
         for port, type in ports.items():
-            if isinstance(type, str) and not connection_library.check_port_exists(type):
+            if isinstance(type, str) and not self.connection_library.check_port_exists(
+                type
+            ):
                 raise ValueError(
                     f"Port with name {type} does not exist in the connection library."
                 )
@@ -352,17 +886,248 @@ class HardwareLibrary(metaclass=SingletonMeta):
             return True
 
     def to_json(self, filename):
+        hardware_library = {
+            module_name: {
+                **module,
+                "internal_graph": (
+                    nx.node_link_data(module["internal_graph"])
+                    if isinstance(module["internal_graph"], nx.Graph)
+                    else module["internal_graph"]
+                ),
+            }
+            for module_name, module in self.hardware_library.items()
+        }
         with open("generated_files/" + filename + ".json", "w") as outfile:
-            json.dump(self.hardware_library, outfile, indent=4)
+            json.dump(hardware_library, outfile, indent=4)
+
+    def dump_stream(self, file_path):
+        """
+        Writes the hardware library one record per module, followed by one record per node and
+        per edge of its internal graph, so memory use does not grow with the size of the library,
+        unlike to_json. See record_stream.write_records for the formats.
+
+        Args:
+            file_path (str): The path of the .jsonl, .jsonl.gz or .bin file.
+
+        Returns:
+            int: The number of records written.
+        """
+
+        def records():
+            for module_name, module in list(self.hardware_library.items()):
+                yield {
+                    "record": "module",
+                    "module_name": module_name,
+                    "input_ports": module["input_ports"],
+                    "output_ports": module["output_ports"],
+                    "basic_block": module["basic_block"],
+                }
+                if module["internal_graph"] is not None:
+                    yield from graph_records(
+                        self.get_module_nx_graph(module_name), module_name=module_name
+                    )
+
+        return write_records(file_path, records())
+
+    @_synchronized
+    def load_stream(self, file_path):
+        """
+        Replaces the content of the hardware library with a dump written by dump_stream, record by
+        record. Like from_json, the dump is not validated against the module sources.
+
+        Args:
+            file_path (str): The path of the .jsonl, .jsonl.gz or .bin file.
+
+        Raises:
+            ValueError: If a node or edge record does not follow the record of its module.
+        """
+        hardware_library = {}
+        module_name = None
+        internal_graph = None
+        for record in read_records(file_path):
+            if record["record"] == "module":
+                if internal_graph is not None:
+                    hardware_library[module_name]["internal_graph"] = nx.freeze(
+                        internal_graph
+                    )
+                module_name = record["module_name"]
+                internal_graph = None
+                hardware_library[module_name] = {
+                    "input_ports": record["input_ports"],
+                    "output_ports": record["output_ports"],
+                    "basic_block": record["basic_block"],
+                    "internal_graph": None,
+                }
+                continue
+            if record.get("module_name") != module_name or module_name is None:
+                raise ValueError(
+                    "Record of module "
+                    + str(record.get("module_name"))
+                    + " found outside of its module"
+                )
+            if internal_graph is None:
+                internal_graph = nx.DiGraph()
+            add_graph_record(internal_graph, record)
+        if internal_graph is not None:
+            hardware_library[module_name]["internal_graph"] = nx.freeze(internal_graph)
+
+        for changed_module_name in set(self.hardware_library) | set(hardware_library):
+            self._module_changed(changed_module_name)
+        self.hardware_library = hardware_library
+        self._rebuild_instantiation_index()
 
     @staticmethod
     def from_json(filename):
+        """
+        Replaces the content of the hardware library with a JSON dump written by to_json. The dump
+        is not validated against the module sources, see load_snapshot for a faster, validated load.
+        """
         with open(filename, "r") as infile:
             hw_dict = json.load(infile)
             library = HardwareLibrary()
+            for module_name in set(library.hardware_library) | set(hw_dict):
+                library._module_changed(module_name)
             library.hardware_library = hw_dict
+            library._rebuild_instantiation_index()
             return library
 
+    def save_snapshot(self, filename=None):
+        """
+        Saves the modules, ports and internal graphs of the hardware library, with the connection
+        library, to a binary snapshot that load_snapshot can restore.
+
+        The snapshot records the modification time, size and content hash of every .py, .sv and
+        module definition file and of connection_library.json under /hardware_modules, and is only
+        loaded while none of them changed, were added or were removed.
+
+        Parameters:
+            filename (str, optional): The path of the snapshot. Defaults to hardware_library.snapshot
+                in config["cache_path"].
+        """
+        if filename is None:
+            filename = os.path.join(config["cache_path"], "hardware_library.snapshot")
+        dependencies = {
+            file_path: (mtime_ns, size, self._file_hash(file_path))
+            for file_path, (mtime_ns, size) in self._snapshot_dependencies().items()
+        }
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "python_version": sys.version_info[:2],
+            "networkx_version": nx.__version__,
+            "dependencies": dependencies,
+        }
+        # Internal graphs are saved as plain networkx graphs, so that loading the snapshot does not
+        # depend on importing hdl_graph
+        payload = {
+            "hardware_library": {
+                module_name: {
+                    **module,
+                    "internal_graph": (
+                        nx.freeze(nx.DiGraph(module["internal_graph"]))
+                        if isinstance(module["internal_graph"], nx.Graph)
+                        else module["internal_graph"]
+                    ),
+                }
+                for module_name, module in self.hardware_library.items()
+            },
+            "connection_library": self.connection_library.connection_library,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        temporary_file = filename + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_file, "wb") as outfile:
+            pickle.dump(header, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(payload, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_file, filename)
+
+    @_synchronized
+    def load_snapshot(self, filename=None):
+        """
+        Replaces the content of the hardware library and the connection library with a snapshot
+        saved by save_snapshot, if the snapshot is still up to date with the module sources.
+
+        The snapshot is a pickle, so only snapshots written by this project should be loaded.
+
+        Parameters:
+            filename (str, optional): The path of the snapshot. Defaults to hardware_library.snapshot
+                in config["cache_path"].
+
+        Returns:
+            bool: True if the snapshot was loaded, False if it is missing, was written by another
+                version, or is out of date with the module sources.
+        """
+        if filename is None:
+            filename = os.path.join(config["cache_path"], "hardware_library.snapshot")
+        try:
+            infile = open(filename, "rb")
+        except OSError:
+            return False
+        with infile:
+            try:
+                header = pickle.load(infile)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                return False
+            if (
+                not isinstance(header, dict)
+                or header.get("version") != SNAPSHOT_VERSION
+                or header.get("python_version") != sys.version_info[:2]
+                or header.get("networkx_version") != nx.__version__
+            ):
+                return False
+
+            dependencies = self._snapshot_dependencies()
+            if set(dependencies) != set(header["dependencies"]):
+                return False
+            for file_path, (mtime_ns, size) in dependencies.items():
+                saved_mtime_ns, saved_size, saved_hash = header["dependencies"][
+                    file_path
+                ]
+                if (mtime_ns, size) != (saved_mtime_ns, saved_size) and (
+                    size != saved_size or self._file_hash(file_path) != saved_hash
+                ):
+                    return False
+
+            payload = pickle.load(infile)
+
+        for module_name in set(self.hardware_library) | set(
+            payload["hardware_library"]
+        ):
+            self._module_changed(module_name)
+        self.hardware_library = payload["hardware_library"]
+        self._rebuild_instantiation_index()
+        self.connection_library.connection_library = payload["connection_library"]
+        return True
+
+    @staticmethod
+    def _snapshot_dependencies():
+        """
+        Lists the module sources a snapshot depends on.
+
+        Returns:
+            dict: Maps the path of every .py, .sv and module definition file and of
+                connection_library.json under /hardware_modules to its (modification time in ns,
+                size).
+        """
+        # module_definitions imports this module, so it is only imported when it is needed
+        from module_definitions import DEFINITION_SUFFIXES
+
+        dependencies = {}
+        for root, dirs, files in os.walk(config["path"] + "/hardware_modules"):
+            dirs.sort()
+            for file_name in sorted(files):
+                if file_name.endswith((".py", ".sv") + DEFINITION_SUFFIXES) or (
+                    file_name == "connection_library.json"
+                ):
+                    file_path = os.path.join(root, file_name)
+                    file_stat = os.stat(file_path)
+                    dependencies[file_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+        return dependencies
+
+    @staticmethod
+    def _file_hash(file_path):
+        with open(file_path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
     def _check_ports_overlap(self, input_ports, output_ports):
         """
         Check if the keys in input_ports and output_ports overlap.
@@ -1,7 +1,5 @@
 import os
-import string
 import random
-import string
 import networkx as nx
 import json
 from config import config
@@ -12,20 +10,45 @@ from config import config
 from pyvis.network import Network
 from bs4 import BeautifulSoup
 from jinja2 import Environment, FileSystemLoader
-import secrets
 import file_output_loader
+from netlist import (
+    Netlist,
+    port_connection_pairs,
+    add_port_connection,
+    copy_port_connections,
+)
+from compact_netlist import CompactNetlist
+from module_index import ModuleIndex
+from record_stream import write_records, read_records, graph_records, add_graph_record
+from library_context import (
+    active_hardware_library,
+    in_context,
+)
 
-hardware_library = HardwareLibrary()
+# The hardware library of the active library context, see library_context
+hardware_library = active_hardware_library
+# Scripts defining the non-basic modules, run when one of their modules is first used
+module_index = ModuleIndex(config["path"] + "/hardware_modules")
 
 
 class HDLGraph(nx.DiGraph):
+    # Netlist of the graph, built on first use by the netlist property
+    _netlist = None
+    # Ports of the input/output blocks, set by add_input_output
+    _input_output_ports = {}
+    # Set to True on the graph by networkx.freeze, see _check_not_frozen
+    frozen = False
+
     @classmethod
+    @in_context
     def from_hardware_library_module(HDLGraph, module_name: str) -> "HDLGraph":
         """
         Creates an instance of HDLGraph from a hardware library module.
 
         Parameters:
             module_name (str): The name of the module in the hardware library.
+            context (LibraryContext, optional): The library context to read the module from.
+                Defaults to the active context.
 
         Returns:
             HDLGraph: An instance of HDLGraph representing the specified hardware library module.
@@ -33,112 +56,118 @@ class HDLGraph(nx.DiGraph):
         Raises:
             ValueError: If the module with the given name does not exist in the hardware library.
         """
-        module_graph = hardware_library.get_module_nx_graph(module_name)
+        module_graph = hardware_library.get_module_nx_graph(module_name, mutable=True)
+        if isinstance(module_graph, HDLGraph):
+            return module_graph
         return HDLGraph(module_graph)
 
     @classmethod
-    def return_expanded_graph(HDLGraph, top_module_name):
-        module_graph = hardware_library.get_module_nx_graph(top_module_name)
-        for node in module_graph.nodes():
-            if node == "INPUT_BLOCK" or node == "OUTPUT_BLOCK":
-                continue
-            else:
-                module_name = module_graph.nodes[node]["module_name"]
-                if not hardware_library[module_name]["basic_block"]:
-                    # print(node)
-                    # return expanded hdl graph
-                    expanded_node_graph = HDLGraph.return_expanded_graph(
-                        top_module_name=module_name
-                    )
-                    # union together
-                    module_graph = nx.union(
-                        module_graph, expanded_node_graph, rename=("", node + "__")
-                    )
-                    expanded_outputs = module_graph.in_edges(
-                        node + "__OUTPUT_BLOCK", data=True
-                    )
-                    # print("-----")
-                    # print(module_graph.out_edges(node + "__INPUT_BLOCK", data=True))
-                    expanded_inputs = module_graph.out_edges(
-                        node + "__INPUT_BLOCK", data=True
-                    )
-                    # print("-----")
-                    # print(module_graph.in_edges(node + "__OUTPUT_BLOCK", data=True))
-                    for (
-                        source_module,
-                        destination_module,
-                        data,
-                    ) in module_graph.out_edges(node, data=True):
-                        for source, destination in data["port_connections"].items():
-                            # print(source)
-                            # print(destination)
-                            for (
-                                expanded_source,
-                                expanded_destination,
-                                data,
-                            ) in expanded_outputs:
-                                # print(data["port_connections"])
-                                for key, value in data["port_connections"].items():
-                                    if source == value:
-                                        # print(
-                                        #     expanded_source
-                                        #     + " "
-                                        #     + key
-                                        #     + " "
-                                        #     + destination_module
-                                        #     + " "
-                                        #     + destination
-                                        # )
-                                        module_graph.add_edge(
-                                            expanded_source,
-                                            destination_module,
-                                            port_connections={key: destination},
-                                        )
-                    for (
-                        source_module,
-                        destination_module,
-                        data,
-                    ) in module_graph.in_edges(node, data=True):
-                        for source, destination in data["port_connections"].items():
-                            # print(source)
-                            # print(destination)
-                            for (
-                                expanded_source,
-                                expanded_destination,
-                                data,
-                            ) in expanded_inputs:
-                                # print(data["port_connections"])
-                                for key, value in data["port_connections"].items():
-                                    if destination == key:
-                                        # print(
-                                        #     expanded_destination
-                                        #     + " "
-                                        #     + value
-                                        #     + " "
-                                        #     + source_module
-                                        #     + " "
-                                        #     + source
-                                        # )
-                                        module_graph.add_edge(
-                                            source_module,
-                                            expanded_destination,
-                                            port_connections={source: value},
-                                        )
-
-                    module_graph.remove_node(node)
-                    module_graph.remove_node(node + "__INPUT_BLOCK")
-                    module_graph.remove_node(node + "__OUTPUT_BLOCK")
-        nodes_to_delete = [
-            node for node in module_graph if module_graph.degree(node) == 0
-        ]
-        module_graph.remove_nodes_from(nodes_to_delete)
+    @in_context
+    def return_expanded_graph(
+        HDLGraph, top_module_name, unmatched_ports="ignore", compact=False
+    ):
+        """
+        Expands a hardware library module all the way down to its basic blocks.
 
-        return HDLGraph(module_graph)
+        Every distinct module in the hierarchy is expanded once into a template whose instance
+        names are not prefixed by any parent, and cached in the hardware library. Each instance of
+        a non-basic module is then stamped from its template with its hierarchical prefix
+        (instance names joined by "__") and wired in place of the instance node through the
+        template's port index. Cached templates are dropped when the module or one of its
+        submodules is added, updated or deleted.
+
+        A boundary port is unmatched when an instance port is connected outside the instance but
+        has nothing connected to it inside the module, so the connection cannot be carried into
+        the expanded graph.
+
+        Parameters:
+            top_module_name (str): The name of the module in the hardware library to expand.
+            unmatched_ports (str): What to do with unmatched boundary ports. "ignore" drops them,
+                "report" lists them as (instance_name, port_name) tuples in the "unmatched_ports"
+                graph attribute of the expanded graph, and "raise" raises a ValueError listing them.
+                Defaults to "ignore".
+            compact (bool): Return the expanded graph as a CompactNetlist, which takes a fraction of
+                the memory of an HDLGraph for large designs. Defaults to False.
+            context (LibraryContext, optional): The library context to read the modules from.
+                Defaults to the active context.
+
+        Returns:
+            HDLGraph: The expanded graph, composed only of basic blocks and the top level
+                input/output blocks, or its CompactNetlist if compact is True.
+
+        Raises:
+            ValueError: If a module in the hierarchy does not exist in the hardware library,
+                if unmatched_ports is not a valid mode, or if unmatched_ports is "raise" and
+                some boundary ports are unmatched.
+        """
+        if unmatched_ports not in ("ignore", "report", "raise"):
+            raise ValueError(
+                '"unmatched_ports" variable needs to be either "ignore", "report" or "raise"'
+            )
+        template = _expanded_module_template(top_module_name)
+        if unmatched_ports == "raise" and template["unmatched_ports"]:
+            raise ValueError(
+                "Unmatched boundary ports while expanding "
+                + top_module_name
+                + ": "
+                + ", ".join(
+                    instance_name + "." + port_name
+                    for instance_name, port_name in template["unmatched_ports"]
+                )
+            )
+
+        if compact:
+            expanded_graph = CompactNetlist.from_graph(template["graph"])
+        else:
+            expanded_graph = _hdl_graph_from_template(template)
+        if unmatched_ports == "report":
+            expanded_graph.graph["unmatched_ports"] = list(template["unmatched_ports"])
+
+        return expanded_graph
+
+    @classmethod
+    def expanded_view(
+        HDLGraph,
+        top_module_name,
+        max_depth=None,
+        open_instances=None,
+        expand_module=None,
+    ):
+        """
+        Creates a lazy, partially expanded view of a hardware library module.
+
+        Nothing is expanded until the nodes or edges of the view are first accessed, and only the
+        instances allowed by every given policy argument are expanded. The view can be passed
+        anywhere an HDLGraph is read, such as file_output_loader.generate_verilog and
+        file_output_loader.display_verilog.
+
+        Parameters:
+            top_module_name (str): The name of the module in the hardware library to expand.
+            max_depth (int, optional): How many levels of the hierarchy below the top module to
+                expand. 0 leaves the top module as is. Defaults to None, for no limit.
+            open_instances (set, optional): Hierarchical instance names (instance names joined by "__")
+                to expand. The parents of an instance are expanded along with it.
+                Defaults to None, for every instance.
+            expand_module (callable, optional): A predicate called with a module name, returning
+                whether instances of that module are expanded. Defaults to None, for every module.
+
+        Returns:
+            HDLGraphExpansionView: The lazy view of the expanded module.
+        """
+        return HDLGraphExpansionView(
+            top_module_name,
+            max_depth=max_depth,
+            open_instances=open_instances,
+            expand_module=expand_module,
+        )
 
     def add_hardware_node(self, instance_name, module_name, **attr):
         """
         Adds a node to the hardware library.
 
+        If the module is not in the hardware library yet, the script defining it under
+        /hardware_modules is run first, see module_index.
+
         Args:
             instance_name (str): The name of the instance to be added.
             module_name (str): The name of the module associated with the instance.
@@ -151,10 +180,11 @@ class HDLGraph(nx.DiGraph):
             ValueError: If the specified module does not exist in the hardware library.
 
         """
+        self._check_not_frozen()
         if hardware_library.verify_module_exists(module_name=module_name):
             return super().add_node(instance_name, module_name=module_name, **attr)
         else:
-            run_python_file("/hardware_modules/non_basic_blocks/" + module_name + ".py")
+            module_index.load(module_name, globals())
             if hardware_library.verify_module_exists(module_name=module_name):
                 return super().add_node(instance_name, module_name=module_name, **attr)
             else:
@@ -164,6 +194,194 @@ class HDLGraph(nx.DiGraph):
                     + " does not exist in the hardware library. Check if the associated file within /hardware_modules folder is correct."
                 )
 
+    def add_hardware_nodes_from(self, nodes, **attr):
+        """
+        Adds several nodes to the graph at once, like calling add_hardware_node on each of them.
+
+        Every module is looked up once, and no node is added unless every module exists.
+
+        Args:
+            nodes (iterable): (instance_name, module_name) tuples, or (instance_name, module_name, dict)
+                tuples whose dictionary holds attributes for that node only.
+            **attr: Additional attributes to be assigned to every node.
+
+        Raises:
+            ValueError: Listing every module that does not exist in the hardware library.
+        """
+        self._check_not_frozen()
+        nodes = [tuple(node) for node in nodes]
+        missing_modules = []
+        for module_name in dict.fromkeys(node[1] for node in nodes):
+            if hardware_library.verify_module_exists(module_name=module_name):
+                continue
+            module_index.load(module_name, globals())
+            if not hardware_library.verify_module_exists(module_name=module_name):
+                missing_modules.append(module_name)
+        if missing_modules:
+            raise ValueError(
+                "Modules of name "
+                + ", ".join(missing_modules)
+                + " do not exist in the hardware library. Check if the associated files within /hardware_modules folder are correct."
+            )
+
+        super().add_nodes_from(
+            (
+                node[0],
+                {**attr, **(node[2] if len(node) > 2 else {}), "module_name": node[1]},
+            )
+            for node in nodes
+        )
+
+    def add_connections_from(self, connections):
+        """
+        Adds several edges to the graph at once, like calling add_edge on each of them in order.
+
+        The whole batch is validated in a single pass against the port tables of the modules
+        involved before anything is added, so either every connection is added or none is, and
+        the resulting graph is identical to the one built with add_edge.
+
+        Args:
+            connections (iterable): (source_instance_name, destination_instance_name, port_connections)
+                tuples, optionally followed by a dictionary of additional edge attributes.
+
+        Raises:
+            ValueError: Listing every invalid connection of the batch, one per line, with the
+                messages add_edge would raise.
+        """
+        self._check_not_frozen()
+        netlist = self.netlist
+        port_tables = {}
+        errors = []
+        edges = {}
+        new_connections = []
+        driven_ports = set()
+        for connection in connections:
+            source_instance_name, destination_instance_name, port_connections = (
+                connection[:3]
+            )
+            if source_instance_name not in self._node:
+                errors.append(source_instance_name + " not instantiated as a node")
+                continue
+            if destination_instance_name not in self._node:
+                errors.append(destination_instance_name + " not instantiated as a node")
+                continue
+            source_module_name = self._node[source_instance_name]["module_name"]
+            destination_module_name = self._node[destination_instance_name][
+                "module_name"
+            ]
+            for module_name in (source_module_name, destination_module_name):
+                if module_name not in port_tables:
+                    try:
+                        port_tables[module_name] = self._module_ports(module_name)
+                    except ValueError:
+                        port_tables[module_name] = None
+            if port_tables[source_module_name] is None:
+                errors.append(source_module_name + " not found in hardware_library")
+                continue
+            if port_tables[destination_module_name] is None:
+                errors.append(
+                    destination_module_name + " not found in hardware_library"
+                )
+                continue
+            output_ports = port_tables[source_module_name][1]
+            input_ports = port_tables[destination_module_name][0]
+
+            edge = (source_instance_name, destination_instance_name)
+            if edge not in edges:
+                edges[edge] = {}
+            if len(connection) > 3:
+                edges[edge].update(connection[3])
+
+            for source_port, destination_port in port_connection_pairs(
+                port_connections
+            ):
+                if source_port not in output_ports:
+                    errors.append(
+                        source_port + " not found in " + source_module_name + " module"
+                    )
+                elif destination_port not in input_ports:
+                    errors.append(
+                        destination_port
+                        + " not found in "
+                        + destination_module_name
+                        + " module"
+                    )
+                elif output_ports[source_port] != input_ports[destination_port]:
+                    errors.append(
+                        source_port
+                        + " in "
+                        + source_module_name
+                        + " and "
+                        + destination_port
+                        + " in "
+                        + destination_module_name
+                        + " do not have matching port types."
+                    )
+                elif (
+                    destination_instance_name,
+                    destination_port,
+                ) in driven_ports or netlist.is_driven(
+                    destination_instance_name, destination_port
+                ):
+                    errors.append(
+                        destination_port
+                        + " in "
+                        + destination_instance_name
+                        + " is already driven by another signal"
+                    )
+                else:
+                    driven_ports.add((destination_instance_name, destination_port))
+                    new_connections.append(
+                        (
+                            source_instance_name,
+                            source_port,
+                            destination_instance_name,
+                            destination_port,
+                        )
+                    )
+        if errors:
+            raise ValueError(
+                str(len(errors)) + " invalid connections:\n" + "\n".join(errors)
+            )
+
+        for (source_instance_name, destination_instance_name), attr in edges.items():
+            attr["port_connections"] = (
+                self._succ[source_instance_name][destination_instance_name][
+                    "port_connections"
+                ]
+                if self.has_edge(source_instance_name, destination_instance_name)
+                else {}
+            )
+        for (
+            source_instance_name,
+            source_port,
+            destination_instance_name,
+            destination_port,
+        ) in new_connections:
+            add_port_connection(
+                edges[(source_instance_name, destination_instance_name)][
+                    "port_connections"
+                ],
+                source_port,
+                destination_port,
+            )
+            netlist.add_connection(
+                source_instance_name,
+                source_port,
+                destination_instance_name,
+                destination_port,
+            )
+        nx.DiGraph.add_edges_from(
+            self,
+            (
+                (source_instance_name, destination_instance_name, attr)
+                for (
+                    source_instance_name,
+                    destination_instance_name,
+                ), attr in edges.items()
+            ),
+        )
+
     def add_edge(
         self,
         source_instance_name,
@@ -193,6 +411,7 @@ class HDLGraph(nx.DiGraph):
             verifies the validity of the input connections.
 
         """
+        self._check_not_frozen()
 
         if not self.has_node(source_instance_name):
             raise ValueError(source_instance_name + " not instantiated as a node")
@@ -209,32 +428,24 @@ class HDLGraph(nx.DiGraph):
         else:
             current_port_connections = {}
 
-        for source_port, destination_port in port_connections.items():
-            if not hardware_library.verify_port_exists(
-                source_module_name,
-                source_port,
-                "output",
-            ):
+        new_connections = list(port_connection_pairs(port_connections))
+        destination_ports = set()
+        if new_connections:
+            output_ports = self._module_ports(source_module_name)[1]
+            input_ports = self._module_ports(destination_module_name)[0]
+        for source_port, destination_port in new_connections:
+            if source_port not in output_ports:
                 raise ValueError(
                     source_port + " not found in " + source_module_name + " module"
                 )
-            if not hardware_library.verify_port_exists(
-                destination_module_name,
-                destination_port,
-                "input",
-            ):
+            if destination_port not in input_ports:
                 raise ValueError(
                     destination_port
                     + " not found in "
                     + destination_module_name
                     + " module"
                 )
-            if not hardware_library.verify_port_type(
-                source_module_name,
-                destination_module_name,
-                source_port,
-                destination_port,
-            ):
+            if output_ports[source_port] != input_ports[destination_port]:
                 raise ValueError(
                     source_port
                     + " in "
@@ -245,8 +456,10 @@ class HDLGraph(nx.DiGraph):
                     + destination_module_name
                     + " do not have matching port types."
                 )
-            if not self._verify_already_driven_ports(
-                destination_instance_name, destination_port
+            if destination_port in destination_ports or not (
+                self._verify_already_driven_ports(
+                    destination_instance_name, destination_port
+                )
             ):
                 raise ValueError(
                     destination_port
@@ -254,7 +467,17 @@ class HDLGraph(nx.DiGraph):
                     + destination_instance_name
                     + " is already driven by another signal"
                 )
-            current_port_connections[source_port] = destination_port
+            destination_ports.add(destination_port)
+
+        for source_port, destination_port in new_connections:
+            add_port_connection(current_port_connections, source_port, destination_port)
+            if self._netlist is not None:
+                self._netlist.add_connection(
+                    source_instance_name,
+                    source_port,
+                    destination_instance_name,
+                    destination_port,
+                )
 
         super().add_edge(
             source_instance_name,
@@ -266,31 +489,32 @@ class HDLGraph(nx.DiGraph):
     def add_input_output(
         self, input_ports, output_ports, input_connections, output_connections
     ):
+        """
+        Adds the input and output blocks of a module to its internal graph and connects them.
+
+        The input block drives the declared input ports of the module and the output block is driven
+        on its declared output ports. Their connections are validated against those declarations,
+        kept with the graph, without registering anything in the hardware library.
+
+        Args:
+            input_ports (dict): The input ports of the module and their types.
+            output_ports (dict): The output ports of the module and their types.
+            input_connections (dict): Maps each input port to the list of (instance_name, port_name) it drives.
+            output_connections (dict): Maps each output port to the (instance_name, port_name) driving it.
+
+        Raises:
+            ValueError: If a connection is invalid, see add_edge.
+        """
+        self._check_not_frozen()
         input_block_name = config["input_block_name"]
         output_block_name = config["output_block_name"]
-        alphabet = string.ascii_letters + string.digits
-        temp_output_module_id = (
-            output_block_name
-            + "_"
-            + "".join(secrets.choice(alphabet) for _ in range(8))
-        )
-        temp_input_module_id = (
-            input_block_name + "_" + "".join(secrets.choice(alphabet) for _ in range(8))
-        )
+        self._input_output_ports = {
+            input_block_name: ({}, input_ports),
+            output_block_name: (output_ports, {}),
+        }
 
-        hardware_library.add_module(
-            module_name=temp_output_module_id, input_ports=output_ports, output_ports={}
-        )
-        hardware_library.add_module(
-            module_name=temp_input_module_id, input_ports={}, output_ports=input_ports
-        )
-
-        self.add_hardware_node(
-            module_name=temp_input_module_id, instance_name=input_block_name
-        )
-        self.add_hardware_node(
-            module_name=temp_output_module_id, instance_name=output_block_name
-        )
+        super().add_node(input_block_name, module_name=input_block_name)
+        super().add_node(output_block_name, module_name=output_block_name)
 
         for input_port, connections in input_connections.items():
             for module, port in connections:
@@ -303,40 +527,962 @@ class HDLGraph(nx.DiGraph):
                 module, output_block_name, port_connections={port: output_port}
             )
 
-        hardware_library.delete_module(module_name=temp_input_module_id)
-        hardware_library.delete_module(module_name=temp_output_module_id)
+    def _module_ports(self, module_name):
+        """
+        Looks up the ports of a module, or of the input/output blocks added by add_input_output.
+
+        Returns:
+            tuple: The dictionaries of input ports and output ports of the module, mapping their
+                names to their types.
 
-        self.nodes[input_block_name]["module_name"] = input_block_name
-        self.nodes[output_block_name]["module_name"] = output_block_name
+        Raises:
+            ValueError: If the module does not exist in the hardware library.
+        """
+        if module_name in self._input_output_ports:
+            return self._input_output_ports[module_name]
+        library = hardware_library.get_hardware_library()
+        if module_name not in library:
+            raise ValueError(module_name + " not found in hardware_library")
+        return library[module_name]["input_ports"], library[module_name]["output_ports"]
 
     def _verify_already_driven_ports(self, instance_name, port_name):
         if not self.has_node(instance_name):
             raise ValueError(instance_name + " not instantiated in hardware library")
 
-        # Find incoming edges to a node and access edge data
-        incoming_edges = self.in_edges(instance_name, data=True)
+        return not self.netlist.is_driven(instance_name, port_name)
 
-        # Iterate over incoming edges and access edge data
-        for edge in incoming_edges:
-            source_node, target_node, edge_data = edge
-            port_connections = edge_data["port_connections"]
-            if port_name in port_connections.values():
-                return False
+    @property
+    def netlist(self):
+        """
+        The Netlist of the graph, indexing its connections by net. Its input port index is the set
+        of driven ports of every instance, used to reject a second driver in constant time.
 
-        return True
+        It is built from the edges the first time it is used, then kept up to date by add_edge,
+        set_port_connections, remove_edge(s_from), remove_node(s_from) and the flattening routines.
+        Adding edges with add_edges_from rebuilds it on next use. The "port_connections" of an edge
+        must not be changed in place, which would leave it stale; use set_port_connections instead.
+        It must not be modified.
+        """
+        if self._netlist is None:
+            self._netlist = Netlist.from_graph(self)
+        return self._netlist
+
+    def _check_not_frozen(self):
+        """
+        Raises the error of networkx.freeze if the graph is frozen, such as the graphs kept by the
+        hardware library. The methods of HDLGraph modify the graph through nx.DiGraph, which
+        networkx.freeze does not guard, so each of them calls this first.
+
+        Raises:
+            networkx.NetworkXError: If the graph is frozen.
+        """
+        if nx.is_frozen(self):
+            raise nx.NetworkXError("Frozen graph can't be modified")
+
+    def set_port_connections(self, u, v, port_connections):
+        """
+        Replaces the "port_connections" of an edge, keeping the netlist up to date. The new
+        connections are validated like in add_edge, and the edge is left unchanged if one of them
+        is invalid.
+
+        Args:
+            u (str): The name of the source instance.
+            v (str): The name of the destination instance.
+            port_connections (dict): A dictionary mapping source ports to destination ports.
+
+        Raises:
+            ValueError: If there is no edge from u to v.
+            ValueError: If a connection is invalid, see add_edge.
+        """
+        self._check_not_frozen()
+        if not self.has_edge(u, v):
+            raise ValueError("No edge from " + u + " to " + v)
+        current_port_connections = self._succ[u][v]["port_connections"]
+        self._reconnect_edge(u, v, {})
+        try:
+            self.add_edge(u, v, port_connections=port_connections)
+        except ValueError:
+            self._reconnect_edge(u, v, current_port_connections)
+            raise
+
+    def _reconnect_edge(self, u, v, port_connections):
+        """
+        Replaces the "port_connections" of an edge without the add_edge checks. If the netlist was
+        built, the connections the edge loses are removed from it and the ones it gains are added,
+        so the connections it keeps stay in place.
+        """
+        self._check_not_frozen()
+        data = self._succ[u][v]
+        if self._netlist is not None:
+            kept_connections = set(port_connection_pairs(port_connections))
+            removed_connections = {}
+            for source_port, destination_port in port_connection_pairs(
+                data["port_connections"]
+            ):
+                if (source_port, destination_port) not in kept_connections:
+                    add_port_connection(
+                        removed_connections, source_port, destination_port
+                    )
+            self._disconnect_edge(u, v, removed_connections)
+            _add_to_netlist(self, u, v, port_connections)
+        data["port_connections"] = port_connections
+
+    def _disconnect_edge(self, u, v, port_connections):
+        """
+        Removes the connections of a removed edge from the netlist, if it was built.
+        """
+        if self._netlist is None:
+            return
+        for source_port, destination_port in port_connection_pairs(port_connections):
+            self._netlist.remove_connection(u, source_port, v, destination_port)
+
+    def remove_edge(self, u, v):
+        self._check_not_frozen()
+        port_connections = self.succ.get(u, {}).get(v, {}).get("port_connections", {})
+        super().remove_edge(u, v)
+        self._disconnect_edge(u, v, port_connections)
+
+    def remove_edges_from(self, ebunch):
+        self._check_not_frozen()
+        removed_edges = []
+        for edge in ebunch:
+            u, v = edge[:2]
+            if self.has_edge(u, v):
+                removed_edges.append((u, v, self[u][v].get("port_connections", {})))
+        super().remove_edges_from(removed_edges)
+        for u, v, port_connections in removed_edges:
+            self._disconnect_edge(u, v, port_connections)
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        self._check_not_frozen()
+        super().add_edges_from(ebunch_to_add, **attr)
+        self._netlist = None
+
+    def remove_node(self, n):
+        self._check_not_frozen()
+        super().remove_node(n)
+        if self._netlist is not None:
+            self._netlist.remove_instance(n)
+
+    def remove_nodes_from(self, nodes):
+        self._check_not_frozen()
+        nodes = list(nodes)
+        super().remove_nodes_from(nodes)
+        if self._netlist is not None:
+            for n in nodes:
+                self._netlist.remove_instance(n)
+
+    def clear(self):
+        self._check_not_frozen()
+        super().clear()
+        self._netlist = None
+
+    def clear_edges(self):
+        self._check_not_frozen()
+        super().clear_edges()
+        self._netlist = None
 
     def to_json(self, filename):
         with open("generated_files/" + filename + ".json", "w") as outfile:
             json.dump(nx.node_link_data(self), outfile, indent=4)
 
+    def dump_stream(self, file_path):
+        """
+        Writes the graph one record per node and per edge, so memory use does not grow with the
+        size of the graph, unlike to_json. See record_stream.write_records for the formats.
+
+        Args:
+            file_path (str): The path of the .jsonl, .jsonl.gz or .bin file.
+
+        Returns:
+            int: The number of records written.
+        """
+        return write_records(file_path, graph_records(self))
+
+    @classmethod
+    def load_stream(HDLGraph, file_path):
+        """
+        Reads a graph written by dump_stream, record by record. The nodes and edges are not
+        validated against the hardware library.
+
+        Args:
+            file_path (str): The path of the .jsonl, .jsonl.gz or .bin file.
+
+        Returns:
+            HDLGraph: The graph.
+        """
+        hdl_graph = HDLGraph()
+        for record in read_records(file_path):
+            add_graph_record(hdl_graph, record)
+        return hdl_graph
+
+
+class HDLGraphExpansionView:
+    """
+    A lazy view of a hardware library module expanded according to an expansion policy.
+    Created with HDLGraph.expanded_view.
+
+    The view is materialized into an HDLGraph the first time its nodes or edges are accessed,
+    and every HDLGraph attribute is read from that graph. Later changes to the hardware library
+    are not reflected in an already materialized view.
+    """
+
+    def __init__(
+        self, top_module_name, max_depth=None, open_instances=None, expand_module=None
+    ):
+        if not isinstance(top_module_name, str):
+            raise TypeError("top_module_name must be a string")
+        if max_depth is not None and (not isinstance(max_depth, int) or max_depth < 0):
+            raise ValueError("max_depth must be an integer greater than or equal to 0")
+
+        self.top_module_name = top_module_name
+        self.max_depth = max_depth
+        self.open_instances = (
+            set(open_instances) if open_instances is not None else None
+        )
+        self.expand_module = expand_module
+        self._graph = None
+
+    def materialize(self):
+        """
+        Expands the module according to the expansion policy, if it was not done already.
+
+        Returns:
+            HDLGraph: The expanded graph backing the view.
+        """
+        if self._graph is None:
+            self._graph = _hdl_graph_from_template(
+                self._expanded_module(self.top_module_name, "", 0)
+            )
+        return self._graph
+
+    def is_materialized(self):
+        return self._graph is not None
+
+    def expands(self, instance_name, module_name, depth):
+        """
+        Checks whether the expansion policy expands an instance of a non-basic module.
+
+        Args:
+            instance_name (str): The hierarchical name of the instance.
+            module_name (str): The name of the module of the instance.
+            depth (int): The depth of the instance, 1 for instances of the top module.
+
+        Returns:
+            bool: True if the instance is expanded, False otherwise.
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        if self.open_instances is not None and not any(
+            open_instance == instance_name
+            or open_instance.startswith(instance_name + "__")
+            for open_instance in self.open_instances
+        ):
+            return False
+        if self.expand_module is not None and not self.expand_module(module_name):
+            return False
+        return True
+
+    def _expanded_module(self, module_name, prefix, depth):
+        """
+        Expands a module according to the expansion policy.
+
+        Args:
+            module_name (str): The name of the module to expand.
+            prefix (str): The hierarchical prefix of the instance being expanded.
+            depth (int): The depth of the instance being expanded, 0 for the top module.
+
+        Returns:
+            dict: The expanded module, with the same keys as the templates cached by
+                HardwareLibrary.set_expanded_graph.
+        """
+        if (
+            self.max_depth is None
+            and self.open_instances is None
+            and self.expand_module is None
+        ):
+            return _expanded_module_template(module_name)
+
+        def submodule_template(instance_name, submodule_name):
+            if not self.expands(prefix + instance_name, submodule_name, depth + 1):
+                return None
+            return self._expanded_module(
+                submodule_name, prefix + instance_name + "__", depth + 1
+            )
+
+        return _expand_module(module_name, submodule_template)
+
+    def __getattr__(self, name):
+        if name == "_graph" or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
 
-def run_python_file(filename):
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = script_dir + filename
+    def __contains__(self, node):
+        return node in self.materialize()
 
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"The file '{filename}' does not exist.")
+    def __getitem__(self, node):
+        return self.materialize()[node]
+
+
+class IncrementalExpansion:
+    """
+    Keeps the expansion of a hardware library module up to date as the hardware library changes.
+
+    The module is first expanded like HDLGraph.return_expanded_graph, and every expanded instance
+    is tracked along with the module it came from. refresh() then patches the expanded graph in
+    place: only the instances of the modules that were added, updated or deleted since are
+    re-stamped, and they are rewired through the unchanged modules around them. The patched graph
+    has the same nodes, edges and port connections as a full expansion, although its nodes can be
+    in a different order.
+    """
+
+    def __init__(self, top_module_name):
+        if not isinstance(top_module_name, str):
+            raise TypeError("top_module_name must be a string")
+
+        self.top_module_name = top_module_name
+        self._expand()
+
+    def _expand(self):
+        """
+        Expands the top module from scratch and starts tracking every module below it.
+        """
+        template = _expanded_module_template(self.top_module_name)
+        self.graph = _hdl_graph_from_template(template)
+        self.instances = {}
+        self._instance_children = {"": set()}
+        self._instance_nodes = {"": set()}
+        self._module_graphs = {}
+        self._module_netlists = {}
+        self._module_versions = {}
+        self._add_instances("", template["instances"])
+        self._add_nodes(self.graph.nodes())
+        self._track_modules({self.top_module_name} | template["submodules"])
+
+    def _track_modules(self, module_names):
+        """
+        Records the current version of each module.
+        """
+        for module_name in module_names:
+            self._module_versions[module_name] = hardware_library.get_module_version(
+                module_name
+            )
+            self._module_graphs.pop(module_name, None)
+            self._module_netlists.pop(module_name, None)
+
+    def _add_instances(self, instance_name, nested_instances):
+        """
+        Starts tracking the expanded instances nested in an instance, given relative to it.
+        """
+        prefix = instance_name + "__" if instance_name else ""
+        for nested_instance_name, module_name in nested_instances.items():
+            self.instances[prefix + nested_instance_name] = module_name
+        for nested_instance_name in nested_instances:
+            nested_instance_name = prefix + nested_instance_name
+            self._instance_children[nested_instance_name] = set()
+            self._instance_nodes[nested_instance_name] = set()
+            self._instance_children[self.instance_of(nested_instance_name)].add(
+                nested_instance_name
+            )
+
+    def _add_nodes(self, nodes):
+        for node in nodes:
+            self._instance_nodes[self.instance_of(node)].add(node)
+
+    def _remove_instance(self, instance_name):
+        """
+        Removes an expanded instance, with every node and instance nested in it, from the expanded graph.
+
+        Returns:
+            set: The nodes outside of the instance that were connected to it.
+        """
+        removed_instances = [instance_name]
+        removed_nodes = []
+        for removed_instance_name in removed_instances:
+            removed_instances.extend(self._instance_children[removed_instance_name])
+            removed_nodes.extend(self._instance_nodes[removed_instance_name])
+
+        neighbours = set()
+        for node in removed_nodes:
+            neighbours.update(self.graph.pred[node])
+            neighbours.update(self.graph.succ[node])
+        self.graph.remove_nodes_from(removed_nodes)
+
+        self._instance_children[self.instance_of(instance_name)].discard(instance_name)
+        for removed_instance_name in removed_instances:
+            del self.instances[removed_instance_name]
+            del self._instance_children[removed_instance_name]
+            del self._instance_nodes[removed_instance_name]
+        return neighbours - set(removed_nodes)
+
+    def refresh(self):
+        """
+        Patches the expanded graph for every module that was added, updated or deleted in the
+        hardware library since the last expansion or refresh. Changes to the top module or to a
+        basic block expand the top module again from scratch.
+
+        Returns:
+            HDLGraph: The expanded graph, patched in place.
+
+        Raises:
+            ValueError: If a module in the hierarchy no longer exists in the hardware library.
+        """
+        changed_modules = {
+            module_name
+            for module_name, version in self._module_versions.items()
+            if hardware_library.get_module_version(module_name) != version
+        }
+        if not changed_modules:
+            return self.graph
+        if any(
+            module_name == self.top_module_name
+            or not hardware_library.verify_module_exists(module_name)
+            or hardware_library[module_name]["basic_block"]
+            for module_name in changed_modules
+        ):
+            self._expand()
+            return self.graph
+
+        changed_instances = {
+            instance_name: module_name
+            for instance_name, module_name in self.instances.items()
+            if module_name in changed_modules
+            and not self._inside_changed_instance(instance_name, changed_modules)
+        }
+
+        # Remove the previous expansion of every changed instance
+        touched_nodes = set()
+        for instance_name in changed_instances:
+            touched_nodes |= self._remove_instance(instance_name)
+        self._track_modules(changed_modules)
+
+        # Stamp the new expansion of every changed instance, then wire it to its surroundings
+        for instance_name, module_name in changed_instances.items():
+            template = _expanded_module_template(module_name)
+            self._add_instances("", {instance_name: module_name})
+            self._add_instances(instance_name, template["instances"])
+            _stamp_graph(
+                self.graph,
+                template["graph"],
+                instance_name + "__",
+                skip_input_output=True,
+            )
+            instance_nodes = [
+                instance_name + "__" + node
+                for node in template["graph"]
+                if node != config["input_block_name"]
+                and node != config["output_block_name"]
+            ]
+            self._add_nodes(instance_nodes)
+            touched_nodes.update(instance_nodes)
+            self._track_modules(
+                {
+                    submodule_name
+                    for submodule_name in template["submodules"]
+                    if submodule_name not in self._module_versions
+                }
+            )
+        for instance_name in changed_instances:
+            touched_nodes.update(self._connect_instance_boundary(instance_name))
+
+        nodes_to_delete = [
+            node
+            for node in touched_nodes
+            if self.graph.has_node(node) and self.graph.degree(node) == 0
+        ]
+        self.graph.remove_nodes_from(nodes_to_delete)
+        for node in nodes_to_delete:
+            self._instance_nodes[self.instance_of(node)].discard(node)
+
+        return self.graph
+
+    def instance_of(self, node):
+        """
+        Finds the expanded instance a node of the expanded graph was stamped from.
+
+        Args:
+            node (str): The name of a node in the expanded graph.
+
+        Returns:
+            str: The hierarchical name of the instance, or "" for nodes of the top module.
+        """
+        index = node.rfind("__")
+        while index > 0:
+            if node[:index] in self.instances:
+                return node[:index]
+            index = node.rfind("__", 0, index)
+        return ""
+
+    def _inside_changed_instance(self, instance_name, changed_modules):
+        """
+        Checks whether an expanded instance is nested in an instance of one of changed_modules.
+        """
+        parent_name = self.instance_of(instance_name)
+        while parent_name:
+            if self.instances[parent_name] in changed_modules:
+                return True
+            parent_name = self.instance_of(parent_name)
+        return False
+
+    def _module_graph(self, instance_name):
+        """
+        Retrieves the internal graph of the module of an expanded instance, "" being the top module.
+        """
+        module_name = (
+            self.instances[instance_name] if instance_name else self.top_module_name
+        )
+        if module_name not in self._module_graphs:
+            self._module_graphs[module_name] = hardware_library.get_module_nx_graph(
+                module_name
+            )
+        return self._module_graphs[module_name]
+
+    def _module_netlist(self, instance_name):
+        """
+        Retrieves the Netlist of the internal graph of the module of an expanded instance, "" being the top module.
+        """
+        module_name = (
+            self.instances[instance_name] if instance_name else self.top_module_name
+        )
+        if module_name not in self._module_netlists:
+            self._module_netlists[module_name] = Netlist.from_graph(
+                self._module_graph(instance_name)
+            )
+        return self._module_netlists[module_name]
+
+    def _local_name(self, instance_name):
+        """
+        Splits the hierarchical name of an expanded instance into its parent instance and its name
+        within the parent module.
+        """
+        parent_name = self.instance_of(instance_name)
+        if parent_name:
+            return parent_name, instance_name[len(parent_name) + 2 :]
+        return parent_name, instance_name
+
+    def _connect_instance_boundary(self, instance_name):
+        """
+        Connects the stamped expansion of an instance to the nodes driving its input ports and
+        driven by its output ports in the expanded graph.
 
-    with open(file_path, "r") as file:
-        code = file.read()
-        exec(code)
+        Returns:
+            list: The nodes whose connections were added.
+        """
+        template = _expanded_module_template(self.instances[instance_name])
+        parent_name, local_name = self._local_name(instance_name)
+        parent_graph = self._module_graph(parent_name)
+        connections = []
+
+        for source, _, data in parent_graph.in_edges(local_name, data=True):
+            for source_port, destination_port in port_connection_pairs(
+                data["port_connections"]
+            ):
+                driver = self._driver(parent_name, source, source_port)
+                if driver is None:
+                    continue
+                for inner_instance, inner_port in template["input_port_index"].get(
+                    destination_port, []
+                ):
+                    connections.append(
+                        (
+                            driver,
+                            (
+                                instance_name + "__" + inner_instance,
+                                inner_port,
+                                template["graph"].nodes[inner_instance],
+                            ),
+                        )
+                    )
+        for _, destination, data in parent_graph.out_edges(local_name, data=True):
+            for source_port, destination_port in port_connection_pairs(
+                data["port_connections"]
+            ):
+                if source_port not in template["output_port_index"]:
+                    continue
+                inner_instance, inner_port = template["output_port_index"][source_port]
+                driver = (
+                    instance_name + "__" + inner_instance,
+                    inner_port,
+                    template["graph"].nodes[inner_instance],
+                )
+                for sink in self._sinks(parent_name, destination, destination_port):
+                    connections.append((driver, sink))
+
+        touched_nodes = []
+        for (source, source_port, source_data), (
+            destination,
+            destination_port,
+            destination_data,
+        ) in connections:
+            if not self.graph.has_node(source):
+                self.graph.add_node(source, **source_data)
+                self._add_nodes([source])
+            if not self.graph.has_node(destination):
+                self.graph.add_node(destination, **destination_data)
+                self._add_nodes([destination])
+            _add_flat_connection(
+                self.graph, source, destination, source_port, destination_port
+            )
+            touched_nodes.extend((source, destination))
+        return touched_nodes
+
+    def _driver(self, instance_name, node, port, upward=True):
+        """
+        Resolves the basic block (or top level input block) port driving an output port of a node,
+        following input blocks up the hierarchy and non-basic instances down it.
+
+        Args:
+            instance_name (str): The expanded instance whose module graph contains node, "" for the top module.
+            node (str): The name of the node within the module graph.
+            port (str): The output port of node.
+            upward (bool): Whether an input block can be followed up to the parent instance.
+
+        Returns:
+            tuple: The (node_name, port_name, node_data) of the driver in the expanded graph,
+                or None if nothing drives the port.
+        """
+        module_graph = self._module_graph(instance_name)
+        prefix = instance_name + "__" if instance_name else ""
+
+        if node == config["input_block_name"]:
+            if not instance_name:
+                return (node, port, module_graph.nodes[node])
+            if not upward:
+                return None
+            parent_name, local_name = self._local_name(instance_name)
+            driver = self._module_netlist(parent_name).driver(local_name, port)
+            if driver is None:
+                return None
+            return self._driver(parent_name, *driver)
+
+        if hardware_library[module_graph.nodes[node]["module_name"]]["basic_block"]:
+            return (prefix + node, port, module_graph.nodes[node])
+
+        driver = self._module_netlist(prefix + node).driver(
+            config["output_block_name"], port
+        )
+        if driver is None:
+            return None
+        return self._driver(prefix + node, *driver, False)
+
+    def _sinks(self, instance_name, node, port, upward=True):
+        """
+        Resolves the basic block (or top level output block) ports driven through an input port of
+        a node, following output blocks up the hierarchy and non-basic instances down it.
+
+        Args:
+            instance_name (str): The expanded instance whose module graph contains node, "" for the top module.
+            node (str): The name of the node within the module graph.
+            port (str): The input port of node.
+            upward (bool): Whether an output block can be followed up to the parent instance.
+
+        Returns:
+            list: The (node_name, port_name, node_data) of every sink in the expanded graph.
+        """
+        module_graph = self._module_graph(instance_name)
+        prefix = instance_name + "__" if instance_name else ""
+
+        if node == config["output_block_name"]:
+            if not instance_name:
+                return [(node, port, module_graph.nodes[node])]
+            if not upward:
+                return []
+            parent_name, local_name = self._local_name(instance_name)
+            sinks = []
+            for destination, destination_port in self._module_netlist(
+                parent_name
+            ).sinks(local_name, port):
+                sinks.extend(self._sinks(parent_name, destination, destination_port))
+            return sinks
+
+        if hardware_library[module_graph.nodes[node]["module_name"]]["basic_block"]:
+            return [(prefix + node, port, module_graph.nodes[node])]
+
+        sinks = []
+        for destination, destination_port in self._module_netlist(prefix + node).sinks(
+            config["input_block_name"], port
+        ):
+            sinks.extend(
+                self._sinks(prefix + node, destination, destination_port, False)
+            )
+        return sinks
+
+
+def _expanded_module_template(module_name):
+    """
+    Returns the cached expansion of a module, expanding it first if it is not cached yet.
+
+    Args:
+        module_name (str): The name of the non-basic module to expand.
+
+    Returns:
+        dict: The hardware library cache entry of the module, see HardwareLibrary.set_expanded_graph.
+    """
+    template = hardware_library.get_expanded_graph(module_name)
+    if template is not None:
+        return template
+
+    template = _expand_module(
+        module_name,
+        lambda instance_name, submodule_name: _expanded_module_template(submodule_name),
+    )
+    hardware_library.set_expanded_graph(module_name, template)
+    return hardware_library.get_expanded_graph(module_name)
+
+
+def _expand_module(module_name, submodule_template):
+    """
+    Expands the internal graph of a module by stamping the expansion of its non-basic instances
+    in place of the instances.
+
+    Args:
+        module_name (str): The name of the non-basic module to expand.
+        submodule_template (callable): Called with the name and the module name of each non-basic
+            instance, returning the expanded template to stamp for it, or None to leave the
+            instance unexpanded.
+
+    Returns:
+        dict: The expanded module, with the same keys as the templates cached by
+            HardwareLibrary.set_expanded_graph.
+    """
+    module_graph = hardware_library.get_module_nx_graph(module_name)
+    expanded_graph = nx.DiGraph()
+    _stamp_graph(expanded_graph, module_graph, "")
+    submodules = set()
+    instances = {}
+    unmatched_ports = []
+
+    for node, data in module_graph.nodes(data=True):
+        if node == config["input_block_name"] or node == config["output_block_name"]:
+            continue
+        submodules.add(data["module_name"])
+        if hardware_library[data["module_name"]]["basic_block"]:
+            continue
+        template = submodule_template(node, data["module_name"])
+        if template is None:
+            continue
+        submodules |= template["submodules"]
+        instances[node] = data["module_name"]
+        for instance_name, instance_module_name in template["instances"].items():
+            instances[node + "__" + instance_name] = instance_module_name
+        _stamp_graph(
+            expanded_graph, template["graph"], node + "__", skip_input_output=True
+        )
+        unmatched_ports.extend(
+            (node + "__" + instance_name, port_name)
+            for instance_name, port_name in template["unmatched_ports"]
+        )
+        unmatched_ports.extend(
+            _rewire_instance_boundary(expanded_graph, node, template)
+        )
+
+    nodes_to_delete = [
+        node for node in expanded_graph if expanded_graph.degree(node) == 0
+    ]
+    expanded_graph.remove_nodes_from(nodes_to_delete)
+
+    input_port_index, output_port_index = _index_boundary_ports(expanded_graph)
+    return {
+        "graph": expanded_graph,
+        "submodules": submodules,
+        "instances": instances,
+        "input_port_index": input_port_index,
+        "output_port_index": output_port_index,
+        "unmatched_ports": unmatched_ports,
+    }
+
+
+def _hdl_graph_from_template(template):
+    """
+    Copies an expanded module template into a new HDLGraph that can be modified freely.
+    """
+    expanded_graph = HDLGraph(template["graph"])
+    for source, destination, port_connections in list(
+        expanded_graph.edges(data="port_connections")
+    ):
+        expanded_graph._reconnect_edge(
+            source, destination, copy_port_connections(port_connections)
+        )
+    return expanded_graph
+
+
+def _stamp_graph(flat_graph, template_graph, prefix, skip_input_output=False):
+    """
+    Copies every node and edge of template_graph into flat_graph with prefix added to the instance names.
+
+    Args:
+        flat_graph (networkx.DiGraph): The graph being flattened, modified in place. Edges are added
+            without the HDLGraph.add_edge checks.
+        template_graph (networkx.DiGraph): The graph to copy, left untouched.
+        prefix (str): The hierarchical prefix of the instance being stamped.
+        skip_input_output (bool): Leave out the input/output blocks and their edges. Defaults to False.
+    """
+    input_output_blocks = (
+        (config["input_block_name"], config["output_block_name"])
+        if skip_input_output
+        else ()
+    )
+    for node, data in template_graph.nodes(data=True):
+        if node not in input_output_blocks:
+            flat_graph.add_node(prefix + node, **data)
+    for source, destination, data in template_graph.edges(data=True):
+        if source in input_output_blocks or destination in input_output_blocks:
+            continue
+        nx.DiGraph.add_edge(
+            flat_graph,
+            prefix + source,
+            prefix + destination,
+            **{
+                **data,
+                "port_connections": copy_port_connections(data["port_connections"]),
+            },
+        )
+        _add_to_netlist(
+            flat_graph, prefix + source, prefix + destination, data["port_connections"]
+        )
+
+
+def _index_boundary_ports(expanded_graph):
+    """
+    Indexes which instances sit behind each input and output port of an expanded module.
+
+    Connections running straight from the input block to the output block are not indexed.
+
+    Args:
+        expanded_graph (networkx.DiGraph): The expanded graph of the module, with its input/output blocks.
+
+    Returns:
+        tuple: A dictionary mapping each input port to the list of (instance_name, port_name) it drives,
+            and a dictionary mapping each output port to the (instance_name, port_name) driving it.
+    """
+    input_block_name = config["input_block_name"]
+    output_block_name = config["output_block_name"]
+    input_port_index = {}
+    output_port_index = {}
+
+    if expanded_graph.has_node(input_block_name):
+        for _, destination, data in expanded_graph.out_edges(
+            input_block_name, data=True
+        ):
+            if destination == output_block_name:
+                continue
+            for boundary_port, inner_port in port_connection_pairs(
+                data["port_connections"]
+            ):
+                input_port_index.setdefault(boundary_port, []).append(
+                    (destination, inner_port)
+                )
+    if expanded_graph.has_node(output_block_name):
+        for source, _, data in expanded_graph.in_edges(output_block_name, data=True):
+            if source == input_block_name:
+                continue
+            for inner_port, boundary_port in port_connection_pairs(
+                data["port_connections"]
+            ):
+                output_port_index[boundary_port] = (source, inner_port)
+
+    return input_port_index, output_port_index
+
+
+def _rewire_instance_boundary(flat_graph, instance_name, template):
+    """
+    Reconnects the edges of an instance to the instances behind the ports of its stamped template,
+    then removes the instance from flat_graph.
+
+    Args:
+        flat_graph (networkx.DiGraph): The graph being flattened, modified in place.
+        instance_name (str): The name of the instance that was stamped.
+        template (dict): The expanded module template of the instance.
+
+    Returns:
+        list: The (instance_name, port_name) of every instance port connected in flat_graph
+            that nothing is connected to inside the template.
+    """
+    prefix = instance_name + "__"
+    unmatched_ports = []
+
+    for _, destination, data in list(flat_graph.out_edges(instance_name, data=True)):
+        for source_port, destination_port in port_connection_pairs(
+            data["port_connections"]
+        ):
+            if source_port not in template["output_port_index"]:
+                unmatched_ports.append((instance_name, source_port))
+                continue
+            inner_instance, inner_port = template["output_port_index"][source_port]
+            _add_flat_connection(
+                flat_graph,
+                prefix + inner_instance,
+                destination,
+                inner_port,
+                destination_port,
+            )
+
+    for source, _, data in list(flat_graph.in_edges(instance_name, data=True)):
+        for source_port, destination_port in port_connection_pairs(
+            data["port_connections"]
+        ):
+            if destination_port not in template["input_port_index"]:
+                unmatched_ports.append((instance_name, destination_port))
+                continue
+            for inner_instance, inner_port in template["input_port_index"][
+                destination_port
+            ]:
+                _add_flat_connection(
+                    flat_graph,
+                    source,
+                    prefix + inner_instance,
+                    source_port,
+                    inner_port,
+                )
+
+    flat_graph.remove_node(instance_name)
+    return unmatched_ports
+
+
+def _add_to_netlist(flat_graph, source, destination, port_connections):
+    """
+    Records connections added to flat_graph without HDLGraph.add_edge in its netlist, if flat_graph
+    is an HDLGraph whose netlist was built.
+    """
+    netlist = getattr(flat_graph, "_netlist", None)
+    if netlist is None:
+        return
+    for source_port, destination_port in port_connection_pairs(port_connections):
+        if netlist.driver(destination, destination_port) != (source, source_port):
+            netlist.add_connection(source, source_port, destination, destination_port)
+
+
+def _add_flat_connection(
+    flat_graph, source, destination, source_port, destination_port
+):
+    """
+    Adds a single port connection to flat_graph, merging it into an existing edge if there is one.
+    The connection is added without the HDLGraph.add_edge checks.
+    """
+    if isinstance(flat_graph, HDLGraph) and flat_graph.has_edge(source, destination):
+        port_connections = copy_port_connections(
+            flat_graph[source][destination]["port_connections"]
+        )
+        add_port_connection(port_connections, source_port, destination_port)
+        flat_graph._reconnect_edge(source, destination, port_connections)
+        return
+    if flat_graph.has_edge(source, destination):
+        add_port_connection(
+            flat_graph[source][destination]["port_connections"],
+            source_port,
+            destination_port,
+        )
+    else:
+        nx.DiGraph.add_edge(
+            flat_graph,
+            source,
+            destination,
+            port_connections={source_port: destination_port},
+        )
+    _add_to_netlist(flat_graph, source, destination, {source_port: destination_port})
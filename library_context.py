@@ -0,0 +1,156 @@
+"""
+Library contexts, the hardware library and connection library that HDLGraph, the module scripts and
+the generators work with
+"""
+
+import contextlib
+import contextvars
+import functools
+import threading
+from hardware_library import HardwareLibrary
+from connection_library import ConnectionLibrary
+
+
+class LibraryContext:
+    """
+    Pairs a HardwareLibrary with the ConnectionLibrary its port types refer to.
+
+    The default context holds the HardwareLibrary() and ConnectionLibrary() singletons, and is the
+    active one unless another context is activated. Activating a context only affects the current
+    thread (and asyncio task), so threads can explore different design variants at the same time,
+    each in its own context, and a pool of threads can generate output from a shared context.
+
+    Attributes:
+        hardware_library (HardwareLibrary): The modules of the context.
+        connection_library (ConnectionLibrary): The connection types of the context.
+    """
+
+    def __init__(self, hardware_library, connection_library=None):
+        """
+        Args:
+            hardware_library (HardwareLibrary): The modules of the context.
+            connection_library (ConnectionLibrary, optional): The connection types of the context.
+                Defaults to the connection library of hardware_library.
+        """
+        self.hardware_library = hardware_library
+        self.connection_library = (
+            connection_library
+            if connection_library is not None
+            else hardware_library.connection_library
+        )
+
+    @classmethod
+    def create(cls):
+        """
+        Creates a context independent of every other one, holding only the basic blocks of
+        /hardware_modules/basic_blocks and the types of connection_library.json.
+
+        Returns:
+            LibraryContext: The new context.
+        """
+        return cls(HardwareLibrary.new_instance(ConnectionLibrary.new_instance()))
+
+    def clone(self):
+        """
+        Copies the context. The copy shares the modules and their frozen internal graphs with the
+        original until either side adds, updates or deletes a module, so cloning a large library
+        is cheap.
+
+        Returns:
+            LibraryContext: The copy.
+        """
+        return LibraryContext(self.hardware_library.clone())
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Makes this context the active one in the current thread for the duration of a with
+        block:
+
+            with context.activate():
+                g = HDLGraph()
+                g.add_hardware_node(module_name="hen", instance_name="hen_1")
+        """
+        token = _active_context.set(self)
+        try:
+            yield self
+        finally:
+            _active_context.reset(token)
+
+
+_active_context = contextvars.ContextVar("active_library_context", default=None)
+_default_context = None
+_default_context_lock = threading.Lock()
+
+
+def default_context():
+    """
+    Returns:
+        LibraryContext: The context holding the HardwareLibrary() and ConnectionLibrary()
+            singletons.
+    """
+    global _default_context
+    if _default_context is None:
+        with _default_context_lock:
+            if _default_context is None:
+                _default_context = LibraryContext(
+                    HardwareLibrary(), ConnectionLibrary()
+                )
+    return _default_context
+
+
+def active_context():
+    """
+    Returns:
+        LibraryContext: The context activated in the current thread, or the default context.
+    """
+    return _active_context.get() or _default_context or default_context()
+
+
+def in_context(function):
+    """
+    Adds an optional context keyword argument to a function, activating that context while the
+    function runs. Without it, the function runs in the active context.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, context=None, **kwargs):
+        if context is None:
+            return function(*args, **kwargs)
+        with context.activate():
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+class _ActiveLibrary:
+    """
+    Stands for the hardware library or the connection library of the active context, forwarding
+    every attribute and item access to it. Modules hold one instead of a library, so that they
+    follow the active context.
+    """
+
+    __slots__ = ("_library_name",)
+
+    def __init__(self, library_name):
+        object.__setattr__(self, "_library_name", library_name)
+
+    def __getattr__(self, name):
+        return getattr(getattr(active_context(), self._library_name), name)
+
+    def __setattr__(self, name, value):
+        setattr(getattr(active_context(), self._library_name), name, value)
+
+    def __getitem__(self, key):
+        return getattr(active_context(), self._library_name)[key]
+
+    def __setitem__(self, key, value):
+        getattr(active_context(), self._library_name)[key] = value
+
+    def __delitem__(self, key):
+        del getattr(active_context(), self._library_name)[key]
+
+
+# The libraries of the active context, for modules to import in place of the singletons
+active_hardware_library = _ActiveLibrary("hardware_library")
+active_connection_library = _ActiveLibrary("connection_library")
@@ -0,0 +1,306 @@
+"""
+Declarative module definitions, loaded next to the Python scripts in /hardware_modules
+
+A definition file (*.module.json, or *.module.yaml / *.module.yml when PyYAML is installed) holds
+the arguments of a single hardware_library.add_module call, with the internal graph given as its
+instances and edges:
+
+    {
+        "module_name": "hen",
+        "input_ports": {"fingers": 8, "adder_input": 8},
+        "output_ports": {"run": 8, "product": "intermediate", "test": 8},
+        "instances": {
+            "adder_instance_1": "adder",
+            "multiplier_instance": "multiplier",
+            "memory_instance_1": "memory"
+        },
+        "edges": [
+            {
+                "source": "multiplier_instance",
+                "destination": "memory_instance_1",
+                "port_connections": {"run": "memory_input"}
+            }
+        ],
+        "input_connections": {
+            "fingers": [["multiplier_instance", "cb"]],
+            "adder_input": [["adder_instance_1", "a"]]
+        },
+        "output_connections": {"test": ["memory_instance_1", "test"]}
+    }
+
+"instances" maps every instance name to its module name, "edges" are added in order, and
+"instances", "edges", "input_connections" and "output_connections" may be omitted when empty.
+"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from hardware_library import PARALLEL_PARSE_MIN_FILES
+from library_context import active_hardware_library
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# The hardware library of the active library context, see library_context
+hardware_library = active_hardware_library
+
+DEFINITION_SUFFIXES = (".module.json", ".module.yaml", ".module.yml")
+_DEFINITION_KEYS = {
+    "module_name",
+    "input_ports",
+    "output_ports",
+    "instances",
+    "edges",
+    "input_connections",
+    "output_connections",
+}
+
+
+def read_module_definition(file_path):
+    """
+    Reads and validates a module definition file.
+
+    Args:
+        file_path (str): The path of the file, ending with one of DEFINITION_SUFFIXES.
+
+    Returns:
+        dict: The "module_name", "input_ports", "output_ports", "instances" (dict from instance
+            name to module name), "edges" (list of (source, destination, port_connections)),
+            "input_connections" (dict from input port to a list of (instance_name, port_name)) and
+            "output_connections" (dict from output port to an (instance_name, port_name)) of the
+            module.
+
+    Raises:
+        ValueError: If the file is not a valid module definition, or is a YAML file and PyYAML is
+            not installed.
+    """
+    with open(file_path, "r") as file:
+        if file_path.endswith(".module.json"):
+            definition = json.load(file)
+        elif yaml is None:
+            raise ValueError("PyYAML is required to read " + file_path)
+        else:
+            definition = yaml.safe_load(file)
+
+    if not isinstance(definition, dict):
+        raise ValueError(file_path + " must hold a single module definition")
+    unknown_keys = set(definition) - _DEFINITION_KEYS
+    if unknown_keys:
+        raise ValueError(
+            file_path + " has unknown keys " + ", ".join(sorted(unknown_keys))
+        )
+    for key in ("module_name", "input_ports", "output_ports"):
+        if key not in definition:
+            raise ValueError(file_path + " is missing " + key)
+    if not isinstance(definition["module_name"], str):
+        raise ValueError(file_path + ": module_name must be a string")
+
+    instances = definition.get("instances", {})
+    if not isinstance(instances, dict) or not all(
+        isinstance(module_name, str) for module_name in instances.values()
+    ):
+        raise ValueError(
+            file_path + ": instances must map instance names to module names"
+        )
+    edges = []
+    for edge in definition.get("edges", []):
+        if not isinstance(edge, dict) or set(edge) != {
+            "source",
+            "destination",
+            "port_connections",
+        }:
+            raise ValueError(
+                file_path
+                + ": every edge must have a source, a destination and port_connections"
+            )
+        edges.append((edge["source"], edge["destination"], edge["port_connections"]))
+    input_connections = {
+        input_port: [
+            _port_reference(file_path, connection) for connection in connections
+        ]
+        for input_port, connections in definition.get("input_connections", {}).items()
+    }
+    output_connections = {
+        output_port: _port_reference(file_path, connection)
+        for output_port, connection in definition.get("output_connections", {}).items()
+    }
+
+    return {
+        "module_name": definition["module_name"],
+        "input_ports": definition["input_ports"],
+        "output_ports": definition["output_ports"],
+        "instances": instances,
+        "edges": edges,
+        "input_connections": input_connections,
+        "output_connections": output_connections,
+    }
+
+
+def _port_reference(file_path, connection):
+    """
+    Converts an [instance_name, port_name] pair of a definition file to a tuple.
+    """
+    if not isinstance(connection, (list, tuple)) or len(connection) != 2:
+        raise ValueError(
+            file_path
+            + ": input and output connections must be [instance_name, port_name] pairs"
+        )
+    return connection[0], connection[1]
+
+
+def add_module_definition(definition):
+    """
+    Adds a module to the hardware library from its definition, building the same internal graph
+    as a script calling add_hardware_node and add_edge would.
+
+    Args:
+        definition (dict): The module definition, as returned by read_module_definition.
+
+    Raises:
+        ValueError: If a submodule does not exist, or if add_module rejects the module.
+    """
+    # hdl_graph imports this module through module_index, so HDLGraph is only imported when it
+    # is needed
+    from hdl_graph import HDLGraph
+
+    g = HDLGraph()
+    g.add_hardware_nodes_from(definition["instances"].items())
+    g.add_connections_from(definition["edges"])
+    hardware_library.add_module(
+        module_name=definition["module_name"],
+        input_ports=definition["input_ports"],
+        output_ports=definition["output_ports"],
+        input_connections=definition["input_connections"],
+        output_connections=definition["output_connections"],
+        internal_graph=g,
+    )
+
+
+def load_module_definitions(folder_path):
+    """
+    Adds the modules of every definition file under a folder to the hardware library.
+
+    The files are read in parallel, then the modules are added in topological batches: every
+    module of a batch only instantiates modules of earlier batches, basic blocks, or modules
+    already in the library. Submodules that no definition file provides are loaded from the
+    Python scripts in /hardware_modules as usual. Modules already in the library are left as
+    they are.
+
+    Args:
+        folder_path (str): The folder to search for definition files.
+
+    Returns:
+        list: The names of the modules added, in the order they were added.
+
+    Raises:
+        ValueError: If a definition file is invalid, if two files define the same module, or if
+            modules instantiate each other in a cycle.
+    """
+    file_paths = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        file_paths.extend(
+            os.path.join(root, file_name)
+            for file_name in sorted(files)
+            if file_name.endswith(DEFINITION_SUFFIXES)
+        )
+
+    if len(file_paths) >= PARALLEL_PARSE_MIN_FILES and (
+        "fork" in multiprocessing.get_all_start_methods()
+    ):
+        # Forked workers do not re-import the __main__ script, unlike spawned ones
+        with ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            definitions = list(
+                executor.map(
+                    read_module_definition,
+                    file_paths,
+                    chunksize=max(1, len(file_paths) // (4 * (os.cpu_count() or 1))),
+                )
+            )
+    else:
+        definitions = [read_module_definition(file_path) for file_path in file_paths]
+
+    definitions_by_name = {}
+    for file_path, definition in zip(file_paths, definitions):
+        module_name = definition["module_name"]
+        if module_name in definitions_by_name:
+            raise ValueError(
+                "Module "
+                + module_name
+                + " is defined by both "
+                + definitions_by_name[module_name][0]
+                + " and "
+                + file_path
+            )
+        definitions_by_name[module_name] = (file_path, definition)
+
+    added_modules = []
+    for batch in _topological_batches(
+        {
+            module_name: definition
+            for module_name, (_, definition) in definitions_by_name.items()
+        }
+    ):
+        for module_name in batch:
+            if hardware_library.verify_module_exists(module_name=module_name):
+                continue
+            add_module_definition(definitions_by_name[module_name][1])
+            added_modules.append(module_name)
+    return added_modules
+
+
+def _topological_batches(definitions):
+    """
+    Groups module definitions into batches, each module only depending on modules of earlier
+    batches. Modules keep the order of definitions within a batch.
+
+    Args:
+        definitions (dict): Maps module names to their definitions.
+
+    Returns:
+        list: The batches, as lists of module names.
+
+    Raises:
+        ValueError: If modules instantiate each other in a cycle.
+    """
+    positions = {module_name: index for index, module_name in enumerate(definitions)}
+    dependents = {module_name: [] for module_name in definitions}
+    dependency_counts = {}
+    for module_name, definition in definitions.items():
+        submodule_names = {
+            submodule_name
+            for submodule_name in definition["instances"].values()
+            if submodule_name in definitions
+        }
+        for submodule_name in submodule_names:
+            dependents[submodule_name].append(module_name)
+        dependency_counts[module_name] = len(submodule_names)
+
+    batches = []
+    batch = [
+        module_name for module_name, count in dependency_counts.items() if count == 0
+    ]
+    while batch:
+        batches.append(batch)
+        next_batch = []
+        for module_name in batch:
+            for dependent_name in dependents[module_name]:
+                dependency_counts[dependent_name] -= 1
+                if dependency_counts[dependent_name] == 0:
+                    next_batch.append(dependent_name)
+        batch = sorted(next_batch, key=positions.__getitem__)
+    if sum(len(batch) for batch in batches) < len(definitions):
+        raise ValueError(
+            "Modules instantiate each other in a cycle: "
+            + ", ".join(
+                module_name
+                for module_name, count in dependency_counts.items()
+                if count > 0
+            )
+        )
+    return batches
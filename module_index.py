@@ -0,0 +1,144 @@
+"""
+Finds and loads the Python scripts and definition files defining the non-basic modules in
+/hardware_modules
+"""
+
+import os
+import re
+from module_definitions import (
+    DEFINITION_SUFFIXES,
+    read_module_definition,
+    add_module_definition,
+)
+
+# Matches the module name of the hardware_library.add_module calls of a module script, whether it
+# is passed as the module_name keyword or as the first positional argument
+_ADD_MODULE_PATTERN = re.compile(
+    r"""\badd_module\(\s*(?:module_name\s*=\s*)?(["'])(?P<module_name>[^"'\n]+)\1"""
+)
+
+
+class ModuleIndex:
+    """
+    Maps the name of every module defined by a Python script or a definition file (see
+    module_definitions) under a folder to the file defining it, so a module can be loaded on first
+    use whatever the name of its file.
+
+    The index is built by scanning the text of the scripts for hardware_library.add_module calls,
+    without running them, and by reading the definition files. Scripts are only compiled and run
+    when one of their modules is loaded, and their compiled code, like the content of definition
+    files, is kept until the file changes.
+    """
+
+    def __init__(self, folder_path):
+        """
+        Initializes an index of the module files under folder_path. The folder is scanned on first
+        use.
+
+        Attributes:
+            folder_path (str): The folder holding the module files.
+            _source_files (dict): Maps every module name to the file defining it, or is None
+                until the folder is scanned.
+            _compiled_files (dict): Maps the path of every compiled script or read definition file
+                to its (modification time in ns, size, code object or module definition).
+        """
+        self.folder_path = folder_path
+        self._source_files = None
+        self._compiled_files = {}
+
+    def source_file(self, module_name):
+        """
+        Finds the script or definition file defining a module.
+
+        Args:
+            module_name (str): The name of the module.
+
+        Returns:
+            str: The path of the file, or None if no file under the folder defines the module.
+        """
+        if self._source_files is None:
+            self.rescan()
+        return self._source_files.get(module_name)
+
+    def rescan(self):
+        """
+        Scans the folder again, to find files that were added, removed or edited since the last
+        scan.
+
+        When several files define the same module, the one named after the module wins, then the
+        first one in path order.
+        """
+        source_files = {}
+        for root, dirs, files in os.walk(self.folder_path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                if file_name.endswith(DEFINITION_SUFFIXES):
+                    module_names = [self._compiled(file_path)["module_name"]]
+                elif file_name.endswith(".py"):
+                    with open(file_path, "r") as file:
+                        source = file.read()
+                    module_names = [
+                        match.group("module_name")
+                        for match in _ADD_MODULE_PATTERN.finditer(source)
+                    ]
+                else:
+                    continue
+                for module_name in module_names:
+                    if (
+                        module_name not in source_files
+                        or file_name.split(".")[0] == module_name
+                    ):
+                        source_files[module_name] = file_path
+        self._source_files = source_files
+
+    def load(self, module_name, namespace):
+        """
+        Runs the script, or adds the definition file, defining a module, scanning the folder again
+        if no file was found in the index.
+
+        Args:
+            module_name (str): The name of the module.
+            namespace (dict): The global namespace the script runs in. It must provide what the
+                scripts use without importing it, such as HDLGraph and hardware_library.
+
+        Returns:
+            bool: True if a file defining the module was loaded, False if there is none.
+        """
+        file_path = self.source_file(module_name)
+        if file_path is None or not os.path.isfile(file_path):
+            self.rescan()
+            file_path = self._source_files.get(module_name)
+            if file_path is None:
+                return False
+        compiled = self._compiled(file_path)
+        if isinstance(compiled, dict):
+            add_module_definition(compiled)
+        else:
+            # Every script runs with its own local namespace, as they all name their graph g
+            exec(compiled, namespace, {})
+        return True
+
+    def _compiled(self, file_path):
+        """
+        Returns the compiled code of a script or the module definition of a definition file,
+        compiling or reading it again if it changed since it was last used.
+        """
+        file_stat = os.stat(file_path)
+        cached = self._compiled_files.get(file_path)
+        if cached is not None and cached[:2] == (
+            file_stat.st_mtime_ns,
+            file_stat.st_size,
+        ):
+            return cached[2]
+        if file_path.endswith(DEFINITION_SUFFIXES):
+            compiled = read_module_definition(file_path)
+        else:
+            with open(file_path, "r") as file:
+                compiled = compile(file.read(), file_path, "exec")
+        self._compiled_files[file_path] = (
+            file_stat.st_mtime_ns,
+            file_stat.st_size,
+            compiled,
+        )
+        return compiled
@@ -0,0 +1,189 @@
+"""
+The netlist of a module as the generators of file_output_loader render it, built once from its
+graph and shared by every output backend
+"""
+
+from config import config
+from netlist import Netlist
+from compact_netlist import CompactNetlist
+
+# The kinds of instance of a ModuleNetlist
+IO_BLOCK = "io_block"
+BASIC_BLOCK = "basic_block"
+MODULE = "module"
+
+
+class ModuleNetlist:
+    """
+    Holds everything the output backends need to know about a module: its ports, its instances,
+    how every port of an instance is bound, the nets its instances drive with their types, and the
+    edges between its instances. It is built once per module, so that the backends never walk the
+    module graph themselves, and is not modified afterwards.
+
+    Attributes:
+        module_name (str): The name of the module.
+        ports (dict): Maps every port of the module to its "type" and "input_output" ("input" or
+            "output"), input ports first. Empty when the module is not in the hardware library,
+            such as for a graph rendered under a name of its own.
+        instances (list): The (instance_name, module_name, kind) of every instance, in the order of
+            the graph, kind being IO_BLOCK, BASIC_BLOCK or MODULE.
+        bindings (dict): Maps every instance to the (internal_port, external_port,
+            external_module) binding each of its connected ports in its Verilog instantiation,
+            output ports first. See _port_bindings.
+        nets (list): The (instance_name, port_name, type) of every connected output port of the
+            instances other than the input and output blocks, in the order of the instances.
+        edges (list): The (source, destination, ports) of every edge, ports being the list of
+            (port_name, type) of the source ports it connects. Types are "" for the ports of the
+            input and output blocks.
+    """
+
+    __slots__ = ("module_name", "ports", "instances", "bindings", "nets", "edges")
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self.ports = {}
+        self.instances = []
+        self.bindings = {}
+        self.nets = []
+        self.edges = []
+
+    @classmethod
+    def from_graph(cls, module_name, graph, hardware_library):
+        """
+        Builds the netlist of a module from its graph.
+
+        Args:
+            module_name (str): The name of the module.
+            graph (networkx.DiGraph or CompactNetlist): The internal graph of the module, or any
+                graph to render under module_name, such as an expanded graph.
+            hardware_library (HardwareLibrary): The library holding the module and the modules of
+                its instances.
+
+        Returns:
+            ModuleNetlist: The netlist.
+
+        Raises:
+            ValueError: If an input port is driven more than once in the graph.
+        """
+        library = hardware_library.get_hardware_library()
+        io_block_names = (config["input_block_name"], config["output_block_name"])
+        module_netlist = cls(module_name)
+        if module_name in library:
+            for port_name, type in library[module_name]["input_ports"].items():
+                module_netlist.ports[port_name] = {
+                    "type": type,
+                    "input_output": "input",
+                }
+            for port_name, type in library[module_name]["output_ports"].items():
+                module_netlist.ports[port_name] = {
+                    "type": type,
+                    "input_output": "output",
+                }
+
+        if isinstance(graph, CompactNetlist):
+            netlist = graph
+            instances = list(graph.instances_with_modules())
+        else:
+            netlist = Netlist.from_graph(graph)
+            instances = list(graph.nodes(data="module_name"))
+
+        # The output port types of a module, or None for the input and output blocks, whose ports
+        # are typed ""
+        def output_port_types(instance_module_name):
+            if instance_module_name in io_block_names:
+                return None
+            return library[instance_module_name]["output_ports"]
+
+        for instance_name, instance_module_name in instances:
+            if instance_name in io_block_names:
+                kind = IO_BLOCK
+            elif library[instance_module_name]["basic_block"]:
+                kind = BASIC_BLOCK
+            else:
+                kind = MODULE
+            module_netlist.instances.append((instance_name, instance_module_name, kind))
+            module_netlist.bindings[instance_name] = _port_bindings(
+                netlist, instance_name
+            )
+            if kind != IO_BLOCK:
+                port_types = output_port_types(instance_module_name)
+                for port_name in netlist.output_ports(instance_name):
+                    module_netlist.nets.append(
+                        (
+                            instance_name,
+                            port_name,
+                            port_types[port_name] if port_types is not None else "",
+                        )
+                    )
+
+        if isinstance(graph, CompactNetlist):
+            # A CompactNetlist has no edges, so they are gathered from the nets of every instance
+            for instance_name, instance_module_name in instances:
+                port_types = output_port_types(instance_module_name)
+                edges = {}
+                for port_name, sinks in netlist.output_ports(instance_name).items():
+                    type = port_types[port_name] if port_types is not None else ""
+                    for destination, _ in sinks:
+                        ports = edges.setdefault(destination, [])
+                        if (port_name, type) not in ports:
+                            ports.append((port_name, type))
+                module_netlist.edges.extend(
+                    (instance_name, destination, ports)
+                    for destination, ports in edges.items()
+                )
+        else:
+            module_names = dict(instances)
+            for source, destination, port_connections in graph.edges(
+                data="port_connections"
+            ):
+                port_types = output_port_types(module_names[source])
+                module_netlist.edges.append(
+                    (
+                        source,
+                        destination,
+                        [
+                            (
+                                port_name,
+                                (
+                                    port_types[port_name]
+                                    if port_types is not None
+                                    else ""
+                                ),
+                            )
+                            for port_name in port_connections
+                        ],
+                    )
+                )
+        return module_netlist
+
+
+def _port_bindings(netlist, node):
+    """
+    Lists how each connected port of an instance is bound in its Verilog instantiation.
+
+    An output port is bound to the signal named after the instance and port, unless its last sink
+    is the output block, in which case it is bound to the module output port directly. An input
+    port is bound to the signal driving it.
+
+    Args:
+        netlist (Netlist): The netlist of the graph containing the instance.
+        node (str): The name of the instance.
+
+    Returns:
+        list: The (internal_port, external_port, external_module) of each connected port, output
+            ports first.
+    """
+    port_bindings = {}
+    for source_port, sinks in netlist.output_ports(node).items():
+        destination, destination_port = sinks[-1]
+        if destination == config["output_block_name"]:
+            port_bindings[source_port] = (source_port, destination_port, destination)
+        else:
+            port_bindings[source_port] = (source_port, source_port, node)
+    for destination_port, (source, source_port) in netlist.input_ports(node).items():
+        port_bindings[destination_port] = (
+            destination_port,
+            source_port,
+            node if node == config["output_block_name"] else source,
+        )
+    return list(port_bindings.values())
@@ -0,0 +1,207 @@
+"""
+Net-centric representation of the connections between the instances of an HDLGraph
+"""
+
+
+class Netlist:
+    """
+    Indexes the connections of a graph by net. Every net has a single driver (instance_name, port_name)
+    and a list of sinks, and both the nets driven by an instance and the drivers of its input ports are
+    hashed per instance, so connectivity queries take constant time.
+    """
+
+    def __init__(self):
+        """Initializes an empty Netlist.
+
+        Attributes:
+            _output_ports (dict): Maps each instance to a dictionary from its output ports to the list of
+                (instance_name, port_name) sinks they drive, in the order they were connected.
+            _input_ports (dict): Maps each instance to a dictionary from its input ports to the
+                (instance_name, port_name) driving them, in the order they were connected.
+        """
+        self._output_ports = {}
+        self._input_ports = {}
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Creates the Netlist of a graph whose edges carry "port_connections".
+
+        Output ports and sinks are ordered like the outgoing edges of each instance, and input
+        ports like its incoming edges, so walking the Netlist visits ports in the same order as
+        walking the edges of the graph.
+
+        Args:
+            graph (networkx.DiGraph): The graph to index.
+
+        Returns:
+            Netlist: The Netlist of the graph.
+
+        Raises:
+            ValueError: If an input port is driven more than once in the graph.
+        """
+        netlist = cls()
+        for source, destination, data in graph.edges(data=True):
+            for source_port, destination_port in port_connection_pairs(
+                data["port_connections"]
+            ):
+                netlist._output_ports.setdefault(source, {}).setdefault(
+                    source_port, []
+                ).append((destination, destination_port))
+        for destination in graph:
+            for source, data in graph.pred[destination].items():
+                for source_port, destination_port in port_connection_pairs(
+                    data["port_connections"]
+                ):
+                    input_ports = netlist._input_ports.setdefault(destination, {})
+                    if destination_port in input_ports:
+                        raise ValueError(
+                            destination_port
+                            + " in "
+                            + destination
+                            + " is driven by more than one signal"
+                        )
+                    input_ports[destination_port] = (source, source_port)
+        return netlist
+
+    def add_connection(self, source_instance, source_port, sink_instance, sink_port):
+        """
+        Connects an output port to an input port, adding the input port to the net driven by the output port.
+
+        Raises:
+            ValueError: If the input port is already driven.
+        """
+        input_ports = self._input_ports.setdefault(sink_instance, {})
+        if sink_port in input_ports:
+            raise ValueError(
+                sink_port
+                + " in "
+                + sink_instance
+                + " is already driven by another signal"
+            )
+        input_ports[sink_port] = (source_instance, source_port)
+        self._output_ports.setdefault(source_instance, {}).setdefault(
+            source_port, []
+        ).append((sink_instance, sink_port))
+
+    def remove_connection(self, source_instance, source_port, sink_instance, sink_port):
+        """
+        Disconnects an input port from the output port driving it. Does nothing if they are not connected.
+        """
+        if self.driver(sink_instance, sink_port) != (source_instance, source_port):
+            return
+        del self._input_ports[sink_instance][sink_port]
+        sinks = self._output_ports[source_instance][source_port]
+        sinks.remove((sink_instance, sink_port))
+        if not sinks:
+            del self._output_ports[source_instance][source_port]
+
+    def remove_instance(self, instance_name):
+        """
+        Removes every connection to and from an instance.
+        """
+        for port, sinks in list(self._output_ports.get(instance_name, {}).items()):
+            for sink_instance, sink_port in list(sinks):
+                self.remove_connection(instance_name, port, sink_instance, sink_port)
+        for port, (source_instance, source_port) in list(
+            self._input_ports.get(instance_name, {}).items()
+        ):
+            self.remove_connection(source_instance, source_port, instance_name, port)
+        self._output_ports.pop(instance_name, None)
+        self._input_ports.pop(instance_name, None)
+
+    def driver(self, instance_name, port_name):
+        """
+        Finds the output port driving an input port.
+
+        Returns:
+            tuple: The (instance_name, port_name) of the driver, or None if the input port is not driven.
+        """
+        return self._input_ports.get(instance_name, {}).get(port_name)
+
+    def sinks(self, instance_name, port_name):
+        """
+        Finds the input ports driven by an output port.
+
+        Returns:
+            list: The (instance_name, port_name) of every sink, which must not be modified.
+        """
+        return self._output_ports.get(instance_name, {}).get(port_name, [])
+
+    def is_driven(self, instance_name, port_name):
+        return port_name in self._input_ports.get(instance_name, {})
+
+    def input_ports(self, instance_name):
+        """
+        Returns:
+            dict: Maps every connected input port of the instance to the (instance_name, port_name)
+                driving it. It must not be modified.
+        """
+        return self._input_ports.get(instance_name, {})
+
+    def output_ports(self, instance_name):
+        """
+        Returns:
+            dict: Maps every connected output port of the instance to the list of
+                (instance_name, port_name) it drives. It must not be modified.
+        """
+        return self._output_ports.get(instance_name, {})
+
+    def nets(self):
+        """
+        Iterates over every net.
+
+        Yields:
+            tuple: The (instance_name, port_name) driving the net and the list of its sinks.
+        """
+        for instance_name, output_ports in self._output_ports.items():
+            for port_name, sinks in output_ports.items():
+                yield (instance_name, port_name), sinks
+
+
+def port_connection_pairs(port_connections):
+    """
+    Iterates over the "port_connections" of an edge, which map each source port either to a single
+    destination port or to a list of destination ports on the same destination.
+
+    Yields:
+        tuple: Every (source_port, destination_port) pair.
+    """
+    for source_port, destination_ports in port_connections.items():
+        if isinstance(destination_ports, list):
+            for destination_port in destination_ports:
+                yield source_port, destination_port
+        else:
+            yield source_port, destination_ports
+
+
+def add_port_connection(port_connections, source_port, destination_port):
+    """
+    Adds a (source_port, destination_port) pair to the "port_connections" of an edge, in place.
+    A source port already connected to another destination port then maps to a list of both.
+    """
+    if source_port not in port_connections:
+        port_connections[source_port] = destination_port
+        return
+    destination_ports = port_connections[source_port]
+    if not isinstance(destination_ports, list):
+        destination_ports = [destination_ports]
+    if destination_port not in destination_ports:
+        destination_ports.append(destination_port)
+    port_connections[source_port] = (
+        destination_ports if len(destination_ports) > 1 else destination_ports[0]
+    )
+
+
+def copy_port_connections(port_connections):
+    """
+    Copies the "port_connections" of an edge, including its lists of destination ports.
+    """
+    return {
+        source_port: (
+            list(destination_ports)
+            if isinstance(destination_ports, list)
+            else destination_ports
+        )
+        for source_port, destination_ports in port_connections.items()
+    }
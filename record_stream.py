@@ -0,0 +1,152 @@
+"""
+Streaming serialization of graphs and libraries as sequences of small records
+"""
+
+import gzip
+import json
+import os
+import pickle
+import networkx as nx
+
+# Records written per pickle in the binary format
+BINARY_BATCH_SIZE = 4096
+# Compression level of gzip streams, favouring throughput over size
+COMPRESS_LEVEL = 1
+
+
+def write_records(file_path, records):
+    """
+    Writes records one by one, so the whole dump is never held in memory. The format follows the
+    file name:
+        - ".jsonl": JSON Lines, one JSON object per line.
+        - ".jsonl.gz": gzip-compressed JSON Lines.
+        - ".bin": a gzip-compressed sequence of pickled batches of BINARY_BATCH_SIZE records,
+          faster to write and read than JSON and keeping tuples and non-string keys. Being
+          pickles, binary dumps must only be read when they were written by this project.
+
+    The file is written to a temporary file first and then renamed, so a failed dump does not
+    leave a truncated file behind.
+
+    Args:
+        file_path (str): The path of the file.
+        records (iterable): JSON-serializable dictionaries.
+
+    Returns:
+        int: The number of records written.
+
+    Raises:
+        ValueError: If the file name has none of the suffixes above.
+    """
+    temporary_path = file_path + ".tmp"
+    count = 0
+    try:
+        with _open_stream(file_path, temporary_path, "w") as outfile:
+            if file_path.endswith(".bin"):
+                batch = []
+                for record in records:
+                    batch.append(record)
+                    if len(batch) == BINARY_BATCH_SIZE:
+                        pickle.dump(batch, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    pickle.dump(batch, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+                    count += len(batch)
+            else:
+                encoder = json.JSONEncoder(separators=(",", ":"))
+                for record in records:
+                    outfile.write(encoder.encode(record))
+                    outfile.write("\n")
+                    count += 1
+        os.replace(temporary_path, file_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return count
+
+
+def read_records(file_path):
+    """
+    Reads the records written by write_records one by one.
+
+    Args:
+        file_path (str): The path of the file, whose suffix gives its format.
+
+    Yields:
+        dict: Every record, in the order they were written.
+
+    Raises:
+        ValueError: If the file name has no known suffix.
+    """
+    with _open_stream(file_path, file_path, "r") as infile:
+        if file_path.endswith(".bin"):
+            while True:
+                try:
+                    batch = pickle.load(infile)
+                except EOFError:
+                    return
+                yield from batch
+        else:
+            decoder = json.JSONDecoder()
+            for line in infile:
+                if line.strip():
+                    yield decoder.decode(line)
+
+
+def _open_stream(file_path, open_path, mode):
+    if file_path.endswith(".bin"):
+        return gzip.open(open_path, mode + "b", compresslevel=COMPRESS_LEVEL)
+    if file_path.endswith(".jsonl.gz"):
+        return gzip.open(open_path, mode + "t", compresslevel=COMPRESS_LEVEL)
+    if file_path.endswith(".jsonl"):
+        return open(open_path, mode)
+    raise ValueError(
+        "Unknown record file format for "
+        + file_path
+        + ", expected a .jsonl, .jsonl.gz or .bin file"
+    )
+
+
+def graph_records(graph, **keys):
+    """
+    Converts a graph into records: one "graph" record holding the graph attributes, then one
+    "node" record per node and one "edge" record per edge.
+
+    Args:
+        graph (networkx.DiGraph): The graph.
+        **keys: Additional keys added to every record, such as the module the graph belongs to.
+
+    Yields:
+        dict: The records of the graph.
+    """
+    yield {"record": "graph", **keys, "attributes": graph.graph}
+    for node, data in graph.nodes(data=True):
+        yield {"record": "node", **keys, "id": node, "attributes": data}
+    for source, destination, data in graph.edges(data=True):
+        yield {
+            "record": "edge",
+            **keys,
+            "source": source,
+            "destination": destination,
+            "attributes": data,
+        }
+
+
+def add_graph_record(graph, record):
+    """
+    Adds a "graph", "node" or "edge" record written by graph_records to a graph, without the
+    validation of HDLGraph.add_hardware_node and HDLGraph.add_edge.
+
+    Raises:
+        ValueError: If the record is of another kind.
+    """
+    if record["record"] == "node":
+        nx.DiGraph.add_node(graph, record["id"], **record["attributes"])
+    elif record["record"] == "edge":
+        nx.DiGraph.add_edge(
+            graph, record["source"], record["destination"], **record["attributes"]
+        )
+    elif record["record"] == "graph":
+        graph.graph.update(record["attributes"])
+    else:
+        raise ValueError("Unexpected " + str(record["record"]) + " record")
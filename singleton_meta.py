@@ -1,11 +1,24 @@
+import threading
+
+
 class SingletonMeta(type):
     """
     This is a singleton metaclass.
     """
 
     _instances = {}
+    _lock = threading.RLock()
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
+            with SingletonMeta._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
+
+    def new_instance(cls, *args, **kwargs):
+        """
+        Creates an instance of the class other than the singleton, such as the libraries of a
+        library_context.LibraryContext.
+        """
+        return super().__call__(*args, **kwargs)
@@ -0,0 +1,158 @@
+"""
+The Jinja2 environments rendering the templates of /jinja_templates, shared by every generator of
+the process
+
+Run this file to precompile the templates ahead of time:
+
+    python3 template_environment.py
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import jinja2
+from jinja2 import Environment, FileSystemLoader, ModuleLoader
+from config import config
+
+TEMPLATE_FOLDER = "jinja_templates"
+# The options of every environment: "verilog" renders the .sv files, "label" the instance and
+# connection labels of the HTML visualizations
+ENVIRONMENT_OPTIONS = {
+    "verilog": {"trim_blocks": True, "lstrip_blocks": True},
+    "label": {},
+}
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def get_environment(environment_name):
+    """
+    Returns the shared environment of the given name, creating it on first use. Its templates are
+    compiled once per process, or imported from the precompiled templates when they are up to
+    date (see precompile_templates), and are not reloaded when the template files change; call
+    clear_environments to pick up edited templates.
+
+    Args:
+        environment_name (str): One of ENVIRONMENT_OPTIONS.
+
+    Returns:
+        jinja2.Environment: The environment, with the is_integer filter registered.
+
+    Raises:
+        ValueError: If the environment name is unknown.
+    """
+    environment = _environments.get(environment_name)
+    if environment is None:
+        with _environments_lock:
+            environment = _environments.get(environment_name)
+            if environment is None:
+                environment = _create_environment(environment_name)
+                _environments[environment_name] = environment
+    return environment
+
+
+def clear_environments():
+    """
+    Drops the shared environments, so the next get_environment call creates them again from the
+    current template files.
+    """
+    with _environments_lock:
+        _environments.clear()
+
+
+def precompile_templates():
+    """
+    Compiles the templates of every environment to Python modules under the cache folder, so
+    later processes import them instead of parsing the templates. The compiled templates are
+    stored under a hash of the template sources, the environment options and the Jinja2 version,
+    and are only used while that hash matches.
+
+    Returns:
+        dict: Maps every environment name to the folder holding its compiled templates.
+    """
+    compiled_folders = {}
+    for environment_name in ENVIRONMENT_OPTIONS:
+        compiled_folder = _compiled_folder(environment_name)
+        if not os.path.isdir(compiled_folder):
+            temporary_folder = compiled_folder + ".tmp"
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+            _new_environment(
+                environment_name, FileSystemLoader(config["path"])
+            ).compile_templates(
+                temporary_folder,
+                zip=None,
+                filter_func=lambda name: name.startswith(TEMPLATE_FOLDER + "/"),
+                ignore_errors=False,
+            )
+            os.replace(temporary_folder, compiled_folder)
+        compiled_folders[environment_name] = compiled_folder
+    return compiled_folders
+
+
+def _create_environment(environment_name):
+    """
+    Creates an environment importing the precompiled templates if they are up to date, and
+    compiling the template files otherwise.
+    """
+    if environment_name not in ENVIRONMENT_OPTIONS:
+        raise ValueError(
+            "Unknown template environment "
+            + str(environment_name)
+            + ", expected one of "
+            + ", ".join(ENVIRONMENT_OPTIONS)
+        )
+    compiled_folder = _compiled_folder(environment_name)
+    if os.path.isdir(compiled_folder):
+        loader = ModuleLoader(compiled_folder)
+    else:
+        loader = FileSystemLoader(config["path"])
+    return _new_environment(environment_name, loader)
+
+
+def _new_environment(environment_name, loader):
+    environment = Environment(
+        loader=loader, auto_reload=False, **ENVIRONMENT_OPTIONS[environment_name]
+    )
+    # Checks if a value is an integer
+    environment.filters["is_integer"] = lambda value: isinstance(value, int)
+    return environment
+
+
+def _compiled_folder(environment_name):
+    """
+    Returns the folder for the compiled templates of an environment, named after a hash of
+    everything the compiled code depends on.
+    """
+    digest = hashlib.sha256()
+    digest.update(templates_digest().encode())
+    digest.update(repr(sorted(ENVIRONMENT_OPTIONS[environment_name].items())).encode())
+    return os.path.join(
+        config["cache_path"],
+        "jinja_templates",
+        environment_name + "-" + digest.hexdigest()[:16],
+    )
+
+
+def templates_digest():
+    """
+    Hashes the template files and the Jinja2 version, which together with the environment options
+    determine what the templates render.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(jinja2.__version__.encode())
+    template_folder = os.path.join(config["path"], TEMPLATE_FOLDER)
+    for file_name in sorted(os.listdir(template_folder)):
+        digest.update(file_name.encode())
+        with open(os.path.join(template_folder, file_name), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    for environment_name, compiled_folder in precompile_templates().items():
+        print(environment_name + ": " + compiled_folder)
@@ -36,12 +36,21 @@ that make the module work, all the way down to the leaf nodes, which are called
 /hardware_modules/non_basic_blocks/top_module.py contains the code that shows how to define
 a hardware module, its input/output ports, as well as its subgraphs.
 """
-with open(
-    config["path"] + "/hardware_modules/non_basic_blocks/top_module.py",
-    "r",
-) as file:
-    code = file.read()
-    exec(code)
+hardware_library = HardwareLibrary()
+if not hardware_library.load_snapshot():
+    with open(
+        config["path"] + "/hardware_modules/non_basic_blocks/top_module.py",
+        "r",
+    ) as file:
+        code = file.read()
+        exec(code)
+    hardware_library.save_snapshot()
+
+"""
+The library built above is saved to a snapshot in /generated_files/cache. Later runs load it
+instead of running the module files again, as long as none of the files in /hardware_modules
+changed since.
+"""
 
 """
 Once the above file is ran, two global libraries are populated. The HardwareLibrary
@@ -74,3 +83,12 @@ html folder or top_module.sv within the verilog folder.
 top = HDLGraph.return_expanded_graph(top_module_name="top_module")
 file_output_loader.display_verilog("top_module_expanded", hdl_graph=top)
 file_output_loader.generate_verilog("top_module", hdl_graph=top)
+
+"""
+Modules can also be expanded partially. HDLGraph.expanded_view returns a lazy view that
+is only expanded once it is used, down to a maximum depth, along chosen instances, or for
+chosen modules. The view below opens a single level of the hierarchy and can be found in
+top_module_depth_1 within the html folder.
+"""
+top_depth_1 = HDLGraph.expanded_view(top_module_name="top_module", max_depth=1)
+file_output_loader.display_verilog("top_module_depth_1", hdl_graph=top_depth_1)
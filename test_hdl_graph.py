@@ -0,0 +1,738 @@
+"""
+Unit tests of HDLGraph and the hardware library, run with "make unit-test".
+"""
+
+import json
+import os
+
+import networkx as nx
+import pytest
+
+# file_output_loader has to be imported before hdl_graph to resolve their circular import
+import file_output_loader
+from config import config
+from compact_netlist import CompactNetlist
+from connection_library import ConnectionLibrary
+from hardware_library import HardwareLibrary
+from library_context import LibraryContext
+from hdl_graph import HDLGraph, IncrementalExpansion
+from netlist import port_connection_pairs
+from module_definitions import load_module_definitions
+from verilog_parser import parse_verilog_modules
+
+hardware_library = HardwareLibrary()
+
+
+def define_test_cell(module_name):
+    """
+    Defines a module made of an adder feeding a multiplier.
+    """
+    if hardware_library.verify_module_exists(module_name):
+        return
+    g = HDLGraph()
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+    g.add_hardware_node(module_name="multiplier", instance_name="multiplier_instance")
+    g.add_edge("adder_instance", "multiplier_instance", port_connections={"d": "ac"})
+    hardware_library.add_module(
+        module_name=module_name,
+        input_ports={"x": 8},
+        output_ports={"y": 8},
+        input_connections={"x": [("adder_instance", "a")]},
+        output_connections={"y": ("multiplier_instance", "product")},
+        internal_graph=g,
+    )
+
+
+def define_nested_design(prefix, cell_module_name):
+    """
+    Defines a three level design on top of cell_module_name, a module with an input port x and an
+    output port y: prefix + "_pair" chains two cells and also outputs the first one, and
+    prefix + "_top" drives a pair from an adder and feeds both of its outputs further.
+    """
+    pair_module_name = prefix + "_pair"
+    if not hardware_library.verify_module_exists(pair_module_name):
+        g = HDLGraph()
+        g.add_hardware_node(module_name=cell_module_name, instance_name="first")
+        g.add_hardware_node(module_name=cell_module_name, instance_name="second")
+        g.add_edge("first", "second", port_connections={"y": "x"})
+        hardware_library.add_module(
+            module_name=pair_module_name,
+            input_ports={"x": 8},
+            output_ports={"y": 8, "z": 8},
+            input_connections={"x": [("first", "x")]},
+            output_connections={"y": ("second", "y"), "z": ("first", "y")},
+            internal_graph=g,
+        )
+    top_module_name = prefix + "_top"
+    if not hardware_library.verify_module_exists(top_module_name):
+        g = HDLGraph()
+        g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+        g.add_hardware_node(module_name=pair_module_name, instance_name="pair")
+        g.add_hardware_node(module_name=cell_module_name, instance_name="cell")
+        g.add_hardware_node(
+            module_name="multiplier", instance_name="multiplier_instance"
+        )
+        g.add_edge("adder_instance", "pair", port_connections={"d": "x"})
+        g.add_edge("pair", "cell", port_connections={"y": "x"})
+        g.add_edge("pair", "multiplier_instance", port_connections={"z": "a"})
+        hardware_library.add_module(
+            module_name=top_module_name,
+            input_ports={"x": 8},
+            output_ports={"y": 8, "z": 8},
+            input_connections={
+                "x": [("adder_instance", "a"), ("multiplier_instance", "b")]
+            },
+            output_connections={
+                "y": ("cell", "y"),
+                "z": ("multiplier_instance", "product"),
+            },
+            internal_graph=g,
+        )
+    return top_module_name
+
+
+def graph_connections(graph):
+    """
+    Lists every (source, source_port, destination, destination_port) connection of a graph.
+    """
+    return sorted(
+        (source, source_port, destination, destination_port)
+        for source, destination, port_connections in graph.edges(
+            data="port_connections"
+        )
+        for source_port, destination_port in port_connection_pairs(port_connections)
+    )
+
+
+def netlist_connections(netlist, instance_names):
+    """
+    Lists the connections of a Netlist as graph_connections does, from both its sink index and
+    its driver index, which must agree.
+    """
+    from_sinks = sorted(
+        (driver[0], driver[1], sink_instance, sink_port)
+        for driver, sinks in netlist.nets()
+        for sink_instance, sink_port in sinks
+    )
+    from_drivers = sorted(
+        (source, source_port, instance_name, port_name)
+        for instance_name in instance_names
+        for port_name, (source, source_port) in netlist.input_ports(
+            instance_name
+        ).items()
+    )
+    assert from_sinks == from_drivers
+    return from_sinks
+
+
+def reference_expansion(module_name):
+    """
+    Expands a module recursively, one level at a time, as return_expanded_graph did before it
+    flattened hierarchies in a single pass.
+
+    Returns:
+        tuple: The module of every expanded instance, and the sorted list of connections, see
+            graph_connections.
+    """
+    io_block_names = ("INPUT_BLOCK", "OUTPUT_BLOCK")
+    graph = hardware_library.get_module_nx_graph(module_name)
+    instances = {}
+    connections = set()
+    # The inner (instance, port) driving each output port of an expanded instance, and the inner
+    # (instance, port) sinks of each of its input ports
+    drivers = {}
+    sinks = {}
+    for node, node_module_name in graph.nodes(data="module_name"):
+        if node in io_block_names or hardware_library[node_module_name]["basic_block"]:
+            instances[node] = node_module_name
+            continue
+        inner_instances, inner_connections = reference_expansion(node_module_name)
+        prefix = node + "__"
+        for inner_node, inner_module_name in inner_instances.items():
+            if inner_node not in io_block_names:
+                instances[prefix + inner_node] = inner_module_name
+        for source, source_port, destination, destination_port in inner_connections:
+            if source == "INPUT_BLOCK":
+                sinks.setdefault((node, source_port), []).append(
+                    (prefix + destination, destination_port)
+                )
+            elif destination == "OUTPUT_BLOCK":
+                drivers[(node, destination_port)] = (prefix + source, source_port)
+            else:
+                connections.add(
+                    (
+                        prefix + source,
+                        source_port,
+                        prefix + destination,
+                        destination_port,
+                    )
+                )
+    for source, destination, port_connections in graph.edges(data="port_connections"):
+        for source_port, destination_port in port_connection_pairs(port_connections):
+            driver = (
+                drivers.get((source, source_port))
+                if source not in instances
+                else (source, source_port)
+            )
+            destination_sinks = (
+                sinks.get((destination, destination_port), [])
+                if destination not in instances
+                else [(destination, destination_port)]
+            )
+            if driver is not None:
+                connections.update(driver + sink for sink in destination_sinks)
+    return instances, sorted(connections)
+
+
+def test_library_graph_rejects_changes():
+    define_test_cell("test_frozen_cell")
+    graph = hardware_library.get_module_nx_graph("test_frozen_cell")
+    nodes = list(graph.nodes)
+    edges = list(graph.edges(data="port_connections"))
+
+    mutators = [
+        lambda: graph.add_hardware_node("extra_adder", "adder"),
+        lambda: graph.add_hardware_nodes_from([("extra_adder", "adder")]),
+        lambda: graph.add_connections_from(
+            [("adder_instance", "multiplier_instance", {"d": "cb"})]
+        ),
+        lambda: graph.add_edge(
+            "adder_instance", "multiplier_instance", port_connections={"d": "cb"}
+        ),
+        lambda: HDLGraph.add_edge(
+            graph, "adder_instance", "multiplier_instance", {"d": "cb"}
+        ),
+        lambda: graph.add_input_output({}, {}, {}, {}),
+        lambda: graph.add_edges_from([("adder_instance", "multiplier_instance")]),
+        lambda: graph.remove_edge("adder_instance", "multiplier_instance"),
+        lambda: graph.remove_edges_from([("adder_instance", "multiplier_instance")]),
+        lambda: graph.remove_node("adder_instance"),
+        lambda: HDLGraph.remove_node(graph, "adder_instance"),
+        lambda: graph.remove_nodes_from(["adder_instance"]),
+        lambda: graph.clear(),
+        lambda: graph.clear_edges(),
+    ]
+    for mutator in mutators:
+        with pytest.raises(nx.NetworkXError):
+            mutator()
+
+    assert list(graph.nodes) == nodes
+    assert list(graph.edges(data="port_connections")) == edges
+
+
+def test_mutable_library_graph_accepts_changes():
+    define_test_cell("test_frozen_cell")
+    graph = hardware_library.get_module_nx_graph("test_frozen_cell", mutable=True)
+
+    graph.add_hardware_node("extra_adder", "adder")
+    graph.add_edge("extra_adder", "multiplier_instance", port_connections={"d": "cb"})
+
+    assert graph.has_edge("extra_adder", "multiplier_instance")
+    assert nx.is_frozen(hardware_library.get_module_nx_graph("test_frozen_cell"))
+    assert not hardware_library.get_module_nx_graph("test_frozen_cell").has_node(
+        "extra_adder"
+    )
+
+
+def test_set_port_connections_updates_netlist():
+    g = HDLGraph()
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+    g.add_hardware_node(module_name="multiplier", instance_name="multiplier_instance")
+    g.add_edge("adder_instance", "multiplier_instance", port_connections={"d": "ac"})
+    assert g.netlist.is_driven("multiplier_instance", "ac")
+
+    g.set_port_connections(
+        "adder_instance", "multiplier_instance", port_connections={"d": "cb"}
+    )
+
+    assert g["adder_instance"]["multiplier_instance"]["port_connections"] == {"d": "cb"}
+    assert not g.netlist.is_driven("multiplier_instance", "ac")
+    assert g.netlist.driver("multiplier_instance", "cb") == ("adder_instance", "d")
+    assert g.netlist.sinks("adder_instance", "d") == [("multiplier_instance", "cb")]
+    # The port freed by set_port_connections can be driven again
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance_1")
+    g.add_edge("adder_instance_1", "multiplier_instance", port_connections={"d": "ac"})
+
+
+def test_set_port_connections_keeps_edge_if_invalid():
+    g = HDLGraph()
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+    g.add_hardware_node(module_name="multiplier", instance_name="multiplier_instance")
+    g.add_edge("adder_instance", "multiplier_instance", port_connections={"d": "ac"})
+
+    with pytest.raises(ValueError):
+        g.set_port_connections(
+            "adder_instance", "multiplier_instance", port_connections={"d": "missing"}
+        )
+
+    assert g["adder_instance"]["multiplier_instance"]["port_connections"] == {"d": "ac"}
+    assert g.netlist.driver("multiplier_instance", "ac") == ("adder_instance", "d")
+
+
+def test_add_edge_requires_equal_port_types():
+    connection_library = ConnectionLibrary()
+    for type_name in ("test_pair_a", "test_pair_b"):
+        if not connection_library.check_port_exists(type_name):
+            connection_library.add_connection(type_name, {"first": 8, "second": 8})
+    for module_name, input_ports, output_ports in (
+        ("test_pair_source", {}, {"pair": "test_pair_a"}),
+        ("test_pair_sink", {"pair": "test_pair_b"}, {}),
+    ):
+        if not hardware_library.verify_module_exists(module_name):
+            hardware_library.add_module(
+                module_name=module_name,
+                input_ports=input_ports,
+                output_ports=output_ports,
+            )
+    g = HDLGraph()
+    g.add_hardware_node(module_name="test_pair_source", instance_name="source")
+    g.add_hardware_node(module_name="test_pair_sink", instance_name="sink")
+
+    with pytest.raises(ValueError, match="matching port types"):
+        g.add_edge("source", "sink", port_connections={"pair": "pair"})
+    with pytest.raises(ValueError, match="matching port types"):
+        g.add_connections_from([("source", "sink", {"pair": "pair"})])
+    assert not hardware_library.verify_port_type(
+        "test_pair_source", "test_pair_sink", "pair", "pair"
+    )
+
+
+def test_basic_block_cache_reused_until_content_changes(tmp_path, monkeypatch):
+    folder_path = tmp_path / "basic_blocks"
+    folder_path.mkdir()
+    file_path = folder_path / "test_cached_block.sv"
+    file_path.write_text(
+        "module test_cached_block (input logic [7:0] a, output logic b);\nendmodule\n"
+    )
+    cache_file = str(tmp_path / "basic_blocks.json")
+    parsed_sources = []
+
+    def counting_parse(source):
+        parsed_sources.append(source)
+        return parse_verilog_modules(source)
+
+    monkeypatch.setattr("hardware_library.parse_verilog_modules", counting_parse)
+
+    def load_basic_blocks():
+        library = hardware_library.clone()
+        library._parse_basic_verilog_files(str(folder_path), cache_file)
+        return library
+
+    assert load_basic_blocks()["test_cached_block"]["input_ports"] == {"a": 8}
+    assert len(parsed_sources) == 1
+
+    # A warm start reads the ports from the cache
+    assert load_basic_blocks()["test_cached_block"]["input_ports"] == {"a": 8}
+    assert len(parsed_sources) == 1
+
+    # A file touched without changing its content is hashed but not parsed again
+    file_stat = os.stat(file_path)
+    os.utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10**9))
+    assert load_basic_blocks()["test_cached_block"]["input_ports"] == {"a": 8}
+    assert len(parsed_sources) == 1
+
+    file_path.write_text(
+        "module test_cached_block (input logic [15:0] a, output logic b);\nendmodule\n"
+    )
+    assert load_basic_blocks()["test_cached_block"]["input_ports"] == {"a": 16}
+    assert len(parsed_sources) == 2
+
+
+def write_definition(folder_path, module_name, instances, edges=(), **connections):
+    """
+    Writes a module definition file with an input port x and an output port y.
+    """
+    with open(os.path.join(folder_path, module_name + ".module.json"), "w") as file:
+        json.dump(
+            {
+                "module_name": module_name,
+                "input_ports": {"x": 8},
+                "output_ports": {"y": 8},
+                "instances": instances,
+                "edges": list(edges),
+                **connections,
+            },
+            file,
+        )
+
+
+def test_module_definitions_match_script_form(tmp_path):
+    define_test_cell("test_script_cell")
+    # Defined before the module it instantiates, so it is added in a later batch
+    write_definition(
+        tmp_path,
+        "a_test_declared_pair",
+        {"first": "test_declared_cell", "second": "test_declared_cell"},
+        [{"source": "first", "destination": "second", "port_connections": {"y": "x"}}],
+        input_connections={"x": [["first", "x"]]},
+        output_connections={"y": ["second", "y"]},
+    )
+    write_definition(
+        tmp_path,
+        "test_declared_cell",
+        {"adder_instance": "adder", "multiplier_instance": "multiplier"},
+        [
+            {
+                "source": "adder_instance",
+                "destination": "multiplier_instance",
+                "port_connections": {"d": "ac"},
+            }
+        ],
+        input_connections={"x": [["adder_instance", "a"]]},
+        output_connections={"y": ["multiplier_instance", "product"]},
+    )
+
+    assert load_module_definitions(str(tmp_path)) == [
+        "test_declared_cell",
+        "a_test_declared_pair",
+    ]
+
+    script_graph = hardware_library.get_module_nx_graph("test_script_cell")
+    declared_graph = hardware_library.get_module_nx_graph("test_declared_cell")
+    assert list(declared_graph.nodes(data=True)) == list(script_graph.nodes(data=True))
+    assert list(declared_graph.edges(data=True)) == list(script_graph.edges(data=True))
+    for key in ("input_ports", "output_ports", "basic_block"):
+        assert (
+            hardware_library["test_declared_cell"][key]
+            == hardware_library["test_script_cell"][key]
+        )
+    assert hardware_library.get_submodules("a_test_declared_pair") == {
+        "test_declared_cell": 2
+    }
+
+
+def test_module_definitions_report_cycles(tmp_path):
+    write_definition(tmp_path, "test_cycle_first", {"inner": "test_cycle_second"})
+    write_definition(tmp_path, "test_cycle_second", {"inner": "test_cycle_first"})
+
+    with pytest.raises(ValueError, match="cycle: test_cycle_first, test_cycle_second"):
+        load_module_definitions(str(tmp_path))
+    assert not hardware_library.verify_module_exists("test_cycle_first")
+
+
+def test_expansion_matches_recursive_expansion():
+    define_test_cell("test_script_cell")
+    top_module_name = define_nested_design("test_nested", "test_script_cell")
+    instances, connections = reference_expansion(top_module_name)
+
+    flat_graph = HDLGraph.return_expanded_graph(top_module_name)
+
+    assert graph_connections(flat_graph) == connections
+    assert dict(flat_graph.nodes(data="module_name")) == instances
+    assert "pair__second__multiplier_instance" in instances
+    # Expanding again from the cached templates gives the same graph
+    assert graph_connections(HDLGraph.return_expanded_graph(top_module_name)) == (
+        connections
+    )
+
+
+def test_expansion_reports_unmatched_boundary_ports():
+    if not hardware_library.verify_module_exists("test_partial_cell"):
+        g = HDLGraph()
+        g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+        hardware_library.add_module(
+            module_name="test_partial_cell",
+            input_ports={"x": 8, "unused": 8},
+            output_ports={"y": 8},
+            input_connections={"x": [("adder_instance", "a")]},
+            output_connections={"y": ("adder_instance", "d")},
+            internal_graph=g,
+        )
+    if not hardware_library.verify_module_exists("test_partial_top"):
+        g = HDLGraph()
+        g.add_hardware_node(module_name="multiplier", instance_name="source")
+        g.add_hardware_node(module_name="test_partial_cell", instance_name="partial")
+        g.add_edge("source", "partial", port_connections={"run": "x", "test": "unused"})
+        hardware_library.add_module(
+            module_name="test_partial_top",
+            input_ports={},
+            output_ports={"y": 8},
+            output_connections={"y": ("partial", "y")},
+            internal_graph=g,
+        )
+    instances, connections = reference_expansion("test_partial_top")
+
+    flat_graph = HDLGraph.return_expanded_graph(
+        "test_partial_top", unmatched_ports="report"
+    )
+
+    assert graph_connections(flat_graph) == connections
+    assert ("source", "run", "partial__adder_instance", "a") in connections
+    assert flat_graph.graph["unmatched_ports"] == [("partial", "unused")]
+    with pytest.raises(ValueError, match="partial"):
+        HDLGraph.return_expanded_graph("test_partial_top", unmatched_ports="raise")
+
+
+def redefine_test_chain(module_name, multiplier_count):
+    """
+    Defines, or replaces, a module with an input port x and an output port y made of an adder
+    feeding multiplier_count chained multipliers.
+    """
+    if hardware_library.verify_module_exists(module_name):
+        hardware_library.delete_module(module_name)
+    g = HDLGraph()
+    g.add_hardware_node(module_name="adder", instance_name="adder_instance")
+    previous_instance, previous_port = "adder_instance", "d"
+    for index in range(multiplier_count):
+        instance_name = "multiplier_instance_" + str(index)
+        g.add_hardware_node(module_name="multiplier", instance_name=instance_name)
+        g.add_edge(
+            previous_instance, instance_name, port_connections={previous_port: "ac"}
+        )
+        previous_instance, previous_port = instance_name, "product"
+    hardware_library.add_module(
+        module_name=module_name,
+        input_ports={"x": 8},
+        output_ports={"y": 8},
+        input_connections={"x": [("adder_instance", "a")]},
+        output_connections={"y": (previous_instance, previous_port)},
+        internal_graph=g,
+    )
+
+
+def test_incremental_expansion_matches_full_expansion():
+    redefine_test_chain("test_incremental_cell", 1)
+    top_module_name = define_nested_design("test_incremental", "test_incremental_cell")
+    incremental_expansion = IncrementalExpansion(top_module_name)
+    flat_graph = incremental_expansion.graph
+
+    for multiplier_count in (3, 2, 0):
+        redefine_test_chain("test_incremental_cell", multiplier_count)
+
+        assert incremental_expansion.refresh() is flat_graph
+        expected_graph = HDLGraph.return_expanded_graph(top_module_name)
+        assert graph_connections(flat_graph) == graph_connections(expected_graph)
+        assert dict(flat_graph.nodes(data="module_name")) == dict(
+            expected_graph.nodes(data="module_name")
+        )
+        assert graph_connections(flat_graph) == (
+            reference_expansion(top_module_name)[1]
+        )
+        assert netlist_connections(flat_graph.netlist, flat_graph) == (
+            graph_connections(flat_graph)
+        )
+
+
+def test_netlist_indexes_follow_removals():
+    g = HDLGraph()
+    g.add_hardware_nodes_from(
+        [
+            ("adder_instance", "adder"),
+            ("multiplier_instance", "multiplier"),
+            ("multiplier_instance_1", "multiplier"),
+            ("multiplier_instance_2", "multiplier"),
+        ]
+    )
+    g.add_edge("adder_instance", "multiplier_instance", port_connections={"d": "ac"})
+    g.add_edge(
+        "adder_instance", "multiplier_instance_1", port_connections={"d": ["ac", "b"]}
+    )
+    g.add_edge(
+        "multiplier_instance",
+        "multiplier_instance_1",
+        port_connections={"product": "a"},
+    )
+    g.add_edge(
+        "multiplier_instance_1", "multiplier_instance_2", port_connections={"run": "a"}
+    )
+    assert g.netlist.sinks("adder_instance", "d") == [
+        ("multiplier_instance", "ac"),
+        ("multiplier_instance_1", "ac"),
+        ("multiplier_instance_1", "b"),
+    ]
+
+    g.remove_edge("adder_instance", "multiplier_instance")
+    assert g.netlist.driver("multiplier_instance", "ac") is None
+    assert g.netlist.sinks("adder_instance", "d") == [
+        ("multiplier_instance_1", "ac"),
+        ("multiplier_instance_1", "b"),
+    ]
+    assert netlist_connections(g.netlist, g) == graph_connections(g)
+
+    g.remove_node("multiplier_instance_1")
+    assert g.netlist.sinks("adder_instance", "d") == []
+    assert g.netlist.sinks("multiplier_instance", "product") == []
+    assert g.netlist.driver("multiplier_instance_2", "a") is None
+    assert netlist_connections(g.netlist, g) == graph_connections(g) == []
+
+    # The ports freed by the removals can be driven again
+    g.add_edge("adder_instance", "multiplier_instance", port_connections={"d": "ac"})
+    g.add_edge(
+        "multiplier_instance",
+        "multiplier_instance_2",
+        port_connections={"product": "a"},
+    )
+    assert netlist_connections(g.netlist, g) == graph_connections(g)
+
+    g.remove_edges_from([("adder_instance", "multiplier_instance")])
+    g.remove_nodes_from(["multiplier_instance_2"])
+    assert netlist_connections(g.netlist, g) == graph_connections(g) == []
+
+
+def test_compact_netlist_round_trip():
+    define_test_cell("test_script_cell")
+    top_module_name = define_nested_design("test_nested", "test_script_cell")
+    flat_graph = HDLGraph.return_expanded_graph(top_module_name)
+    connections = graph_connections(flat_graph)
+    instances = dict(flat_graph.nodes(data="module_name"))
+
+    compact_netlist = CompactNetlist.from_graph(flat_graph)
+    assert compact_netlist.number_of_instances() == len(instances)
+    assert dict(compact_netlist.instances_with_modules()) == instances
+    round_trip_graph = compact_netlist.to_hdl_graph()
+    assert graph_connections(round_trip_graph) == connections
+    assert dict(round_trip_graph.nodes(data="module_name")) == instances
+
+    compact_expansion = HDLGraph.return_expanded_graph(top_module_name, compact=True)
+    assert dict(compact_expansion.instances_with_modules()) == instances
+    compact_connections = sorted(
+        (source, source_port, destination, destination_port)
+        for source in instances
+        for source_port, sinks in compact_expansion.output_ports(source).items()
+        for destination, destination_port in sinks
+    )
+    assert compact_connections == connections
+    for destination in instances:
+        for destination_port, (source, source_port) in compact_expansion.input_ports(
+            destination
+        ).items():
+            assert (source, source_port, destination, destination_port) in connections
+
+
+def test_snapshot_rejected_after_dependency_edit(tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "path", str(tmp_path))
+    module_folder = tmp_path / "hardware_modules"
+    module_folder.mkdir()
+    source_file = module_folder / "test_module.py"
+    source_file.write_text("width = 8\n")
+    snapshot_file = str(tmp_path / "hardware_library.snapshot")
+    library = hardware_library.clone()
+    library.save_snapshot(snapshot_file)
+
+    restored_library = hardware_library.clone()
+    assert restored_library.load_snapshot(snapshot_file)
+    assert set(restored_library.hardware_library) == set(library.hardware_library)
+
+    # Touching a source changes its modification time but not its content
+    source_stat = os.stat(source_file)
+    os.utime(source_file, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns + 10**9))
+    assert hardware_library.clone().load_snapshot(snapshot_file)
+
+    # An edit of the same size is caught by the content hash
+    source_file.write_text("width = 9\n")
+    assert not hardware_library.clone().load_snapshot(snapshot_file)
+
+    source_file.write_text("width = 8\n")
+    assert hardware_library.clone().load_snapshot(snapshot_file)
+    (module_folder / "connection_library.json").write_text("{}")
+    assert not hardware_library.clone().load_snapshot(snapshot_file)
+
+
+def output_modification_times(folder_path):
+    """
+    Returns:
+        dict: Maps the path of every file under folder_path to its modification time in ns.
+    """
+    return {
+        os.path.join(root, file_name): os.stat(
+            os.path.join(root, file_name)
+        ).st_mtime_ns
+        for root, dirs, files in os.walk(folder_path)
+        for file_name in files
+    }
+
+
+def define_build_leaf(library, adder_count, carry_output=False):
+    """
+    Defines test_build_leaf in library as a chain of adder_count adders from x to y, which also
+    outputs the c of the last adder as carry if carry_output is True.
+    """
+    g = HDLGraph()
+    for index in range(adder_count):
+        g.add_hardware_node(module_name="adder", instance_name="adder_" + str(index))
+        if index:
+            g.add_edge(
+                "adder_" + str(index - 1),
+                "adder_" + str(index),
+                port_connections={"d": "a"},
+            )
+    last_adder = "adder_" + str(adder_count - 1)
+    output_ports = {"y": 8}
+    output_connections = {"y": (last_adder, "d")}
+    if carry_output:
+        output_ports["carry"] = 8
+        output_connections["carry"] = (last_adder, "c")
+    library.add_module(
+        module_name="test_build_leaf",
+        input_ports={"x": 8},
+        output_ports=output_ports,
+        input_connections={"x": [("adder_0", "a")]},
+        output_connections=output_connections,
+        internal_graph=g,
+    )
+
+
+def test_incremental_build_regenerates_only_dependents(tmp_path, monkeypatch):
+    context = LibraryContext.create()
+    library = context.hardware_library
+    # The backends write relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(
+        config, "cache_path", str(tmp_path / "generated_files" / "cache")
+    )
+    with context.activate():
+        define_build_leaf(library, 1)
+        g = HDLGraph()
+        g.add_hardware_node(module_name="test_build_leaf", instance_name="leaf")
+        library.add_module(
+            module_name="test_build_parent",
+            input_ports={"x": 8},
+            output_ports={"y": 8},
+            input_connections={"x": [("leaf", "x")]},
+            output_connections={"y": ("leaf", "y")},
+            internal_graph=g,
+        )
+        g = HDLGraph()
+        g.add_hardware_node(
+            module_name="multiplier", instance_name="multiplier_instance"
+        )
+        library.add_module(
+            module_name="test_build_other",
+            input_ports={"x": 8},
+            output_ports={"y": 8},
+            input_connections={"x": [("multiplier_instance", "a")]},
+            output_connections={"y": ("multiplier_instance", "product")},
+            internal_graph=g,
+        )
+
+        generated = file_output_loader.display_hardware_library(rebuild=True)
+        assert set(generated) == {
+            "test_build_leaf",
+            "test_build_parent",
+            "test_build_other",
+        }
+        assert os.path.isfile("generated_files/verilog/test_build_other.sv")
+        modification_times = output_modification_times("generated_files")
+
+        assert file_output_loader.display_hardware_library() == {}
+        assert output_modification_times("generated_files") == modification_times
+
+        # The parent only reads the ports of the leaf, so an inner change regenerates the leaf alone
+        library.delete_module("test_build_leaf")
+        define_build_leaf(library, 2)
+        assert set(file_output_loader.display_hardware_library()) == {"test_build_leaf"}
+
+        library.delete_module("test_build_leaf")
+        define_build_leaf(library, 2, carry_output=True)
+        generated = file_output_loader.display_hardware_library()
+        assert set(generated) == {"test_build_leaf", "test_build_parent"}
+        changed_files = {
+            file_path
+            for file_path, mtime_ns in output_modification_times(
+                "generated_files"
+            ).items()
+            if modification_times.get(file_path) != mtime_ns
+        }
+        assert not any("test_build_other" in file_path for file_path in changed_files)
+        assert "generated_files/verilog/test_build_leaf.sv" in changed_files
+        assert "generated_files/verilog/test_build_parent.sv" in changed_files
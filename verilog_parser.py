@@ -0,0 +1,247 @@
+"""
+Extracts the ports of the modules declared in SystemVerilog source, for basic block ingestion
+"""
+
+import hashlib
+import re
+
+# Every token the port parser cares about. Anything else (whitespace, operators) is skipped, so
+# a single finditer over the source yields the tokens of every module in one linear pass.
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+    |(?P<string>"(?:\\.|[^"\\])*")
+    |(?P<directive>`\w+)
+    |(?P<range>\[[^\]]*\])
+    |(?P<word>[A-Za-z_][\w$]*|\\\S+)
+    |(?P<number>\d[\w']*|'\w+)
+    |(?P<punctuation>[();,#])
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+_NUMERIC_RANGE_PATTERN = re.compile(r"\[\s*(\d+)\s*:\s*(\d+)\s*\]")
+
+_DIRECTIONS = {"input", "output", "inout"}
+_NET_KEYWORDS = {
+    "wire",
+    "logic",
+    "reg",
+    "var",
+    "bit",
+    "tri",
+    "wand",
+    "wor",
+    "supply0",
+    "supply1",
+    "uwire",
+    "signed",
+    "unsigned",
+}
+
+
+def parse_verilog_modules(source):
+    """
+    Finds the input and output ports of every module declared in SystemVerilog source, in a single
+    scan of the source. Both ANSI headers (directions declared in the port list) and non-ANSI
+    headers (directions declared in the module body) are supported. Inout ports are ignored.
+
+    The type of a port is the width of its packed range ([7:0] is 8), the name of its custom type
+    if it has one and no packed range, or 1 otherwise.
+
+    Args:
+        source (str): The SystemVerilog source.
+
+    Returns:
+        list: The (module_name, input_ports, output_ports) of every module in declaration order,
+            the ports being dictionaries mapping each port name to its type in declaration order.
+
+    Raises:
+        ValueError: If a module declaration is truncated, or if a packed range is not made of
+            two integer bounds.
+    """
+    tokens = (
+        (match.lastgroup, match.group())
+        for match in _TOKEN_PATTERN.finditer(source)
+        if match.lastgroup not in ("comment", "string", "directive")
+    )
+    modules = []
+    for kind, text in tokens:
+        if kind == "word" and text in ("module", "macromodule"):
+            modules.append(_parse_module(tokens))
+    return modules
+
+
+def read_verilog_file(file_path):
+    """
+    Reads a SystemVerilog file and hashes its content, so callers can tell whether it needs to be
+    parsed again before calling parse_verilog_modules on it.
+
+    Args:
+        file_path (str): The path of the file.
+
+    Returns:
+        tuple: The SHA-256 hex digest of the file content and the decoded content.
+    """
+    with open(file_path, "rb") as file:
+        content = file.read()
+    return hashlib.sha256(content).hexdigest(), content.decode()
+
+
+def _parse_module(tokens):
+    """
+    Parses a module declaration from the token following the "module" keyword to "endmodule".
+    """
+    input_ports = {}
+    output_ports = {}
+    header_ports = []
+    declaration = None
+    statement = []
+
+    kind, text = _next_token(tokens, "module")
+    module_name = text
+    kind, text = _next_token(tokens, module_name)
+    if text == "#":
+        _next_token(tokens, module_name)
+        _skip_parentheses(tokens, module_name)
+        kind, text = _next_token(tokens, module_name)
+
+    if text == "(":
+        item = []
+        depth = 1
+        while depth:
+            kind, text = _next_token(tokens, module_name)
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+            if (depth == 1 and text == ",") or depth == 0:
+                if item:
+                    declaration = _port_declaration(module_name, item, declaration)
+                    _add_port(declaration, input_ports, output_ports)
+                    header_ports.append(declaration["name"])
+                item = []
+            elif depth == 1:
+                item.append((kind, text))
+
+    # Non-ANSI headers only list the port names, their directions are declared in the body
+    undeclared_ports = {
+        port_name
+        for port_name in header_ports
+        if port_name not in input_ports and port_name not in output_ports
+    }
+    for kind, text in tokens:
+        if kind == "word" and text == "endmodule":
+            return module_name, input_ports, output_ports
+        if text != ";":
+            statement.append((kind, text))
+            continue
+        if statement and statement[0][1] in _DIRECTIONS and undeclared_ports:
+            declaration = None
+            item = []
+            for kind, text in statement + [("punctuation", ",")]:
+                if text != ",":
+                    item.append((kind, text))
+                    continue
+                port = _port_declaration(module_name, item, declaration)
+                if port["name"] in undeclared_ports:
+                    undeclared_ports.discard(port["name"])
+                    _add_port(port, input_ports, output_ports)
+                declaration = port
+                item = []
+        statement = []
+    raise ValueError("Module " + module_name + " is missing endmodule")
+
+
+def _port_declaration(module_name, item, previous):
+    """
+    Parses a single port declaration, such as "input logic [7:0] a" or "b".
+
+    A port declared without direction nor type continues the previous declaration of the list,
+    taking its direction and type.
+
+    Returns:
+        dict: The "name", "direction" (None for a bare port name) and "type" of the port.
+    """
+    direction = None
+    has_type = False
+    identifiers = []
+    ranges = []
+    for kind, text in item:
+        if kind == "word" and text in _DIRECTIONS:
+            direction = text
+        elif kind == "word" and text in _NET_KEYWORDS:
+            has_type = True
+        elif kind == "word":
+            identifiers.append(text)
+        elif kind == "range":
+            ranges.append((len(identifiers), text))
+    if not identifiers:
+        raise ValueError("Port without a name in module " + module_name)
+
+    port_name = identifiers[-1]
+    custom_type = identifiers[-2] if len(identifiers) > 1 else None
+    # A range before the port name is packed, after it is unpacked and ignored
+    packed_ranges = [
+        text for identifier_count, text in ranges if identifier_count < len(identifiers)
+    ]
+    packed_range = packed_ranges[-1] if packed_ranges else None
+
+    if (
+        direction is None
+        and not has_type
+        and custom_type is None
+        and packed_range is None
+    ):
+        if previous is None:
+            return {"name": port_name, "direction": None, "type": 1}
+        return {
+            "name": port_name,
+            "direction": previous["direction"],
+            "type": previous["type"],
+        }
+
+    if packed_range is not None:
+        range_match = _NUMERIC_RANGE_PATTERN.fullmatch(packed_range)
+        if not range_match:
+            raise ValueError(
+                "Cannot resolve the width "
+                + packed_range
+                + " of port "
+                + port_name
+                + " in module "
+                + module_name
+            )
+        port_type = abs(int(range_match.group(1)) - int(range_match.group(2))) + 1
+    elif custom_type is not None:
+        port_type = custom_type
+    else:
+        port_type = 1
+    if direction is None and previous is not None:
+        direction = previous["direction"]
+    return {"name": port_name, "direction": direction, "type": port_type}
+
+
+def _add_port(port, input_ports, output_ports):
+    if port["direction"] == "input":
+        input_ports[port["name"]] = port["type"]
+    elif port["direction"] == "output":
+        output_ports[port["name"]] = port["type"]
+
+
+def _next_token(tokens, context):
+    for token in tokens:
+        return token
+    raise ValueError("Unexpected end of file after " + context)
+
+
+def _skip_parentheses(tokens, module_name):
+    """
+    Skips tokens up to the parenthesis closing one that was just read.
+    """
+    depth = 1
+    while depth:
+        kind, text = _next_token(tokens, module_name)
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1